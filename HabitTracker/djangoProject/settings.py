@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,8 +42,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'habits.instrumentation.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'habits.routers.StickyPrimaryMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -54,9 +57,9 @@ ROOT_URLCONF = 'djangoProject.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # The Django backend, timing the renders for the Server-Timing header
+        'BACKEND': 'habits.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -64,6 +67,14 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compiled templates are kept in memory. The development server
+            # still picks up template changes by resetting the loader.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -77,10 +88,106 @@ WSGI_APPLICATION = 'djangoProject.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('HABITS_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
+# Production SQLite mode, used unless DEBUG is on or forced with
+# HABITS_SQLITE_PRODUCTION=1. WAL lets readers continue while one connection
+# writes, IMMEDIATE transactions take the write lock up front so waiting
+# writers queue on busy_timeout instead of failing, and connections are kept
+# open between requests so the pragmas and page cache are not rebuilt.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+if not DEBUG or os.environ.get('HABITS_SQLITE_PRODUCTION') == '1':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    })
+
+# Writes still locked out after busy_timeout are retried, see habits.sqlite
+HABITS_WRITE_RETRIES = 5
+HABITS_WRITE_RETRY_DELAY = 0.05
+
+# Analytics reads can go to a read replica, see habits.routers. Locally the
+# replica is a second SQLite file refreshed with manage.py sync_sqlite_replica.
+if os.environ.get('HABITS_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['HABITS_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['habits.routers.PrimaryReplicaRouter']
+HABITS_REPLICA_DATABASE = 'replica'
+# Seconds after a write during which the user's reads stay on the primary
+HABITS_REPLICA_STICKY_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Dashboard computations, see habits.cache. The local-memory backend evicts
+    # the least recently used entries once MAX_ENTRIES is reached.
+    'analytics': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'habits-analytics',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+    # Rendered habit cards and streak rows, keyed by Habit.fragment_version
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'habits-fragments',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+
+HABITS_ANALYTICS_CACHE = 'analytics'
+HABITS_ANALYTICS_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Completion history on the habit detail page
+HABITS_HISTORY_PAGE_SIZE = 20
+HABITS_HISTORY_MAX_PAGE_SIZE = 100
+
+# Request instrumentation, see habits.instrumentation
+HABITS_SERVER_TIMING = True
+HABITS_SLOW_REQUEST_MS = 500
+# Raise on requests over their view's query budget instead of logging them,
+# enabled in the tests by habits.instrumentation.QueryBudgetTestMixin
+HABITS_ENFORCE_QUERY_BUDGETS = False
+
+# Background recomputations, see habits.tasks: 'thread' runs them on an
+# in-process pool after the request commits, 'queue' leaves them to
+# manage.py drain_tasks and 'immediate' runs them inline.
+HABITS_TASKS_MODE = 'thread'
+HABITS_TASK_WORKERS = 2
+HABITS_TASK_MAX_ATTEMPTS = 5
+HABITS_TASK_CLAIM_TIMEOUT = 600
+
+# Delivers the digests of manage.py send_reminders, see habits.reminders
+HABITS_REMINDER_NOTIFIER = 'habits.reminders.ConsoleNotifier'
+HABITS_REMINDER_NOTIFIER_OPTIONS = {}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -1,32 +1,228 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.utils import get_fields_from_path
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
+from .forms import CompleteRangeForm
 from .models import Habit, HabitCompletion
 
+
+def estimate_row_count(model, using):
+    """
+    Estimate the number of rows of a model's table without counting them.
+
+    PostgreSQL and SQLite (after ``ANALYZE``) keep table statistics. Otherwise
+    the highest primary key is used, which is read from the index.
+
+    Args:
+        model: The model whose table to estimate.
+        using (str): The database alias.
+
+    Returns:
+        int: The estimated number of rows.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            if row and row[0] >= 0:
+                return row[0]
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone():
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+    return model._default_manager.using(using).aggregate(estimate=Max('pk'))['estimate'] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A paginator for the admin that avoids counting large tables.
+
+    Unfiltered changelists of tables with more than ``exact_count_limit`` rows
+    report the estimated row count. Filtered changelists count at most
+    ``exact_count_limit`` rows, so only the first pages of huge result sets
+    can be reached and narrower filters are needed to go further.
+    """
+
+    exact_count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate > self.exact_count_limit:
+                return estimate
+        return queryset.order_by()[:self.exact_count_limit].count()
+
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """
+    A list filter that selects a related object with the admin autocomplete widget.
+
+    Unlike the default related field filter it does not load every related
+    object into the sidebar. Subclasses set ``title`` and ``field_path``, the
+    lookup path of the relation. The admin of the related model needs
+    ``search_fields``.
+    """
+
+    template = 'admin/habits/autocomplete_filter.html'
+    field_path = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # The admin only allows lookups on parameters declared on the class
+        cls.parameter_name = f'{cls.field_path}__id'
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        field = get_fields_from_path(model, self.field_path)[-1]
+        self.field = forms.ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(field, model_admin.admin_site, attrs={'data-width': '100%'}),
+            required=False,
+        )
+
+    def has_output(self):
+        return True
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': 'All',
+        }
+
+    def widget(self):
+        """Render the autocomplete select of the filter."""
+        return self.field.widget.render(self.parameter_name, self.value())
+
+
+class UserFilter(AutocompleteFilter):
+    title = 'user'
+    field_path = 'user'
+
+
+class CompletionHabitFilter(AutocompleteFilter):
+    title = 'habit'
+    field_path = 'habit'
+
+
+class CompletionUserFilter(AutocompleteFilter):
+    title = 'user'
+    field_path = 'habit__user'
+
+
+class ScalableAdminMixin:
+    """
+    Changelist settings for tables with millions of rows.
+
+    Counts are estimated and the admin autocomplete assets are loaded for the
+    autocomplete filters.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        field = Habit._meta.get_field('user')
+        return super().media + AutocompleteSelect(field, self.admin_site).media
+
+
 @admin.register(Habit)
-class HabitAdmin(admin.ModelAdmin):
+class HabitAdmin(ScalableAdminMixin, admin.ModelAdmin):
     """
     Admin configuration for the Habit model.
     
     This class customizes the display and filtering of habits in the Django admin interface.
-    It allows for easy searching and filtering of habits by title, description, and creation date.
+    It allows for easy searching and filtering of habits by title, description, owner and creation date.
+
+    The "complete for a date range" action back-fills the selected habits in
+    every period of a range that has no completion yet, written in batches.
+    Deleting selected habits rebuilds the rollups once per owner.
     """
-    
-    
-    list_display = ('title', 'user', 'frequency', 'created_at')
-    list_filter = ('frequency', 'created_at')
+
+    list_display = ('title', 'user', 'frequency', 'current_streak', 'longest_streak', 'created_at')
+    list_select_related = ('user',)
+    list_filter = ('frequency', UserFilter, 'created_at')
     search_fields = ('title', 'description')
+    autocomplete_fields = ('user',)
+    readonly_fields = Habit.STREAK_FIELDS
     date_hierarchy = 'created_at'
+    actions = ['complete_for_date_range']
+
+    def delete_queryset(self, request, queryset):
+        queryset.delete_in_batch()
+
+    @admin.action(description='Complete selected habits for a date range')
+    def complete_for_date_range(self, request, queryset):
+        form = CompleteRangeForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            created = HabitCompletion.objects.complete_range(
+                queryset,
+                form.cleaned_data['start'],
+                form.cleaned_data['end'],
+                form.cleaned_data['time'],
+                form.cleaned_data['notes'],
+            )
+            self.message_user(request, f'Created {created} completions.', messages.SUCCESS)
+            return None
+
+        return TemplateResponse(request, 'admin/habits/habit/complete_range.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Complete habits for a date range',
+            'opts': self.model._meta,
+            'form': form,
+            'habits': queryset,
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+            'media': self.media + form.media,
+        })
 
 @admin.register(HabitCompletion)
-class HabitCompletionAdmin(admin.ModelAdmin):
+class HabitCompletionAdmin(ScalableAdminMixin, admin.ModelAdmin):
     """
     Admin configuration for the HabitCompletion model.
     
     This class customizes the display and filtering of habit completions in the Django admin interface.
-    It allows for easy searching and filtering of completions by habit and completion date.
+    It allows for easy searching and filtering of completions by habit, owner and completion date.
 
-    I must confess that I was to lazy to check the habits of for four weeks consistently. So i implemented this class to check them off manually for the given period.
+    The changelist is built for millions of rows: habits and owners are picked
+    with autocomplete filters, the drill-down and ordering use the indexed
+    ``day`` and counts are estimated. To back-fill completions use the action
+    of the habit admin instead of adding them one at a time. Deleting
+    selected completions rebuilds the derived data once per habit.
     """
-    list_display = ('habit', 'completed_at')
-    list_filter = ('completed_at', 'habit')
+    list_display = ('habit', 'user', 'completed_at', 'day')
+    list_select_related = ('habit', 'habit__user')
+    list_filter = (CompletionHabitFilter, CompletionUserFilter)
     search_fields = ('habit__title', 'notes')
-    date_hierarchy = 'completed_at'
+    autocomplete_fields = ('habit',)
+    readonly_fields = ('day', 'iso_week', 'month')
+    date_hierarchy = 'day'
+    ordering = ('-day', '-pk')
+
+    def delete_queryset(self, request, queryset):
+        queryset.delete_in_batch()
+
+    @admin.display(description='user', ordering='habit__user')
+    def user(self, completion):
+        return completion.habit.user
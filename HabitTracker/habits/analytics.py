@@ -0,0 +1,310 @@
+from datetime import date
+
+import numpy as np
+from django.db.models import Count
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+from django.utils import timezone
+
+from . import rollups
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def period_index(days, frequency):
+    """
+    Map day ordinals to sequential period numbers of a habit frequency.
+
+    Consecutive periods map to consecutive numbers, so a streak is a run of
+    numbers that increase by one.
+
+    Args:
+        days (ndarray): Day ordinals as returned by ``date.toordinal``.
+        frequency (str): The habit frequency ('daily', 'weekly' or 'monthly').
+
+    Returns:
+        ndarray: The period number of every day.
+    """
+    days = np.asarray(days, dtype=np.int64)
+    if frequency == 'weekly':
+        # Ordinal 1 (0001-01-01) is a Monday
+        return (days - 1) // 7
+    if frequency == 'monthly':
+        return (days - EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    return days
+
+
+def run_lengths(periods):
+    """
+    Return the lengths of the runs of consecutive periods.
+
+    Args:
+        periods (ndarray): Sorted, distinct period numbers.
+
+    Returns:
+        ndarray: The length of every run, in chronological order.
+    """
+    if periods.size == 0:
+        return periods
+    run_ids = np.concatenate(([0], np.cumsum(np.diff(periods) != 1)))
+    return np.bincount(run_ids)
+
+
+class CompletionArrays:
+    """
+    The completions of a group of habits held as NumPy arrays.
+
+    Streaks, completion rates, success rates and weekday/hour distributions are
+    computed with array operations instead of loops over ORM rows. Loading
+    takes a single query that returns only the habit id and local day of
+    every completion. No model instances are created. The hours of the day
+    are counted by the database when first needed.
+
+    Attributes:
+        habits (dict): The habits by id.
+        days (dict): Sorted day ordinals of the completions of each habit.
+    """
+
+    def __init__(self, habits):
+        from .models import HabitCompletion
+
+        self.habits = {habit.pk: habit for habit in habits}
+        self._hours = None
+        rows = (
+            HabitCompletion.objects
+            .filter(habit_id__in=list(self.habits))
+            .values_list('habit_id', 'day')
+            .order_by('habit_id', 'day')
+        )
+        habit_ids, days = [], []
+        for habit_id, day in rows.iterator(chunk_size=10000):
+            habit_ids.append(habit_id)
+            days.append(day.toordinal())
+        habit_ids = np.array(habit_ids, dtype=np.int64)
+        days = np.array(days, dtype=np.int64)
+
+        # Rows are ordered by habit, so each habit is a contiguous slice
+        self.days = {pk: days[:0] for pk in self.habits}
+        unique_ids, starts = np.unique(habit_ids, return_index=True)
+        ends = np.append(starts[1:], habit_ids.size)
+        for pk, start, end in zip(unique_ids.tolist(), starts, ends):
+            self.days[pk] = days[start:end]
+
+    def periods(self, pk):
+        """Return the distinct completed period numbers of a habit."""
+        return np.unique(period_index(self.days[pk], self.habits[pk].frequency))
+
+    def streaks(self, pk, today=None):
+        """
+        Calculate the current and longest streak of a habit.
+
+        Args:
+            pk (int): The id of the habit.
+            today (date): The reference day. Defaults to the current local date.
+
+        Returns:
+            tuple: The current streak and the longest streak.
+        """
+        if today is None:
+            today = timezone.localdate()
+        periods = self.periods(pk)
+        runs = run_lengths(periods)
+        if runs.size == 0:
+            return 0, 0
+        current_period = period_index([today.toordinal()], self.habits[pk].frequency)[0]
+        current = int(runs[-1]) if periods[-1] == current_period else 0
+        return current, int(runs.max())
+
+    def completion_rate(self, pk, today=None):
+        """
+        Calculate the share of periods since the habit was created that were completed.
+
+        Args:
+            pk (int): The id of the habit.
+            today (date): The reference day. Defaults to the current local date.
+
+        Returns:
+            float: The completion rate in percent.
+        """
+        if today is None:
+            today = timezone.localdate()
+        habit = self.habits[pk]
+        periods = self.periods(pk)
+        first, last = period_index(
+            [timezone.localdate(habit.created_at).toordinal(), today.toordinal()], habit.frequency
+        )
+        if periods.size:
+            first = min(first, periods[0])
+        completed = np.count_nonzero((periods >= first) & (periods <= last))
+        return round(completed / (last - first + 1) * 100, 1)
+
+    def success_rates(self, days, today=None):
+        """
+        Calculate the daily success rate of all habits over a time window.
+
+        A habit is successful on a day if it was completed in the period of its
+        frequency containing that day, as in
+        :func:`habits.rollups.success_rate_series`.
+
+        Args:
+            days (int): The number of days in the window, ending today.
+            today (date): The last day of the window. Defaults to the current local date.
+
+        Returns:
+            ndarray: The success rate in percent of every day of the window.
+        """
+        if today is None:
+            today = timezone.localdate()
+        window = np.arange(today.toordinal() - days + 1, today.toordinal() + 1)
+        if not self.habits:
+            return np.zeros(days)
+        successful = np.zeros(days)
+        for pk, habit in self.habits.items():
+            successful += np.isin(period_index(window, habit.frequency), self.periods(pk))
+        return np.round(successful / len(self.habits) * 100, 1)
+
+    def weekday_distribution(self, pk=None):
+        """
+        Count completions per weekday, Monday first.
+
+        Args:
+            pk (int): The id of a habit, or None for all habits.
+
+        Returns:
+            ndarray: Seven completion counts.
+        """
+        days = self.days[pk] if pk is not None else np.concatenate([np.zeros(0, np.int64), *self.days.values()])
+        return np.bincount((days - 1) % 7, minlength=7)
+
+    def hour_distribution(self, pk=None):
+        """
+        Count completions per local hour of the day.
+
+        The counts of all habits are aggregated by the database with one query
+        the first time they are needed.
+
+        Args:
+            pk (int): The id of a habit, or None for all habits.
+
+        Returns:
+            ndarray: Twenty-four completion counts.
+        """
+        from .models import HabitCompletion
+
+        if self._hours is None:
+            index = {habit_id: row for row, habit_id in enumerate(self.habits)}
+            self._hours = np.zeros((len(index), 24), dtype=np.int64)
+            counts = (
+                HabitCompletion.objects
+                .filter(habit_id__in=list(index))
+                .annotate(hour=ExtractHour('completed_at'))
+                .values_list('habit_id', 'hour')
+                .annotate(completions=Count('id'))
+                .order_by()
+            )
+            for habit_id, hour, completions in counts:
+                self._hours[index[habit_id], hour] = completions
+        if pk is None:
+            return self._hours.sum(axis=0)
+        return self._hours[list(self.habits).index(pk)]
+
+    def habit_statistics(self, today=None):
+        """
+        Calculate the statistics of every habit.
+
+        Args:
+            today (date): The reference day. Defaults to the current local date.
+
+        Returns:
+            dict: Maps each habit id to its ``current_streak``,
+                  ``longest_streak``, ``completion_rate`` and
+                  ``weekday_distribution``.
+        """
+        statistics = {}
+        for pk in self.habits:
+            current, longest = self.streaks(pk, today)
+            statistics[pk] = {
+                'current_streak': current,
+                'longest_streak': longest,
+                'completion_rate': self.completion_rate(pk, today),
+                'weekday_distribution': self.weekday_distribution(pk).tolist(),
+            }
+        return statistics
+
+
+def rolling_mean(values, window=7):
+    """
+    Calculate the trailing rolling mean of a series.
+
+    The first values average over the shorter history available.
+
+    Args:
+        values (ndarray): The series to smooth.
+        window (int): The number of values to average over.
+
+    Returns:
+        ndarray: The rolling mean, rounded to one decimal.
+    """
+    values = np.asarray(values, dtype=float)
+    sums = np.convolve(values, np.ones(window))[:values.size]
+    counts = np.minimum(np.arange(1, values.size + 1), window)
+    return np.round(sums / counts, 1)
+
+
+def completion_distributions(habit_ids):
+    """
+    Count the completions of habits per weekday and per local hour of the day.
+
+    Both are aggregated by the database with a single query grouped by
+    weekday and hour, so no completion rows are loaded.
+
+    Args:
+        habit_ids (iterable): The ids of the habits.
+
+    Returns:
+        tuple: Seven completion counts per weekday, Monday first, and
+               twenty-four completion counts per hour.
+    """
+    from .models import HabitCompletion
+
+    weekdays, hours = [0] * 7, [0] * 24
+    rows = (
+        HabitCompletion.objects
+        .filter(habit_id__in=list(habit_ids))
+        .annotate(weekday=ExtractIsoWeekDay('day'), hour=ExtractHour('completed_at'))
+        .values_list('weekday', 'hour')
+        .annotate(completions=Count('id'))
+        .order_by()
+    )
+    for weekday, hour, completions in rows:
+        weekdays[weekday - 1] += completions
+        hours[hour] += completions
+    return weekdays, hours
+
+
+def completion_patterns(user_id, habits, days=30, today=None):
+    """
+    Summarise when a user completes their habits.
+
+    The distributions are aggregated by the database and the success rates
+    are read from the daily rollup.
+
+    Args:
+        user_id (int): The id of the user.
+        habits (iterable): The habits to summarise.
+        days (int): The number of days for the rolling success rate.
+        today (date): The reference day. Defaults to the current local date.
+
+    Returns:
+        dict: Weekday and hour distributions over all habits and the 7-day
+              rolling success rate over the window with its ``dates``.
+    """
+    weekdays, hours = completion_distributions(habit.pk for habit in habits)
+    dates, success_rates = rollups.success_rate_series(user_id, days, today)
+    return {
+        'weekdays': WEEKDAYS,
+        'weekday_distribution': weekdays,
+        'hour_distribution': hours,
+        'dates': dates,
+        'rolling_success_rates': rolling_mean(success_rates).tolist(),
+    }
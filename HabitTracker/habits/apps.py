@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class HabitsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'habits'
+
+    def ready(self):
+        # Register the signal handlers that keep derived habit data in sync
+        from . import signals  # noqa: F401
@@ -0,0 +1,296 @@
+import platform
+import random
+import statistics
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import bump_data_version
+from .models import Habit, HabitCompletion
+from .periods import next_period, period_start
+from .sqlite import is_lock_error, write_stats, write_with_retries
+
+DEFAULT_FREQUENCY_MIX = {'daily': 0.6, 'weekly': 0.3, 'monthly': 0.1}
+
+
+def generate_dataset(users=1, habits=5, years=1, density=0.7, frequency_mix=None, seed=0, end=None):
+    """
+    Generate a deterministic synthetic dataset of users, habits and completions.
+
+    Each habit is created at the start of the covered range and completed in
+    each of its periods with probability ``density``, at a random time of a
+    random day of the period. The same arguments always give the same data.
+
+    Args:
+        users (int): The number of users to create.
+        habits (int): The number of habits per user.
+        years (int): The number of years of completions per habit.
+        density (float): The probability that a period is completed.
+        frequency_mix (dict): The relative weight of each frequency.
+        seed (int): The seed of the random generator.
+        end (date): The last day of the range. Defaults to today.
+
+    Returns:
+        list: The created users.
+    """
+    rng = random.Random(seed)
+    frequency_mix = frequency_mix or DEFAULT_FREQUENCY_MIX
+    frequencies = list(frequency_mix)
+    weights = [frequency_mix[frequency] for frequency in frequencies]
+    end = end or timezone.localdate()
+    start = end - timedelta(days=365 * years - 1)
+    created_at = timezone.make_aware(datetime.combine(start, datetime.min.time()))
+
+    created_users = []
+    rows = []
+    for user_number in range(users):
+        user = User.objects.create_user(username=f'bench-{seed}-{user_number}', password='bench')
+        created_users.append(user)
+        user_habits = Habit.objects.bulk_create([
+            Habit(
+                user=user,
+                title=f'Habit {habit_number}',
+                description='Synthetic benchmark habit',
+                frequency=rng.choices(frequencies, weights)[0],
+            )
+            for habit_number in range(habits)
+        ])
+        for habit in user_habits:
+            period = period_start(start, habit.frequency)
+            while period <= end:
+                following = next_period(period, habit.frequency)
+                if rng.random() < density:
+                    first, last = max(period, start), min(following - timedelta(days=1), end)
+                    day = first + timedelta(days=rng.randrange((last - first).days + 1))
+                    completed_at = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+                    rows.append((habit.pk, completed_at + timedelta(minutes=rng.randrange(6 * 60, 22 * 60)), ''))
+                period = following
+    Habit.objects.filter(user__in=created_users).update(created_at=created_at)
+
+    habit_ids, _ = HabitCompletion.objects.bulk_insert_rows(rows)
+    HabitCompletion.objects.refresh_derived_data(habit_ids)
+    return created_users
+
+
+def measure(func, repeat=5):
+    """
+    Measure the wall time, query count and peak memory of a callable.
+
+    The callable runs once untimed to warm up, then ``repeat`` times. Queries
+    and memory are measured in a separate run so tracing does not distort the
+    timings.
+
+    Args:
+        func (callable): The code to measure.
+        repeat (int): The number of timed runs.
+
+    Returns:
+        dict: The ``wall_time`` statistics in seconds, the number of
+              ``queries`` on all databases and the ``peak_memory`` in bytes.
+    """
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        # Reads may be routed to the replica, so every database is counted
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'wall_time': {
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'mean': statistics.fmean(timings),
+        },
+        'queries': sum(len(queries) for queries in captured),
+        'peak_memory': peak,
+    }
+
+
+def benchmarks(user):
+    """
+    Build the benchmarked operations for the habits of a user.
+
+    The model benchmarks run over all of the user's habits. The views are
+    requested through the test client, so middleware and templates count.
+    ``analysis_dashboard`` moves the user to a new data version before every
+    request, so none of their cached analytics are used (this adds one
+    ``UPDATE`` to its queries); ``analysis_dashboard_cached`` is served from
+    the cache.
+
+    Args:
+        user (User): The user whose habits are benchmarked.
+
+    Returns:
+        dict: Maps benchmark names to callables.
+    """
+    habits = list(Habit.objects.filter(user=user).order_by('pk'))
+    host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+    client = Client(HTTP_HOST=host)
+    client.force_login(user)
+
+    def get(url):
+        def request():
+            response = client.get(url)
+            assert response.status_code == 200, f'{url} returned {response.status_code}'
+        return request
+
+    def cold_dashboard():
+        bump_data_version(user.pk)
+        get(reverse('habits:analysis'))()
+
+    return {
+        'get_current_streak': lambda: [habit.get_current_streak() for habit in habits],
+        'get_longest_streak': lambda: [habit.get_longest_streak() for habit in habits],
+        'is_completed_in_current_period': lambda: [habit.is_completed_in_current_period() for habit in habits],
+        'habit_list': get(reverse('habits:habit_list')),
+        'habit_detail': get(reverse('habits:habit_detail', args=[habits[0].pk])),
+        'analysis_dashboard': cold_dashboard,
+        'analysis_dashboard_cached': get(reverse('habits:analysis')),
+    }
+
+
+def run_benchmarks(user, repeat=5, names=None):
+    """
+    Run the benchmarks for a user.
+
+    Args:
+        user (User): The user whose habits are benchmarked.
+        repeat (int): The number of timed runs per benchmark.
+        names (list): Only run the benchmarks with these names.
+
+    Returns:
+        dict: Maps benchmark names to their measurements.
+    """
+    return {
+        name: measure(func, repeat)
+        for name, func in benchmarks(user).items()
+        if not names or name in names
+    }
+
+
+def environment():
+    """Describe the environment the benchmarks ran in."""
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.machine(),
+        'timestamp': timezone.now().isoformat(),
+    }
+
+
+def compare(baseline, results, threshold=0.25, min_delta=0.005):
+    """
+    Compare benchmark results with a baseline.
+
+    A benchmark regresses when its median wall time grows by more than
+    ``threshold`` and ``min_delta`` seconds, or when it runs more queries than
+    in the baseline. Benchmarks missing from either side are ignored.
+
+    Args:
+        baseline (dict): The ``benchmarks`` of an earlier run.
+        results (dict): The ``benchmarks`` of the current run.
+        threshold (float): The tolerated relative increase of the wall time.
+        min_delta (float): The tolerated absolute increase of the wall time,
+                           so noise on very fast benchmarks is ignored.
+
+    Returns:
+        list: A description of each regression.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        old, new = before['wall_time']['median'], result['wall_time']['median']
+        if new > old * (1 + threshold) and new - old > min_delta:
+            regressions.append(f'{name}: median wall time {old * 1000:.1f}ms -> {new * 1000:.1f}ms')
+        if result['queries'] > before['queries']:
+            regressions.append(f"{name}: {before['queries']} -> {result['queries']} queries")
+    return regressions
+
+
+def write_contention(writers=8, completions=50, seed=0):
+    """
+    Record completions from many threads at once and measure the contention.
+
+    Every writer completes its own daily habit ``completions`` times through
+    the same retried write path as the views, each thread on its own database
+    connection. The data must be visible to other connections, so this can
+    not run inside a transaction; the synthetic user is deleted at the end.
+
+    Args:
+        writers (int): The number of concurrent writer threads.
+        completions (int): The number of completions recorded per writer.
+        seed (int): Distinguishes the synthetic user of concurrent runs.
+
+    Returns:
+        dict: The number of written completions, the wall time, the
+              throughput, the retried writes and the writes that failed with
+              a lock error.
+    """
+    user = User.objects.create_user(username=f'contention-{seed}')
+    habits = [Habit.objects.create(user=user, title=f'Writer {n}', frequency='daily') for n in range(writers)]
+    now = timezone.now()
+    lock_errors = []
+    barrier = threading.Barrier(writers)
+    stats = dict(write_stats)
+
+    def write(habit):
+        try:
+            barrier.wait()
+            for n in range(completions):
+                try:
+                    write_with_retries(HabitCompletion.objects.create, habit=habit, completed_at=now - timedelta(days=n))
+                except OperationalError as exc:
+                    if not is_lock_error(exc):
+                        raise
+                    lock_errors.append(exc)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=write, args=(habit,)) for habit in habits]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    written = HabitCompletion.objects.filter(habit__user=user).count()
+    user.delete()
+    journal_mode = None
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+    return {
+        'writers': writers,
+        'completions': written,
+        'seconds': elapsed,
+        'throughput': written / elapsed,
+        'retries': write_stats['retries'] - stats['retries'],
+        'lock_errors': len(lock_errors),
+        'journal_mode': journal_mode,
+    }
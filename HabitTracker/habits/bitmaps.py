@@ -0,0 +1,219 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import transaction
+
+BITMAP_BYTES = 46  # 366 days rounded up to whole bytes
+
+
+def day_bit(day):
+    """Return the bit of a day within the bitmap of its year."""
+    return day.timetuple().tm_yday - 1
+
+
+def to_bytes(bits):
+    """Encode a bitmap integer for storage."""
+    return bits.to_bytes(BITMAP_BYTES, 'little')
+
+
+def from_bytes(data):
+    """Decode a stored bitmap into an integer."""
+    return int.from_bytes(bytes(data), 'little')
+
+
+def set_day(habit_id, day):
+    """
+    Mark a day as completed in the bitmap of a habit.
+
+    Args:
+        habit_id (int): The id of the habit.
+        day (date): The local date of the completion.
+    """
+    from .models import HabitYearBitmap
+
+    with transaction.atomic():
+        bitmap, _ = HabitYearBitmap.objects.select_for_update().get_or_create(
+            habit_id=habit_id, year=day.year, defaults={'bits': to_bytes(0)}
+        )
+        bitmap.bits = to_bytes(from_bytes(bitmap.bits) | (1 << day_bit(day)))
+        bitmap.save(update_fields=['bits'])
+
+
+def clear_day(habit_id, day):
+    """
+    Mark a day as not completed in the bitmap of a habit.
+
+    Args:
+        habit_id (int): The id of the habit.
+        day (date): The local date that no longer has a completion.
+    """
+    from .models import HabitYearBitmap
+
+    with transaction.atomic():
+        bitmap = HabitYearBitmap.objects.select_for_update().filter(habit_id=habit_id, year=day.year).first()
+        if bitmap is not None:
+            bitmap.bits = to_bytes(from_bytes(bitmap.bits) & ~(1 << day_bit(day)))
+            bitmap.save(update_fields=['bits'])
+
+
+def rebuild_bitmaps(habit_ids):
+    """
+    Rebuild the bitmaps of the given habits from their completions.
+
+    Args:
+        habit_ids (iterable): The ids of the habits to rebuild.
+
+    Returns:
+        int: The number of bitmaps written.
+    """
+    from .models import HabitCompletion, HabitYearBitmap
+
+    habit_ids = list(habit_ids)
+    bitmaps = defaultdict(int)
+    days = (
+        HabitCompletion.objects
+        .filter(habit_id__in=habit_ids)
+        .values_list('habit_id', 'day')
+        .order_by()
+        .distinct()
+    )
+    for habit_id, day in days.iterator(chunk_size=10000):
+        bitmaps[habit_id, day.year] |= 1 << day_bit(day)
+
+    with transaction.atomic():
+        HabitYearBitmap.objects.filter(habit_id__in=habit_ids).delete()
+        HabitYearBitmap.objects.bulk_create(
+            [
+                HabitYearBitmap(habit_id=habit_id, year=year, bits=to_bytes(bits))
+                for (habit_id, year), bits in bitmaps.items()
+            ],
+            batch_size=500,
+        )
+    return len(bitmaps)
+
+
+def load_bitmaps(habit_ids, years):
+    """
+    Load the bitmaps of a group of habits for the given years.
+
+    Args:
+        habit_ids (iterable): The ids of the habits.
+        years (iterable): The years to load.
+
+    Returns:
+        dict: Maps ``(habit_id, year)`` to the bitmap integer. Missing
+              bitmaps are left out and mean no completions.
+    """
+    from .models import HabitYearBitmap
+
+    rows = HabitYearBitmap.objects.filter(habit_id__in=list(habit_ids), year__in=list(years))
+    return {
+        (habit_id, year): from_bytes(bits)
+        for habit_id, year, bits in rows.values_list('habit_id', 'year', 'bits')
+    }
+
+
+def is_completed_on(bitmaps, habit_id, day):
+    """
+    Check whether a habit was completed on a day.
+
+    Args:
+        bitmaps (dict): Bitmaps as returned by :func:`load_bitmaps`.
+        habit_id (int): The id of the habit.
+        day (date): The day to check.
+
+    Returns:
+        bool: True if the bit of the day is set.
+    """
+    return bool(bitmaps.get((habit_id, day.year), 0) >> day_bit(day) & 1)
+
+
+def daily_streak(bitmaps, habit_id, day):
+    """
+    Count the consecutive completed days ending on ``day``.
+
+    Whole runs of set bits are skipped with a single bit operation per year
+    instead of testing every day.
+
+    Args:
+        bitmaps (dict): Bitmaps as returned by :func:`load_bitmaps`. Earlier
+                        years are only followed if they are loaded.
+        habit_id (int): The id of the habit.
+        day (date): The last day of the streak.
+
+    Returns:
+        int: The length of the streak.
+    """
+    streak = 0
+    year, position = day.year, day_bit(day)
+    while True:
+        mask = (1 << (position + 1)) - 1
+        gaps = ~bitmaps.get((habit_id, year), 0) & mask
+        if gaps:
+            return streak + position - (gaps.bit_length() - 1)
+        streak += position + 1
+        year -= 1
+        if (habit_id, year) not in bitmaps:
+            return streak
+        position = day_bit(date(year, 12, 31))
+
+
+def day_counts(bitmaps, habit_ids, start, end):
+    """
+    Count how many of the given habits were completed on each day of a range.
+
+    Args:
+        bitmaps (dict): Bitmaps as returned by :func:`load_bitmaps`.
+        habit_ids (iterable): The ids of the habits to count.
+        start (date): The first day of the range.
+        end (date): The last day of the range.
+
+    Returns:
+        ndarray: One count per day from ``start`` to ``end``.
+    """
+    counts = []
+    for year in range(start.year, end.year + 1):
+        first = day_bit(max(start, date(year, 1, 1)))
+        last = day_bit(min(end, date(year, 12, 31)))
+        total = np.zeros(BITMAP_BYTES * 8, dtype=np.int64)
+        for habit_id in habit_ids:
+            bits = bitmaps.get((habit_id, year))
+            if bits:
+                total += np.unpackbits(np.frombuffer(to_bytes(bits), dtype=np.uint8), bitorder='little')
+        counts.append(total[first:last + 1])
+    return np.concatenate(counts)
+
+
+def heatmap(habit_ids, end, days=365):
+    """
+    Build a GitHub-style calendar heatmap of completions.
+
+    The grid starts on the Monday on or before the first day and is laid out
+    as weeks of seven days, Monday first.
+
+    Args:
+        habit_ids (list): The ids of the habits to include.
+        end (date): The last day of the heatmap.
+        days (int): The number of days to cover.
+
+    Returns:
+        list: One list per week with a dictionary per day holding the
+              ``date``, the ``count`` of completed habits and a ``level``
+              between 0 and 4. Days outside the range are None.
+    """
+    start = end - timedelta(days=days - 1)
+    counts = day_counts(load_bitmaps(habit_ids, range(start.year, end.year + 1)), habit_ids, start, end)
+    grid_start = start - timedelta(days=start.weekday())
+    weeks = []
+    for offset in range((end - grid_start).days + 1):
+        if offset % 7 == 0:
+            weeks.append([])
+        day = grid_start + timedelta(days=offset)
+        if day < start:
+            weeks[-1].append(None)
+            continue
+        count = int(counts[(day - start).days])
+        level = 0 if count == 0 else 1 + min(3, (count * 4 - 1) // max(len(habit_ids), 1))
+        weeks[-1].append({'date': day, 'count': count, 'level': level})
+    return weeks
@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from django.db.models import F
+from django.utils import timezone
+
+ENTRY_KEY = 'habits:analytics:{user_id}:{version}:{name}:{parts}'
+STATS_KEYS = {'hit': 'habits:analytics:hits', 'miss': 'habits:analytics:misses'}
+
+
+def get_cache():
+    """
+    Return the cache used for the analytics computations.
+
+    The alias is configured with ``HABITS_ANALYTICS_CACHE`` and falls back to the
+    default cache if the alias is not configured.
+    """
+    try:
+        return caches[getattr(settings, 'HABITS_ANALYTICS_CACHE', 'analytics')]
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def get_data_state(user_id):
+    """
+    Return the current data version of a user and when their data last changed.
+
+    The version is stored in the database (see
+    :class:`~habits.models.UserDataVersion`), so bumps made by any process are
+    seen by all of them.
+
+    Args:
+        user_id (int): The id of the user.
+
+    Returns:
+        tuple: The version, 0 if the data never changed, and the time of the
+               last change, ``None`` if the data never changed.
+    """
+    from .models import UserDataVersion
+
+    state = UserDataVersion.objects.filter(user_id=user_id).values_list('version', 'modified').first()
+    return state or (0, None)
+
+
+def get_data_version(user_id):
+    """
+    Return the current data version of a user.
+
+    Args:
+        user_id (int): The id of the user.
+
+    Returns:
+        int: The user's current data version.
+    """
+    return get_data_state(user_id)[0]
+
+
+def bump_data_version(user_id):
+    """
+    Invalidate all cached analytics of a user by moving to a new data version.
+
+    The version is incremented in the database, so concurrent bumps are never
+    lost.
+
+    Args:
+        user_id (int): The id of the user whose data changed.
+    """
+    from .models import UserDataVersion
+
+    versions = UserDataVersion.objects.filter(user_id=user_id)
+    if not versions.update(version=F('version') + 1, modified=timezone.now()):
+        # The first change of the user's data; a concurrent bump may create the row as well
+        UserDataVersion.objects.bulk_create([UserDataVersion(user_id=user_id)], ignore_conflicts=True)
+        versions.update(version=F('version') + 1, modified=timezone.now())
+
+
+def cached_analytics(user_id, name, compute, *parts, version=None):
+    """
+    Return a cached analytics result, computing and storing it on a miss.
+
+    Entries are keyed by the user, their data version, the name of the
+    computation and any further parts that affect the result.
+
+    Args:
+        user_id (int): The id of the user the result belongs to.
+        name (str): The name of the computation.
+        compute (callable): Called without arguments to compute the result.
+        *parts: Additional values the result depends on, e.g. the current date.
+        version (int): The user's data version, looked up if not given. Views
+                       computing several results pass it in to look it up once.
+
+    Returns:
+        tuple: The result and whether it was served from the cache.
+    """
+    cache = get_cache()
+    key = ENTRY_KEY.format(
+        user_id=user_id,
+        version=get_data_version(user_id) if version is None else version,
+        name=name,
+        parts=':'.join(str(part) for part in parts),
+    )
+    result = cache.get(key)
+    hit = result is not None
+    if not hit:
+        result = compute()
+        cache.set(key, result, timeout=getattr(settings, 'HABITS_ANALYTICS_CACHE_TIMEOUT', 24 * 60 * 60))
+    _count('hit' if hit else 'miss')
+    return result, hit
+
+
+def cache_stats():
+    """
+    Return the number of analytics cache hits and misses.
+
+    Returns:
+        dict: The ``hits`` and ``misses`` counted by the analytics cache.
+    """
+    cache = get_cache()
+    return {
+        'hits': cache.get(STATS_KEYS['hit'], 0),
+        'misses': cache.get(STATS_KEYS['miss'], 0),
+    }
+
+
+def _count(outcome):
+    cache = get_cache()
+    key = STATS_KEYS[outcome]
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
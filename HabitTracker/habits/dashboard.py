@@ -0,0 +1,138 @@
+import json
+
+from .analytics import completion_patterns
+from .bitmaps import heatmap
+from . import rollups
+
+SUCCESS_RATE_WINDOWS = (7, 30, 90, 365)
+DEFAULT_SUCCESS_RATE_WINDOW = 7
+
+# The panels of the dashboard in page order, with the sections each one shows
+DASHBOARD_PANELS = {
+    'success_rates': ('success_rates', 'patterns'),
+    'patterns': ('patterns',),
+    'heatmap': ('heatmap',),
+    'habits_by_periodicity': ('habits_by_periodicity',),
+    'longest_overall_span': ('longest_overall_span',),
+    'habit_timespans': ('habit_timespans',),
+}
+
+
+def habits_by_periodicity(habits):
+    """
+    Group habits by their frequency.
+
+    Args:
+        habits (iterable): The habits to group.
+
+    Returns:
+        dict: Maps each frequency label to the list of its habits, in the order
+              of ``Habit.FREQUENCY_CHOICES``. Frequencies without habits are
+              left out.
+    """
+    from .models import Habit
+
+    habits = list(habits)
+    groups = {}
+    for frequency, label in Habit.FREQUENCY_CHOICES:
+        members = [habit for habit in habits if habit.frequency == frequency]
+        if members:
+            groups[label] = members
+    return groups
+
+
+def longest_overall_span(habits):
+    """
+    Find the longest current streak across all habits, expressed in days.
+
+    Weekly streaks count 7 days per period and monthly streaks 30 days.
+
+    Args:
+        habits (iterable): The habits to consider.
+
+    Returns:
+        int: The longest current streak in days.
+    """
+    days_per_period = {'daily': 1, 'weekly': 7, 'monthly': 30}  # Approximate month as 30 days
+    return max(
+        (habit.active_streak * days_per_period[habit.frequency] for habit in habits),
+        default=0,
+    )
+
+
+def streak_table(habits):
+    """
+    Build the table of current streaks shown on the dashboard.
+
+    Args:
+        habits (iterable): The habits to include.
+
+    Returns:
+        list: One dictionary per habit, sorted by the current streak (longest
+              first).
+    """
+    habit_timespans = [
+        {
+            'habit': habit,
+            'timespan': habit.active_streak,
+            'first_completion': None,
+            'last_completion': None,
+        }
+        for habit in habits
+    ]
+    return sorted(habit_timespans, key=lambda x: x['timespan'], reverse=True)
+
+
+def dashboard_sections(user_id, habits, window, today):
+    """
+    Describe the independent computations of the analysis dashboard.
+
+    The success rates are read from the daily rollup of the user and the
+    completion patterns are aggregated by the database.
+
+    Args:
+        user_id (int): The id of the user.
+        habits (list): The habits of the user.
+        window (int): The number of days of the success rate chart.
+        today (date): The current local date.
+
+    Returns:
+        dict: Maps each section name to a tuple of the function computing it
+              and the extra parts of its cache key.
+    """
+    return {
+        'success_rates': (lambda: rollups.success_rate_series(user_id, window, today), window),
+        'habits_by_periodicity': (lambda: habits_by_periodicity(habits),),
+        'longest_overall_span': (lambda: longest_overall_span(habits),),
+        'habit_timespans': (lambda: streak_table(habits),),
+        'patterns': (lambda: completion_patterns(user_id, habits, window, today), window),
+        'heatmap': (lambda: heatmap([habit.pk for habit in habits], today),),
+    }
+
+
+def dashboard_context(results, window):
+    """
+    Build the template context for the computed dashboard sections.
+
+    Only the sections in ``results`` are added, so a single panel can be
+    rendered as soon as its sections are available.
+
+    Args:
+        results (dict): Maps section names to their computed values.
+        window (int): The number of days of the success rate chart.
+
+    Returns:
+        dict: The template context.
+    """
+    context = {'window': window, 'windows': SUCCESS_RATE_WINDOWS}
+    if 'success_rates' in results:
+        dates, success_rates = results['success_rates']
+        context['dates'] = json.dumps(dates)
+        context['success_rates'] = json.dumps(success_rates)
+    if 'patterns' in results:
+        for name in ('rolling_success_rates', 'weekdays', 'weekday_distribution', 'hour_distribution'):
+            context[name] = json.dumps(results['patterns'][name])
+    for name in ('habits_by_periodicity', 'longest_overall_span', 'habit_timespans', 'heatmap'):
+        if name in results:
+            context[name] = results[name]
+    return context
@@ -0,0 +1,93 @@
+import csv
+import json
+
+from .models import HabitCompletion
+from .periods import next_period
+
+EXPORT_FIELDS = [
+    'habit_id', 'habit', 'frequency', 'completed_at', 'notes',
+    'day', 'iso_week', 'month', 'period', 'streak', 'streak_start',
+]
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """A file-like object that returns what is written to it, for streaming CSV."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(completions, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield completion rows with their period keys and streak markers.
+
+    The rows are read with ``values_list`` and server-side iteration, so no
+    model instances are created and memory use does not grow with the number
+    of completions.
+
+    Besides the stored period keys, every row carries the ``period`` of the
+    habit's frequency, the length of the ``streak`` of consecutive periods up
+    to and including that period, and the ``streak_start`` period.
+
+    Args:
+        completions (QuerySet): The completions to export.
+        chunk_size (int): Number of rows fetched from the database at a time.
+
+    Yields:
+        dict: One row per completion, ordered by habit and completion time.
+    """
+    rows = (
+        completions
+        .order_by('habit_id', 'completed_at', 'id')
+        .values_list(
+            'habit_id', 'habit__title', 'habit__frequency', 'completed_at', 'notes',
+            'day', 'iso_week', 'month',
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    habit_id = previous = streak_start = None
+    streak = 0
+    for row in rows:
+        frequency = row[2]
+        period = row[5 + list(HabitCompletion.PERIOD_KEYS).index(frequency)]
+        if row[0] != habit_id:
+            habit_id, previous, streak = row[0], None, 0
+        if period != previous:
+            if previous is not None and period == next_period(previous, frequency):
+                streak += 1
+            else:
+                streak, streak_start = 1, period
+            previous = period
+        yield dict(zip(EXPORT_FIELDS, (*row, period, streak, streak_start)))
+
+
+def csv_stream(rows):
+    """
+    Encode export rows as CSV, one line at a time.
+
+    Args:
+        rows (iterable): Rows as produced by :func:`export_rows`.
+
+    Yields:
+        str: The header line followed by one line per row.
+    """
+    writer = csv.DictWriter(Echo(), fieldnames=EXPORT_FIELDS)
+    yield writer.writeheader()
+    for row in rows:
+        row['completed_at'] = row['completed_at'].isoformat()
+        yield writer.writerow(row)
+
+
+def ndjson_stream(rows):
+    """
+    Encode export rows as newline-delimited JSON.
+
+    Args:
+        rows (iterable): Rows as produced by :func:`export_rows`.
+
+    Yields:
+        str: One JSON document per row.
+    """
+    for row in rows:
+        yield json.dumps(row, default=lambda value: value.isoformat()) + '\n'
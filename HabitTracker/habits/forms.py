@@ -1,4 +1,7 @@
+import datetime
+
 from django import forms
+from django.contrib.admin.widgets import AdminDateWidget, AdminTimeWidget
 from .models import Habit, HabitCompletion
 
 class HabitForm(forms.ModelForm):
@@ -39,4 +42,34 @@ class HabitCompletionForm(forms.ModelForm):
         fields = ['notes']
         widgets = {
             'notes': forms.Textarea(attrs={'rows': 3}),
-        } 
\ No newline at end of file
+        }
+
+
+class CompleteRangeForm(forms.Form):
+    """
+    Form for completing habits in bulk over a date range from the admin.
+
+    Attributes:
+        start: DateField for the first day of the range
+        end: DateField for the last day of the range
+        time: TimeField for the time of day of the completions
+        notes: CharField for optional notes stored with every completion
+    """
+
+    MAX_DAYS = 10 * 366
+
+    start = forms.DateField(widget=AdminDateWidget)
+    end = forms.DateField(widget=AdminDateWidget)
+    time = forms.TimeField(initial=datetime.time(12), widget=AdminTimeWidget)
+    notes = forms.CharField(required=False)
+
+    def clean(self):
+        """Validate that the range is ordered and not too long."""
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end:
+            if start > end:
+                raise forms.ValidationError('The start of the range must not be after its end.')
+            if (end - start).days >= self.MAX_DAYS:
+                raise forms.ValidationError(f'The range may span at most {self.MAX_DAYS} days.')
+        return cleaned_data
@@ -0,0 +1,287 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.urls import resolve
+
+logger = logging.getLogger('habits.instrumentation')
+
+# Context variables follow a request into the threads of sync_to_async, so the
+# queries and renders of async views are attributed to the right request
+_current_metrics = ContextVar('habits_request_metrics', default=None)
+_template_depth = ContextVar('habits_template_depth', default=0)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a view runs more queries than its declared budget."""
+
+
+class RequestMetrics:
+    """
+    The queries and timings recorded for one request.
+
+    Attributes:
+        queries (list): ``(sql, duration)`` of every executed statement.
+        view_time (float): Seconds spent in the view, including rendering.
+        template_time (float): Seconds spent rendering templates.
+        total_time (float): Seconds spent in the whole middleware chain.
+        budget (int): The query budget of the view, if it declares one.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.view_time = 0.0
+        self.template_time = 0.0
+        self.total_time = 0.0
+        self.budget = None
+
+    @property
+    def query_count(self):
+        """The number of executed statements."""
+        return len(self.queries)
+
+    @property
+    def sql_time(self):
+        """The total time spent executing statements, in seconds."""
+        return sum(duration for _, duration in self.queries)
+
+    def record_query(self, sql, duration):
+        """Record an executed statement."""
+        self.queries.append((sql, duration))
+
+    def duplicates(self, limit=5):
+        """
+        Return the statements executed more than once, most frequent first.
+
+        Statements are compared with their placeholders, so the same query with
+        different parameters counts as a duplicate, which is how N+1 patterns
+        show up.
+
+        Args:
+            limit (int): The maximum number of statements to return.
+
+        Returns:
+            list: ``(sql, count)`` pairs.
+        """
+        counts = Counter(sql for sql, _ in self.queries)
+        return [(sql, count) for sql, count in counts.most_common(limit) if count > 1]
+
+    def server_timing(self):
+        """Format the metrics as the value of a ``Server-Timing`` header."""
+        return ', '.join([
+            f'sql;dur={self.sql_time * 1000:.1f};desc="{self.query_count} queries"',
+            f'view;dur={self.view_time * 1000:.1f}',
+            f'template;dur={self.template_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+
+class TimedTemplate(Template):
+    """A template of :class:`TimedDjangoTemplates` that adds its render time to the current request."""
+
+    def render(self, context=None, request=None):
+        metrics = _current_metrics.get()
+        if metrics is None:
+            return super().render(context, request)
+        # Only the outermost render is counted, templates may render others
+        token = _template_depth.set(_template_depth.get() + 1)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            _template_depth.reset(token)
+            if not _template_depth.get():
+                metrics.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, recording the render time of each request.
+
+    Configure it as the ``BACKEND`` in ``TEMPLATES`` for
+    :class:`QueryInstrumentationMiddleware` to report template times. Renders
+    outside a request are not recorded.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def _record_query(execute, sql, params, many, context):
+    """Time a statement for the current request, if any. Used as a database execute wrapper."""
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - start)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """Install the query recorder on a database connection once."""
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def query_budget(max_queries):
+    """
+    Declare the maximum number of queries a view may run.
+
+    Place it below ``login_required`` and similar decorators, which copy the
+    attribute to their wrapper. Requests over the budget are logged, and raise
+    :class:`QueryBudgetExceeded` when ``HABITS_ENFORCE_QUERY_BUDGETS`` is set.
+    The queries of the session and authentication middleware count as well.
+
+    Args:
+        max_queries (int): The budget of the view.
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Record the queries and timings of each request.
+
+    The metrics are sent in a ``Server-Timing`` header (unless
+    ``HABITS_SERVER_TIMING`` is False) and attached to the response as
+    ``response.request_metrics``. Requests slower than
+    ``HABITS_SLOW_REQUEST_MS`` are logged with their most duplicated SQL
+    statements. Put the middleware first so the queries of the other
+    middleware are included. Template times are only recorded with the
+    :class:`TimedDjangoTemplates` backend. It works in both sync and async mode, and the
+    queries async views run in worker threads are included. The body of
+    streaming responses is produced after the middleware returns and is not
+    measured.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def start(self, request):
+        # Connections opened before this module was imported lack the recorder
+        for connection in connections.all(initialized_only=True):
+            instrument_connection(None, connection)
+        request._started = time.perf_counter()
+        request._view_started = None
+        metrics = RequestMetrics()
+        return metrics, _current_metrics.set(metrics)
+
+    def finish(self, request, response, metrics):
+        now = time.perf_counter()
+        metrics.total_time = now - request._started
+        if request._view_started is not None:
+            metrics.view_time = now - request._view_started
+
+        response.request_metrics = metrics
+        if getattr(settings, 'HABITS_SERVER_TIMING', True):
+            response['Server-Timing'] = metrics.server_timing()
+        self.report(request, metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _current_metrics.get().budget = getattr(view_func, 'query_budget', None)
+        request._view_started = time.perf_counter()
+
+    def report(self, request, metrics):
+        if metrics.total_time * 1000 >= getattr(settings, 'HABITS_SLOW_REQUEST_MS', 500):
+            logger.warning(
+                'Slow request %s %s: %.0fms total, %d queries in %.0fms, %.0fms rendering%s',
+                request.method, request.path, metrics.total_time * 1000, metrics.query_count,
+                metrics.sql_time * 1000, metrics.template_time * 1000,
+                ''.join(f'\n  {count}x {sql}' for sql, count in metrics.duplicates()),
+            )
+        if metrics.budget is not None and metrics.query_count > metrics.budget:
+            message = (
+                f'{request.method} {request.path} ran {metrics.query_count} queries, '
+                f'over its budget of {metrics.budget}'
+                + ''.join(f'\n  {count}x {sql}' for sql, count in metrics.duplicates())
+            )
+            if getattr(settings, 'HABITS_ENFORCE_QUERY_BUDGETS', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+
+class QueryBudgetTestMixin:
+    """
+    Test case helpers for the query budgets of views.
+
+    ``HABITS_ENFORCE_QUERY_BUDGETS`` is enabled for the test case, so every
+    request over its view's budget fails. Requires
+    :class:`QueryInstrumentationMiddleware` in ``MIDDLEWARE``.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        from django.test import override_settings
+
+        super().setUpClass()
+        enforced = override_settings(HABITS_ENFORCE_QUERY_BUDGETS=True)
+        enforced.enable()
+        cls.addClassCleanup(enforced.disable)
+
+    def assertWithinQueryBudget(self, url, client=None, **kwargs):
+        """
+        Request a URL and fail if its view runs more queries than its budget.
+
+        Args:
+            url (str): The URL to request with GET.
+            client (Client): The client to use. Defaults to ``self.client``.
+            **kwargs: Passed on to ``client.get``.
+
+        Returns:
+            HttpResponse: The response.
+        """
+        budget = getattr(resolve(url.split('?')[0]).func, 'query_budget', None)
+        if budget is None:
+            self.fail(f'The view of {url} declares no query budget')
+        response = (client or self.client).get(url, **kwargs)
+        metrics = response.request_metrics
+        if metrics.query_count > budget:
+            self.fail(
+                f'{url} ran {metrics.query_count} queries, over its budget of {budget}:\n'
+                + '\n'.join(sql for sql, _ in metrics.queries)
+            )
+        return response
@@ -0,0 +1,107 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.utils.dateparse import parse_date
+
+from habits.benchmarks import compare, environment, generate_dataset, run_benchmarks
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the habit models and views on a synthetic dataset.
+
+    The dataset is generated deterministically from the options and the
+    benchmarks run against the habits of its first user. The writes are
+    committed in short transactions, so the database is never locked for the
+    whole run, and the synthetic users are deleted at the end. Only their own
+    cached analytics are invalidated. The results are written as JSON and can
+    be compared with the results of an earlier commit; regressions make the
+    command fail.
+    """
+
+    help = 'Benchmark the habit models and views on a synthetic dataset.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1, help='Number of synthetic users.')
+        parser.add_argument('--habits', type=int, default=10, help='Number of habits per user.')
+        parser.add_argument('--years', type=int, default=2, help='Years of completions per habit.')
+        parser.add_argument('--density', type=float, default=0.7, help='Probability that a period is completed.')
+        parser.add_argument('--mix', default='daily=0.6,weekly=0.3,monthly=0.1',
+                            help='Relative weights of the frequencies, e.g. daily=1,weekly=1.')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the dataset generator.')
+        parser.add_argument('--end', help='Last day of the dataset (YYYY-MM-DD). Defaults to today.')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs per benchmark.')
+        parser.add_argument('--only', action='append', help='Only run this benchmark. Can be repeated.')
+        parser.add_argument('--output', help='Write the JSON results to this file instead of stdout.')
+        parser.add_argument('--compare', help='JSON results of an earlier run to compare with.')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Tolerated relative increase of the median wall time.')
+        parser.add_argument('--min-delta', type=float, default=0.005,
+                            help='Tolerated absolute increase of the median wall time in seconds.')
+
+    def handle(self, *args, **options):
+        dataset = {
+            'users': options['users'],
+            'habits': options['habits'],
+            'years': options['years'],
+            'density': options['density'],
+            'frequency_mix': self.parse_mix(options['mix']),
+            'seed': options['seed'],
+            'end': parse_date(options['end']) if options['end'] else None,
+        }
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as stream:
+                baseline = json.load(stream)
+
+        # The synthetic users, also those of a dataset that was only partly generated
+        synthetic = User.objects.filter(
+            pk__gt=User.objects.aggregate(last=Max('pk'))['last'] or 0,
+            username__startswith=f"bench-{options['seed']}-",
+        )
+        start = time.monotonic()
+        try:
+            users = generate_dataset(**dataset)
+            self.stderr.write(f'Generated the dataset in {time.monotonic() - start:.1f}s')
+            results = run_benchmarks(users[0], repeat=options['repeat'], names=options['only'])
+        finally:
+            synthetic.delete()
+
+        dataset['end'] = dataset['end'] and dataset['end'].isoformat()
+        report = {'environment': environment(), 'dataset': dataset, 'benchmarks': results}
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as stream:
+                stream.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        for name, result in results.items():
+            self.stderr.write(
+                f"{name:32} {result['wall_time']['median'] * 1000:9.2f}ms "
+                f"{result['queries']:4} queries {result['peak_memory'] / 1024:9.0f} KiB"
+            )
+
+        if baseline is not None:
+            if baseline.get('dataset') != dataset:
+                self.stderr.write(self.style.WARNING('The baseline was measured on a different dataset.'))
+            regressions = compare(baseline['benchmarks'], results, options['threshold'], options['min_delta'])
+            if regressions:
+                raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+            self.stderr.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def parse_mix(self, value):
+        try:
+            mix = {
+                frequency.strip(): float(weight)
+                for frequency, weight in (part.split('=') for part in value.split(','))
+            }
+        except ValueError:
+            raise CommandError(f'Invalid frequency mix: {value}')
+        unknown = set(mix) - {'daily', 'weekly', 'monthly'}
+        if unknown:
+            raise CommandError(f"Unknown frequencies in the mix: {', '.join(sorted(unknown))}")
+        return mix
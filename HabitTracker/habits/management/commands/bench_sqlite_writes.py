@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from habits.benchmarks import write_contention
+
+
+class Command(BaseCommand):
+    """
+    Measure the throughput of concurrent completion writes.
+
+    Many threads record completions at the same time through the retried
+    write path of the views. The throughput, the retried writes and the writes
+    that still failed with "database is locked" are written as JSON. Run it
+    against a scratch database, e.g. with ``HABITS_SQLITE_PATH``, with and
+    without ``HABITS_SQLITE_PRODUCTION=1`` to compare the modes.
+    """
+
+    help = 'Measure concurrent completion writes and the lock errors they hit.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Number of concurrent writer threads.')
+        parser.add_argument('--completions', type=int, default=50, help='Completions recorded per writer.')
+        parser.add_argument('--seed', type=int, default=0, help='Distinguishes the synthetic user of concurrent runs.')
+        parser.add_argument('--fail-on-errors', action='store_true', help='Fail if any write hit a lock error.')
+
+    def handle(self, *args, **options):
+        if options['writers'] < 1 or options['completions'] < 1:
+            raise CommandError('--writers and --completions must be positive.')
+        result = write_contention(options['writers'], options['completions'], options['seed'])
+        self.stdout.write(json.dumps(result, indent=2))
+        if options['fail_on_errors'] and result['lock_errors']:
+            raise CommandError(f"{result['lock_errors']} writes failed with lock errors.")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from habits.tasks import TASKS, drain
+
+
+class Command(BaseCommand):
+    """
+    Run the background tasks left in the database queue.
+
+    Tasks are normally run by the in-process worker pool right after the
+    request that queued them. Tasks queued while ``HABITS_TASKS_MODE`` is
+    ``queue``, interrupted by a restart or failed are kept in the database
+    until this command runs them, e.g. from cron or after a deploy.
+    """
+
+    help = 'Run the queued background recomputations.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Run at most this many tasks.')
+        parser.add_argument('--task', action='append', dest='names', choices=sorted(TASKS), help='Only run tasks with this name (repeatable).')
+
+    def handle(self, *args, **options):
+        if options['limit'] is not None and options['limit'] < 1:
+            raise CommandError('The limit must be positive.')
+        succeeded, failed = drain(options['limit'], options['names'])
+        self.stdout.write(self.style.SUCCESS(f'Ran {succeeded} tasks.'))
+        if failed:
+            raise CommandError(f'{failed} tasks failed, they stay queued.')
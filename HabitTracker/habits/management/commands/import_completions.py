@@ -0,0 +1,117 @@
+import csv
+import json
+import sys
+import time
+from datetime import datetime
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from habits.models import Habit, HabitCompletion
+
+
+class Command(BaseCommand):
+    """
+    Import historical habit completions from a CSV, NDJSON or JSON file.
+
+    Every record needs a ``habit_id`` and a ``completed_at`` timestamp (ISO 8601)
+    and may have ``notes``. The input is streamed and validated against the
+    habit ids loaded once at the start. Rows are inserted in batches with
+    ``executemany`` in chunked transactions, skipping completions that already
+    exist. Streak counters and cached analytics are refreshed once at the end.
+    """
+
+    help = 'Import habit completions from a CSV, NDJSON or JSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="The file to import, or '-' to read from stdin.")
+        parser.add_argument('--format', choices=['csv', 'ndjson', 'json'],
+                            help='Input format. Guessed from the file extension by default.')
+        parser.add_argument('--user', type=int, help='Only accept completions of habits of the user with this id.')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Number of rows per executemany call.')
+        parser.add_argument('--chunk-size', type=int, default=50000, help='Number of rows per transaction.')
+
+    def handle(self, *args, **options):
+        input_format = options['format'] or self.guess_format(options['path'])
+        habits = Habit.objects.all()
+        if options['user'] is not None:
+            habits = habits.filter(user_id=options['user'])
+        habit_ids = set(habits.values_list('pk', flat=True))
+
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        start = time.monotonic()
+        read = invalid = inserted = 0
+        touched = set()
+        try:
+            completions = self.parse(self.records(stream, input_format), habit_ids)
+            while True:
+                chunk = list(islice(completions, options['chunk_size']))
+                if not chunk:
+                    break
+                valid = [row for row in chunk if row is not None]
+                read += len(chunk)
+                invalid += len(chunk) - len(valid)
+                touched_habit_ids, count = HabitCompletion.objects.bulk_insert_rows(valid, batch_size=options['batch_size'])
+                touched |= touched_habit_ids
+                inserted += count
+                elapsed = time.monotonic() - start
+                self.stdout.write(f'{read} rows read ({read / elapsed if elapsed else read:.0f} rows/s)')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        HabitCompletion.objects.refresh_derived_data(touched)
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {inserted} completions from {read} rows in {elapsed:.1f}s '
+            f'({read / elapsed if elapsed else read:.0f} rows/s); '
+            f'{read - invalid - inserted} duplicates skipped, {invalid} invalid rows.'
+        ))
+
+    def guess_format(self, path):
+        for extension in ('csv', 'ndjson', 'json'):
+            if path.endswith(f'.{extension}'):
+                return extension
+        if path.endswith('.jsonl'):
+            return 'ndjson'
+        raise CommandError('Cannot guess the input format, please pass --format.')
+
+    def records(self, stream, input_format):
+        """Yield the input records as dictionaries, and None for NDJSON lines that are not valid JSON."""
+        if input_format == 'csv':
+            yield from csv.DictReader(stream)
+        elif input_format == 'ndjson':
+            for line in stream:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        yield None
+        else:
+            # A JSON array has to be parsed as a whole, use NDJSON for large files
+            yield from json.load(stream)
+
+    def parse(self, records, habit_ids):
+        """Yield a ``(habit_id, completed_at, notes)`` row per valid record and None per invalid one."""
+        tz = timezone.get_current_timezone()
+        for record in records:
+            try:
+                habit_id = int(record['habit_id'])
+                completed_at = self.parse_timestamp(str(record['completed_at']))
+            except (KeyError, TypeError, ValueError):
+                yield None
+                continue
+            if habit_id not in habit_ids or completed_at is None:
+                yield None
+                continue
+            if completed_at.tzinfo is None:
+                completed_at = completed_at.replace(tzinfo=tz)
+            yield habit_id, completed_at, record.get('notes') or ''
+
+    def parse_timestamp(self, value):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return parse_datetime(value)
@@ -0,0 +1,48 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from habits.cache import bump_data_version
+from habits.rollups import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    """
+    Backfill or repair the daily rollups of users.
+
+    The rollups are normally maintained incrementally. This command recomputes
+    them from the completions for a range of days, or for all completed
+    periods when no range is given. The cached analytics of the rebuilt users
+    are invalidated afterwards.
+    """
+
+    help = 'Backfill or repair the daily success rollups of all users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only rebuild the rollups of the user with this id.')
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD).')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD).')
+
+    def handle(self, *args, **options):
+        start = self.parse(options['start'])
+        end = self.parse(options['end'])
+        if start and end and start > end:
+            raise CommandError('The start of the range is after its end.')
+
+        users = User.objects.order_by('pk')
+        if options['user'] is not None:
+            users = users.filter(pk=options['user'])
+        user_ids = list(users.values_list('pk', flat=True))
+        written = rebuild_daily_stats(user_ids, start, end)
+        for user_id in user_ids:
+            bump_data_version(user_id)
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} daily rollup rows.'))
+
+    def parse(self, value):
+        if value is None:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date: {value}')
+        return day
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from habits.bitmaps import rebuild_bitmaps
+from habits.cache import bump_data_version
+from habits.models import Habit
+from habits.streaks import rebuild_streak_stats
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the stored streak counters and bitmaps of habits from their completions.
+
+    Both are normally maintained incrementally. This command recomputes them
+    from scratch, e.g. after importing data or repairing completions. The
+    cached analytics of the owners of the rebuilt habits are invalidated.
+    """
+
+    help = 'Rebuild the stored streak counters and completion bitmaps of all habits.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only rebuild habits of the user with this id.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of habits rebuilt per batch.')
+
+    def handle(self, *args, **options):
+        habits = Habit.objects.order_by('pk')
+        if options['user'] is not None:
+            habits = habits.filter(user_id=options['user'])
+
+        batch_size = options['batch_size']
+        rebuilt = 0
+        last_pk = 0
+        user_ids = set()
+        while True:
+            batch = list(habits.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            rebuilt += rebuild_streak_stats(batch)
+            rebuild_bitmaps([habit.pk for habit in batch])
+            user_ids.update(habit.user_id for habit in batch)
+            last_pk = batch[-1].pk
+        for user_id in sorted(user_ids):
+            bump_data_version(user_id)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt streak counters and bitmaps for {rebuilt} habits.'))
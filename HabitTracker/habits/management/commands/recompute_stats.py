@@ -0,0 +1,183 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from habits.bitmaps import rebuild_bitmaps
+from habits.cache import bump_data_version
+from habits.models import Habit
+from habits.rollups import rebuild_daily_stats
+from habits.streaks import rebuild_streak_stats
+
+
+def plan_shards(user_ids, shard_size):
+    """
+    Split sorted user ids into inclusive id ranges of at most ``shard_size`` users.
+
+    Args:
+        user_ids (iterable): The user ids in ascending order.
+        shard_size (int): The maximum number of users per shard.
+
+    Returns:
+        list: ``(first_id, last_id)`` tuples.
+    """
+    shards, chunk = [], []
+    for user_id in user_ids:
+        chunk.append(user_id)
+        if len(chunk) == shard_size:
+            shards.append((chunk[0], chunk[-1]))
+            chunk = []
+    if chunk:
+        shards.append((chunk[0], chunk[-1]))
+    return shards
+
+
+def init_worker(settings_module):
+    """Set up Django in a worker process, which opens its own connections."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+
+    django.setup()
+    # Connections inherited from a forked parent must not be shared
+    connections.close_all()
+
+
+def recompute_shard(first_id, last_id, batch_size=500):
+    """
+    Recompute the derived data of the users in an id range.
+
+    The streak counters, bitmaps, period and daily rollups of the users'
+    habits are rebuilt batch by batch from their completions. The users'
+    cached analytics are invalidated by the command once the shard is done.
+
+    Args:
+        first_id (int): The id of the first user of the shard.
+        last_id (int): The id of the last user of the shard.
+        batch_size (int): The number of habits rebuilt per batch.
+
+    Returns:
+        tuple: The number of habits and completions recomputed.
+    """
+    user_ids = list(User.objects.filter(pk__gte=first_id, pk__lte=last_id).values_list('pk', flat=True))
+    habits = Habit.objects.filter(user_id__in=user_ids).order_by('pk')
+    recomputed = completions = 0
+    last_pk = 0
+    while True:
+        batch = list(habits.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        recomputed += rebuild_streak_stats(batch)
+        rebuild_bitmaps([habit.pk for habit in batch])
+        completions += sum(habit.total_completions for habit in batch)
+        last_pk = batch[-1].pk
+    rebuild_daily_stats(user_ids)
+    return recomputed, completions
+
+
+class Command(BaseCommand):
+    """
+    Recompute the derived data of all habits in parallel.
+
+    Users are split into shards of consecutive ids that are recomputed by a
+    pool of worker processes, each with its own database connection. The
+    completed shards are recorded in a state file after each shard, so an
+    interrupted run continues where it stopped with ``--resume``. The cached
+    analytics of a shard's users are invalidated by this process once the
+    shard is done.
+    """
+
+    help = 'Recompute the streak counters, bitmaps and rollups of all habits in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes, 1 runs in this process.')
+        parser.add_argument('--shard-size', type=int, default=200, help='Number of users per shard.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of habits rebuilt per batch.')
+        parser.add_argument('--state', default='recompute_stats.json', help='File recording the completed shards.')
+        parser.add_argument('--resume', action='store_true', help='Skip the shards completed by an earlier run.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['shard_size'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--workers, --shard-size and --batch-size must be positive.')
+
+        shards = plan_shards(User.objects.order_by('pk').values_list('pk', flat=True).iterator(), options['shard_size'])
+        done = self.load_state(options['state']) if options['resume'] else set()
+        pending = [shard for shard in shards if shard not in done]
+        self.stdout.write(f'{len(pending)} of {len(shards)} shards to recompute with {options["workers"]} workers.')
+
+        self.started = time.monotonic()
+        self.habits = self.completions = 0
+        failed = []
+        try:
+            for shard, result in self.run(pending, options):
+                if isinstance(result, Exception):
+                    failed.append(shard)
+                    self.stderr.write(f'Shard of users {shard[0]}-{shard[1]} failed: {result!r}')
+                    continue
+                self.invalidate(shard)
+                done.add(shard)
+                self.save_state(options['state'], done)
+                self.report(shard, result, len(done), len(shards))
+        except KeyboardInterrupt:
+            raise CommandError(f'Interrupted after {len(done)} of {len(shards)} shards, continue with --resume.')
+
+        if failed:
+            raise CommandError(f'{len(failed)} shards failed, rerun with --resume to retry them.')
+        if os.path.exists(options['state']):
+            os.remove(options['state'])
+        self.stdout.write(self.style.SUCCESS(f'Recomputed {self.habits} habits and {self.completions} completions.'))
+
+    def run(self, shards, options):
+        """Recompute the shards and yield each with its result or error as it completes."""
+        if options['workers'] == 1:
+            for shard in shards:
+                try:
+                    yield shard, recompute_shard(*shard, options['batch_size'])
+                except Exception as exc:
+                    yield shard, exc
+            return
+
+        # Forked workers must not inherit open connections
+        connections.close_all()
+        settings_module = os.environ.get('DJANGO_SETTINGS_MODULE', 'djangoProject.settings')
+        with ProcessPoolExecutor(options['workers'], initializer=init_worker, initargs=(settings_module,)) as executor:
+            futures = {executor.submit(recompute_shard, *shard, options['batch_size']): shard for shard in shards}
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], future.exception() or future.result()
+            except KeyboardInterrupt:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    def invalidate(self, shard):
+        """Invalidate the cached analytics of the users of a recomputed shard."""
+        for user_id in User.objects.filter(pk__gte=shard[0], pk__lte=shard[1]).values_list('pk', flat=True):
+            bump_data_version(user_id)
+
+    def report(self, shard, result, done, total):
+        habits, completions = result
+        self.habits += habits
+        self.completions += completions
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(
+            f'[{done}/{total}] users {shard[0]}-{shard[1]}: {habits} habits, {completions} completions '
+            f'({self.habits / elapsed:.0f} habits/s, {self.completions / elapsed:.0f} completions/s)'
+        )
+
+    def load_state(self, path):
+        try:
+            with open(path) as file:
+                return {tuple(shard) for shard in json.load(file)['done']}
+        except FileNotFoundError:
+            return set()
+        except (ValueError, KeyError, TypeError):
+            raise CommandError(f'Invalid state file: {path}')
+
+    def save_state(self, path, done):
+        # Replace the file atomically so an interruption never leaves it half written
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump({'done': sorted(done)}, file)
+        os.replace(f'{path}.tmp', path)
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from habits.reminders import get_notifier, send_reminders
+
+
+class Command(BaseCommand):
+    """
+    Send every user a digest of the habits still open in their current period.
+
+    The pending habits are found with one query per frequency, with the
+    periods computed in each user's timezone. Run it daily, or hourly with
+    ``--hour`` to remind users at the same local time everywhere.
+    """
+
+    help = 'Send reminder digests of the pending habits of all users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hour', type=int, help='Only remind users in whose timezone it is currently this hour (0-23).')
+        parser.add_argument('--notifier', help='Dotted path of the notifier class (default: HABITS_REMINDER_NOTIFIER).')
+        parser.add_argument('--file', help='Append the digests as JSON lines to this file instead.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Number of rows fetched from the database at once.')
+
+    def handle(self, *args, **options):
+        if options['hour'] is not None and not 0 <= options['hour'] <= 23:
+            raise CommandError('The hour must be between 0 and 23.')
+        if options['file']:
+            notifier = get_notifier('habits.reminders.FileNotifier', path=options['file'])
+        elif options['notifier']:
+            notifier = get_notifier(options['notifier'])
+        else:
+            notifier = get_notifier()
+
+        started = time.monotonic()
+        digests, habits = send_reminders(notifier, options['hour'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Sent {digests} digests for {habits} pending habits in {time.monotonic() - started:.2f}s.'
+        ))
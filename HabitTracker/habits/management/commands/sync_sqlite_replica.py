@@ -0,0 +1,36 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from habits.routers import replica_alias
+
+
+class Command(BaseCommand):
+    """
+    Copy the primary SQLite database to the read replica.
+
+    Production replicas are kept up to date by the database server. For local
+    development and testing the replica is a second SQLite file, refreshed
+    with this command through SQLite's online backup API, so the primary can
+    stay in use while it is copied.
+    """
+
+    help = 'Copy the primary SQLite database to the SQLite read replica.'
+
+    def handle(self, *args, **options):
+        alias = replica_alias()
+        if alias is None:
+            raise CommandError('No read replica is configured, set HABITS_REPLICA_DB.')
+        primary, replica = connections[DEFAULT_DB_ALIAS], connections[alias]
+        if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError('Both the primary and the replica must be SQLite databases.')
+
+        replica.close()
+        primary.ensure_connection()
+        target = sqlite3.connect(replica.settings_dict['NAME'])
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+        self.stdout.write(self.style.SUCCESS(f"Copied the primary database to {replica.settings_dict['NAME']}."))
@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:17
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def _period_start(day, frequency):
+    # Frozen copy of habits.periods.period_start
+    if frequency == 'weekly':
+        return day - timedelta(days=day.weekday())
+    if frequency == 'monthly':
+        return day.replace(day=1)
+    return day
+
+
+def _next_period(start, frequency):
+    # Frozen copy of habits.periods.next_period
+    if frequency == 'weekly':
+        return start + timedelta(weeks=1)
+    if frequency == 'monthly':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def _streak_stats(periods, frequency):
+    # Frozen copy of habits.streaks.streak_stats
+    longest = run = 0
+    previous = None
+    for start in sorted(periods):
+        if previous is not None and start == _next_period(previous, frequency):
+            run += 1
+        else:
+            run = 1
+        longest = max(longest, run)
+        previous = start
+    return {
+        'current_streak': run,
+        'longest_streak': longest,
+        'last_completed_period': previous,
+    }
+
+
+def fill_streak_counters(apps, schema_editor):
+    Habit = apps.get_model('habits', 'Habit')
+    HabitCompletion = apps.get_model('habits', 'HabitCompletion')
+
+    habits = {habit.pk: habit for habit in Habit.objects.all()}
+    periods = {pk: set() for pk in habits}
+    days = (
+        HabitCompletion.objects
+        .annotate(day=TruncDate('completed_at'))
+        .values_list('habit_id', 'day')
+        .order_by()
+        .distinct()
+    )
+    for habit_id, day in days.iterator():
+        periods[habit_id].add(_period_start(day, habits[habit_id].frequency))
+    totals = dict(HabitCompletion.objects.values_list('habit_id').annotate(total=Count('id')).order_by())
+
+    for pk, habit in habits.items():
+        for field, value in _streak_stats(periods[pk], habit.frequency).items():
+            setattr(habit, field, value)
+        habit.total_completions = totals.get(pk, 0)
+    Habit.objects.bulk_update(
+        habits.values(),
+        ['current_streak', 'longest_streak', 'last_completed_period', 'total_completions'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habit',
+            name='current_streak',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='last_completed_period',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='longest_streak',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='habit',
+            name='total_completions',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_streak_counters, migrations.RunPython.noop),
+    ]
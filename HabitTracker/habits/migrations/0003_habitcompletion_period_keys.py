@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def _period_start(day, frequency):
+    # Frozen copy of habits.periods.period_start
+    if frequency == 'weekly':
+        return day - timedelta(days=day.weekday())
+    if frequency == 'monthly':
+        return day.replace(day=1)
+    return day
+
+
+def fill_period_keys(apps, schema_editor):
+    HabitCompletion = apps.get_model('habits', 'HabitCompletion')
+
+    batch = []
+    for completion in HabitCompletion.objects.only('completed_at').order_by('pk').iterator(chunk_size=2000):
+        completion.day = timezone.localdate(completion.completed_at)
+        completion.iso_week = _period_start(completion.day, 'weekly')
+        completion.month = _period_start(completion.day, 'monthly')
+        batch.append(completion)
+        if len(batch) == 2000:
+            HabitCompletion.objects.bulk_update(batch, ['day', 'iso_week', 'month'])
+            batch = []
+    HabitCompletion.objects.bulk_update(batch, ['day', 'iso_week', 'month'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0002_habit_streak_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='habitcompletion',
+            name='day',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='habitcompletion',
+            name='iso_week',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='habitcompletion',
+            name='month',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_period_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='habitcompletion',
+            name='day',
+            field=models.DateField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='habitcompletion',
+            name='iso_week',
+            field=models.DateField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='habitcompletion',
+            name='month',
+            field=models.DateField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='habitcompletion',
+            index=models.Index(fields=['habit', 'day'], name='completion_habit_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habitcompletion',
+            index=models.Index(fields=['habit', 'iso_week'], name='completion_habit_week_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='habitcompletion',
+            index=models.Index(fields=['habit', 'month'], name='completion_habit_month_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:39
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def _day_bit(day):
+    # Frozen copy of habits.bitmaps.day_bit
+    return day.timetuple().tm_yday - 1
+
+
+def _to_bytes(bits):
+    # Frozen copy of habits.bitmaps.to_bytes, 366 days rounded up to whole bytes
+    return bits.to_bytes(46, 'little')
+
+
+def fill_bitmaps(apps, schema_editor):
+    HabitCompletion = apps.get_model('habits', 'HabitCompletion')
+    HabitYearBitmap = apps.get_model('habits', 'HabitYearBitmap')
+
+    bitmaps = defaultdict(int)
+    days = HabitCompletion.objects.values_list('habit_id', 'day').order_by().distinct()
+    for habit_id, day in days.iterator():
+        bitmaps[habit_id, day.year] |= 1 << _day_bit(day)
+    HabitYearBitmap.objects.bulk_create(
+        [
+            HabitYearBitmap(habit_id=habit_id, year=year, bits=_to_bytes(bits))
+            for (habit_id, year), bits in bitmaps.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0004_completionbatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitYearBitmap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('bits', models.BinaryField()),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bitmaps', to='habits.habit')),
+            ],
+            options={
+                'unique_together': {('habit', 'year')},
+            },
+        ),
+        migrations.RunPython(fill_bitmaps, migrations.RunPython.noop),
+    ]
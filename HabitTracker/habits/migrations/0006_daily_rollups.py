@@ -0,0 +1,109 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:55
+
+import django.db.models.deletion
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _period_start(day, frequency):
+    # Frozen copy of habits.periods.period_start
+    if frequency == 'weekly':
+        return day - timedelta(days=day.weekday())
+    if frequency == 'monthly':
+        return day.replace(day=1)
+    return day
+
+
+def _next_period(start, frequency):
+    # Frozen copy of habits.periods.next_period
+    if frequency == 'weekly':
+        return start + timedelta(weeks=1)
+    if frequency == 'monthly':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def fill_rollups(apps, schema_editor):
+    Habit = apps.get_model('habits', 'Habit')
+    HabitCompletion = apps.get_model('habits', 'HabitCompletion')
+    HabitPeriodStats = apps.get_model('habits', 'HabitPeriodStats')
+    UserDailyStats = apps.get_model('habits', 'UserDailyStats')
+
+    habits = {pk: (user_id, frequency) for pk, user_id, frequency in Habit.objects.values_list('pk', 'user_id', 'frequency')}
+    due = Counter(user_id for user_id, _ in habits.values())
+    periods = Counter()
+    for habit_id, day in HabitCompletion.objects.values_list('habit_id', 'day').iterator():
+        periods[habit_id, _period_start(day, habits[habit_id][1])] += 1
+    HabitPeriodStats.objects.bulk_create(
+        [HabitPeriodStats(habit_id=habit_id, period_start=start, completions=count) for (habit_id, start), count in periods.items()],
+        batch_size=1000,
+    )
+
+    completed = defaultdict(Counter)
+    for habit_id, start in periods:
+        user_id, frequency = habits[habit_id]
+        day = start
+        while day < _next_period(start, frequency):
+            completed[user_id, day][frequency] += 1
+            day += timedelta(days=1)
+    UserDailyStats.objects.bulk_create(
+        [
+            UserDailyStats(
+                user_id=user_id,
+                day=day,
+                due_habits=due[user_id],
+                completed_habits=sum(counts.values()),
+                daily_completed=counts['daily'],
+                weekly_completed=counts['weekly'],
+                monthly_completed=counts['monthly'],
+                success_rate=sum(counts.values()) * 100 / due[user_id],
+            )
+            for (user_id, day), counts in completed.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0005_habityearbitmap'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HabitPeriodStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('completions', models.PositiveIntegerField(default=0)),
+                ('habit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_stats', to='habits.habit')),
+            ],
+            options={
+                'unique_together': {('habit', 'period_start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='UserDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('due_habits', models.PositiveIntegerField(default=0)),
+                ('completed_habits', models.PositiveIntegerField(default=0)),
+                ('daily_completed', models.PositiveIntegerField(default=0)),
+                ('weekly_completed', models.PositiveIntegerField(default=0)),
+                ('monthly_completed', models.PositiveIntegerField(default=0)),
+                ('success_rate', models.FloatField(default=0.0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'user daily stats',
+                'unique_together': {('user', 'day')},
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('habits', '0006_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='habitcompletion',
+            index=models.Index(fields=['day'], name='completion_day_idx'),
+        ),
+    ]
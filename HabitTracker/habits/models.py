@@ -1,7 +1,85 @@
-from django.db import models
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections, models, transaction
+from django.db.models.constants import OnConflict
 from django.contrib.auth.models import User
 from django.utils import timezone
-from datetime import timedelta, datetime
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+import zoneinfo
+
+from .bitmaps import rebuild_bitmaps
+from .cache import bump_data_version
+from .periods import next_period, period_start
+from .rollups import rebuild_daily_stats
+from .streaks import rebuild_streak_stats, streak_summaries
+from .tasks import enqueue
+
+# Set while a queryset is deleted with delete_in_batch(), so the delete
+# signal handlers leave the derived data to the rebuild queued afterwards
+_batch_delete = ContextVar('habits_batch_delete', default=False)
+
+
+def deleting_in_batch():
+    """Return whether the current delete is a batch delete that rebuilds the derived data once."""
+    return _batch_delete.get()
+
+
+class HabitQuerySet(models.QuerySet):
+    """
+    Custom queryset for habits with annotations used by the list views.
+    """
+
+    def delete_in_batch(self):
+        """
+        Delete the habits and update their owners' derived data once.
+
+        A plain ``delete()`` queues a rollup rebuild and invalidates the cached
+        analytics for every deleted habit. Here the rollups of each owner are
+        rebuilt once in the background instead.
+
+        Returns:
+            tuple: The result of ``delete()``.
+        """
+        user_ids = set(self.values_list('user_id', flat=True))
+        token = _batch_delete.set(True)
+        try:
+            deleted = self.delete()
+        finally:
+            _batch_delete.reset(token)
+        for user_id in user_ids:
+            enqueue('rebuild_rollups', user_id)
+            bump_data_version(user_id)
+        return deleted
+
+    def with_completion_status(self, today=None):
+        """
+        Annotate each habit with whether it is completed in its current period.
+
+        The status is computed in the same query as the habits with one
+        correlated ``EXISTS`` subquery per frequency on the indexed period key,
+        instead of one query per habit through
+        :meth:`Habit.is_completed_in_current_period`.
+
+        Args:
+            today (date): The reference day. Defaults to the current local date.
+
+        Returns:
+            HabitQuerySet: The habits annotated with ``completed_this_period``.
+        """
+        if today is None:
+            today = timezone.localdate()
+        whens = []
+        for frequency, _ in Habit.FREQUENCY_CHOICES:
+            completed = HabitCompletion.objects.filter(
+                habit=models.OuterRef('pk'),
+                **{HabitCompletion.period_key(frequency): period_start(today, frequency)}
+            )
+            whens.append(models.When(frequency=frequency, then=models.Exists(completed)))
+        return self.annotate(completed_this_period=models.Case(
+            *whens, default=models.Value(False), output_field=models.BooleanField()
+        ))
+
 
 class Habit(models.Model):
     """
@@ -18,8 +96,17 @@ class Habit(models.Model):
         frequency (str): How often the habit should be performed ('daily', 'weekly', or 'monthly')
         created_at (datetime): When the habit was created
         updated_at (datetime): When the habit was last updated
+        current_streak (int): Length of the streak ending at the last completed period
+        longest_streak (int): Length of the longest streak ever achieved
+        last_completed_period (date): Start of the most recent period with a completion
+        total_completions (int): Number of recorded completions
+
+    The streak counters are maintained incrementally whenever a completion is
+    saved or deleted and can be rebuilt with ``manage.py rebuild_habit_stats``.
     """
 
+    STREAK_FIELDS = ['current_streak', 'longest_streak', 'last_completed_period', 'total_completions']
+
     FREQUENCY_CHOICES = [
         ('daily', 'Daily'),
         ('weekly', 'Weekly'),
@@ -32,6 +119,12 @@ class Habit(models.Model):
     frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default='daily')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    current_streak = models.PositiveIntegerField(default=0, editable=False)
+    longest_streak = models.PositiveIntegerField(default=0, editable=False)
+    last_completed_period = models.DateField(null=True, blank=True, editable=False)
+    total_completions = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = HabitQuerySet.as_manager()
 
     def __str__(self):
         """Return a string representation of the habit."""
@@ -48,94 +141,122 @@ class Habit(models.Model):
         according to its frequency (daily, weekly, or monthly) up until the present day.
         The streak breaks if a required completion is missed.
 
+        The streak is computed inside the database with a single query, see
+        :func:`habits.streaks.streak_summaries`.
+
         Returns:
             int: The number of consecutive times the habit has been completed
                 according to its frequency, up to the present day.
         """
-        today = timezone.now().date()
-        streak = 0
-        current_date = today
-
-        while True:
-            # Check if there's a completion for the current period
-            if self.frequency == 'daily':
-                completion = self.completions.filter(
-                    completed_at__date=current_date
-                ).first()
-            elif self.frequency == 'weekly':
-                # Check if completed in the week containing this date
-                week_start = current_date - timedelta(days=current_date.weekday())
-                week_end = week_start + timedelta(days=6)
-                completion = self.completions.filter(
-                    completed_at__date__range=[week_start, week_end]
-                ).first()
-            elif self.frequency == 'monthly':
-                # Check if completed in the month containing this date
-                month_start = current_date.replace(day=1)
-                if current_date.month == 12:
-                    next_month = current_date.replace(year=current_date.year + 1, month=1, day=1)
-                else:
-                    next_month = current_date.replace(month=current_date.month + 1, day=1)
-                month_end = next_month - timedelta(days=1)
-                completion = self.completions.filter(
-                    completed_at__date__range=[month_start, month_end]
-                ).first()
-
-            if not completion:
-                break
-
-            streak += 1
-            # Move to the previous day/week/month based on frequency
-            if self.frequency == 'daily':
-                current_date -= timedelta(days=1)
-            elif self.frequency == 'weekly':
-                current_date -= timedelta(weeks=1)
-            elif self.frequency == 'monthly':
-                # Approximate month by subtracting 30 days
-                current_date -= timedelta(days=30)
-
-        return streak
+        return streak_summaries([self])[self.pk]['current_streak']
 
     def get_longest_streak(self):
         """
         Calculate the longest streak ever achieved for this habit.
         
         This method analyzes all completions of the habit to find the longest
-        streak of consecutive completions according to the habit's frequency.
-        A streak is broken if a completion is missed or done on the wrong day.
+        streak of consecutive completed periods according to the habit's frequency.
+        A streak is broken if a period passes without a completion. The runs of
+        consecutive periods are found inside the database, see
+        :func:`habits.streaks.streak_summaries`.
 
         Returns:
             int: The length of the longest streak ever achieved for this habit.
                 Returns 0 if no completions exist.
         """
-        completions = self.completions.order_by('completed_at')
-        if not completions:
+        return streak_summaries([self])[self.pk]['longest_streak']
+
+    @property
+    def active_streak(self):
+        """
+        Return the current streak from the stored counters.
+
+        The stored ``current_streak`` only counts as current while its last
+        period is the present one, matching :meth:`get_current_streak` without
+        touching the completions.
+
+        Returns:
+            int: The current streak, or 0 if the current period is not completed.
+        """
+        if self.last_completed_period != period_start(timezone.localdate(), self.frequency):
             return 0
+        return self.current_streak
 
-        longest_streak = 1  # Initialize with 1 for the first completion
-        current_streak = 1
-        previous_date = completions[0].completed_at.date()
-
-        for completion in completions[1:]:
-            current_date = completion.completed_at.date()
-            
-            # Calculate expected date based on frequency
-            if self.frequency == 'daily':
-                expected_date = previous_date + timedelta(days=1)
-            elif self.frequency == 'weekly':
-                expected_date = previous_date + timedelta(days=7)
-            elif self.frequency == 'monthly':
-                expected_date = previous_date + timedelta(days=30)
-
-            if current_date == expected_date:
-                current_streak += 1
-                longest_streak = max(longest_streak, current_streak)
-            else:
-                current_streak = 1
+    @property
+    def fragment_version(self):
+        """
+        Return a version of everything a rendered habit card or streak row shows.
+
+        It combines the last edit of the habit, its stored completion counters
+        (the latest completed period and the number of completions) and the
+        start of the current period, so cached fragments are re-rendered when
+        the habit or its completions change and when a new period begins.
+
+        Returns:
+            str: The version, to be used in template fragment cache keys.
+        """
+        return ':'.join(str(part) for part in (
+            self.updated_at.timestamp(),
+            self.last_completed_period,
+            self.total_completions,
+            self.current_streak,
+            self.longest_streak,
+            period_start(timezone.localdate(), self.frequency),
+        ))
+
+    def rebuild_streak_stats(self):
+        """
+        Recalculate the stored streak counters from the recorded completions.
+        """
+        rebuild_streak_stats([self])
+
+    def record_completion(self, day):
+        """
+        Update the stored streak counters for a newly recorded completion.
+
+        Completions in the latest or a newer period are applied incrementally.
+        Completions back-filled into an older period can split or join earlier
+        streaks, so the counters are rebuilt from scratch in that case.
+
+        Args:
+            day (date): The local date of the new completion.
+        """
+        with transaction.atomic():
+            stats = Habit.objects.select_for_update().filter(pk=self.pk).values(*self.STREAK_FIELDS).get()
+            for field, value in stats.items():
+                setattr(self, field, value)
 
-            previous_date = current_date
+            period = period_start(day, self.frequency)
+            last = self.last_completed_period
+            if last is not None and period < last:
+                self.rebuild_streak_stats()
+                return
 
-        return longest_streak
+            if last is None or period > last:
+                if last is not None and period == next_period(last, self.frequency):
+                    self.current_streak += 1
+                else:
+                    self.current_streak = 1
+                self.last_completed_period = period
+            self.longest_streak = max(self.longest_streak, self.current_streak)
+            self.total_completions += 1
+            Habit.objects.filter(pk=self.pk).update(**{field: getattr(self, field) for field in self.STREAK_FIELDS})
+
+    def get_statistics(self, today=None):
+        """
+        Calculate the statistics of this habit with the vectorised analytics.
+
+        Args:
+            today (date): The reference day. Defaults to the current local date.
+
+        Returns:
+            dict: The ``current_streak``, ``longest_streak``,
+                  ``completion_rate`` and ``weekday_distribution`` of the habit,
+                  see :meth:`habits.analytics.CompletionArrays.habit_statistics`.
+        """
+        from .analytics import CompletionArrays
+
+        return CompletionArrays([self]).habit_statistics(today)[self.pk]
 
     def is_completed_in_current_period(self):
         """
@@ -145,38 +266,209 @@ class Habit(models.Model):
         For weekly habits, checks if completed in the current week.
         For monthly habits, checks if completed in the current month.
 
+        List views should use :meth:`HabitQuerySet.with_completion_status`
+        instead, which computes the status for many habits in one query.
+
         Returns:
             bool: True if the habit has been completed in its current period,
                  False otherwise.
         """
-        now = timezone.now()
-        today = now.date()
-        
-        if self.frequency == 'daily':
-            # Check for completions within the current day in user's timezone
-            start_of_day = timezone.make_aware(datetime.combine(today, datetime.min.time()))
-            end_of_day = timezone.make_aware(datetime.combine(today, datetime.max.time()))
-            return self.completions.filter(completed_at__range=(start_of_day, end_of_day)).exists()
-        
-        elif self.frequency == 'weekly':
-            # Get the start of the week (Monday)
-            week_start = today - timedelta(days=today.weekday())
-            week_end = week_start + timedelta(days=6)
-            start_of_week = timezone.make_aware(datetime.combine(week_start, datetime.min.time()))
-            end_of_week = timezone.make_aware(datetime.combine(week_end, datetime.max.time()))
-            return self.completions.filter(completed_at__range=(start_of_week, end_of_week)).exists()
-        
-        elif self.frequency == 'monthly':
-            # Get the start and end of the current month
-            start_of_month = timezone.make_aware(datetime.combine(today.replace(day=1), datetime.min.time()))
-            if today.month == 12:
-                next_month = today.replace(year=today.year + 1, month=1, day=1)
-            else:
-                next_month = today.replace(month=today.month + 1, day=1)
-            end_of_month = timezone.make_aware(datetime.combine(next_month - timedelta(days=1), datetime.max.time()))
-            return self.completions.filter(completed_at__range=(start_of_month, end_of_month)).exists()
-        
-        return False
+        if self.frequency not in HabitCompletion.PERIOD_KEYS:
+            return False
+        period = period_start(timezone.localdate(), self.frequency)
+        return self.completions.filter(**{HabitCompletion.period_key(self.frequency): period}).exists()
+
+class HabitCompletionQuerySet(models.QuerySet):
+    """
+    Custom queryset for habit completions with bulk write helpers.
+    """
+
+    def delete_in_batch(self):
+        """
+        Delete the completions and rebuild the derived data of their habits once.
+
+        A plain ``delete()`` updates the streak counters, bitmaps and rollups
+        in the delete signal handlers, with several queries per deleted row.
+        Here they are rebuilt once per habit in the background instead, see
+        :meth:`enqueue_derived_data`.
+
+        Returns:
+            tuple: The result of ``delete()``.
+        """
+        habit_ids = set(self.values_list('habit_id', flat=True))
+        token = _batch_delete.set(True)
+        try:
+            deleted = self.delete()
+        finally:
+            _batch_delete.reset(token)
+        HabitCompletion.objects.enqueue_derived_data(habit_ids)
+        return deleted
+
+    def bulk_record(self, completions, batch_size=500, rebuild=True):
+        """
+        Insert many completions at once, skipping duplicates.
+
+        The period keys of every completion are filled in and the rows are
+        written with ``bulk_create`` in one transaction. Completions that clash
+        with the unique constraint on habit and timestamp are ignored. Because
+        ``bulk_create`` bypasses :meth:`HabitCompletion.save` and its signals,
+        the streak counters and cached analytics of the affected habits are
+        refreshed once afterwards.
+
+        Args:
+            completions (iterable): Unsaved ``HabitCompletion`` instances.
+            batch_size (int): Number of rows per ``INSERT`` statement.
+            rebuild (bool): Whether to refresh the derived data. Callers that
+                            write several chunks can pass False and call
+                            :meth:`refresh_derived_data` once at the end.
+
+        Returns:
+            set: The ids of the habits that received completions.
+        """
+        completions = list(completions)
+        for completion in completions:
+            completion.fill_period_keys()
+        with transaction.atomic(using=self.db):
+            self.bulk_create(completions, batch_size=batch_size, ignore_conflicts=True)
+        habit_ids = {completion.habit_id for completion in completions}
+        if rebuild:
+            self.refresh_derived_data(habit_ids)
+        return habit_ids
+
+    def bulk_insert_rows(self, rows, batch_size=2000):
+        """
+        Insert plain completion rows at high throughput, skipping duplicates.
+
+        Unlike :meth:`bulk_record` no model instances are created: the period
+        keys are derived directly and the rows are sent with ``executemany`` as
+        an ``INSERT`` that ignores conflicts on the unique constraint. All rows
+        are written in one transaction. Derived data is not refreshed, call
+        :meth:`refresh_derived_data` once all rows are written.
+
+        Args:
+            rows (iterable): ``(habit_id, completed_at, notes)`` tuples with
+                             timezone-aware ``completed_at`` values.
+            batch_size (int): Number of rows passed to each ``executemany`` call.
+
+        Returns:
+            tuple: The ids of the habits the rows belong to and the number of
+                   completions inserted.
+        """
+        connection = connections[self.db]
+        ops = connection.ops
+        fields = [HabitCompletion._meta.get_field(name) for name in
+                  ('habit', 'completed_at', 'notes', 'day', 'iso_week', 'month')]
+        sql = '{} {} ({}) VALUES ({}) {}'.format(
+            ops.insert_statement(on_conflict=OnConflict.IGNORE),
+            ops.quote_name(HabitCompletion._meta.db_table),
+            ', '.join(ops.quote_name(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+            ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None),
+        )
+        tz = timezone.get_current_timezone()
+        habit_ids = set()
+        batch = []
+        inserted = 0
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            for habit_id, completed_at, notes in rows:
+                day = completed_at.astimezone(tz).date()
+                batch.append((
+                    habit_id,
+                    ops.adapt_datetimefield_value(completed_at),
+                    notes,
+                    ops.adapt_datefield_value(day),
+                    ops.adapt_datefield_value(day - timedelta(days=day.weekday())),
+                    ops.adapt_datefield_value(day.replace(day=1)),
+                ))
+                habit_ids.add(habit_id)
+                if len(batch) >= batch_size:
+                    cursor.executemany(sql, batch)
+                    inserted += cursor.rowcount
+                    batch = []
+            if batch:
+                cursor.executemany(sql, batch)
+                inserted += cursor.rowcount
+        return habit_ids, inserted
+
+    def refresh_derived_data(self, habit_ids, batch_size=500):
+        """
+        Refresh the streak counters, bitmaps, rollups and cached analytics after bulk writes.
+
+        The habits are rebuilt in batches, so large imports stay below the
+        database's limit on query parameters.
+
+        Args:
+            habit_ids (iterable): The ids of the habits whose completions changed.
+            batch_size (int): Number of habits rebuilt per batch.
+        """
+        habit_ids = sorted(habit_ids)
+        user_ids = set()
+        for first in range(0, len(habit_ids), batch_size):
+            habits = list(Habit.objects.filter(pk__in=habit_ids[first:first + batch_size]))
+            rebuild_streak_stats(habits)
+            rebuild_bitmaps([habit.pk for habit in habits])
+            user_ids.update(habit.user_id for habit in habits)
+        rebuild_daily_stats(user_ids)
+        for user_id in user_ids:
+            bump_data_version(user_id)
+
+    def enqueue_derived_data(self, habit_ids):
+        """
+        Queue the refresh of the derived data after bulk writes.
+
+        Unlike :meth:`refresh_derived_data` this returns right away: the cached
+        analytics are invalidated and the streak counters, bitmaps and rollups
+        are rebuilt by background tasks (see :mod:`habits.tasks`).
+
+        Args:
+            habit_ids (iterable): The ids of the habits whose completions changed.
+        """
+        habit_ids = list(habit_ids)
+        for habit_id in habit_ids:
+            enqueue('rebuild_habit', habit_id)
+        for user_id in set(Habit.objects.filter(pk__in=habit_ids).values_list('user_id', flat=True)):
+            enqueue('rebuild_rollups', user_id)
+            bump_data_version(user_id)
+
+    def complete_range(self, habits, start, end, at, notes='', batch_size=2000):
+        """
+        Complete habits in every period of a date range that has no completion yet.
+
+        Each missing period gets one completion on its first day within the
+        range at the given time. The rows are written in batches with
+        :meth:`bulk_insert_rows` and the derived data is refreshed once.
+
+        Args:
+            habits (iterable): The habits to complete.
+            start (date): The first day of the range.
+            end (date): The last day of the range.
+            at (time): The local time of day of the completions.
+            notes (str): Notes stored with every completion.
+            batch_size (int): Number of rows passed to each ``executemany`` call.
+
+        Returns:
+            int: The number of completions created.
+        """
+        habits = list(habits)
+        completed = set(
+            HabitPeriodStats.objects
+            .filter(habit__in=habits, period_start__lte=end, period_start__gt=start - timedelta(days=31))
+            .values_list('habit_id', 'period_start')
+        )
+
+        def rows():
+            for habit in habits:
+                period = period_start(start, habit.frequency)
+                while period <= end:
+                    if (habit.pk, period) not in completed:
+                        day = max(period, start)
+                        yield habit.pk, timezone.make_aware(datetime.combine(day, at)), notes
+                    period = next_period(period, habit.frequency)
+
+        touched, inserted = self.bulk_insert_rows(rows(), batch_size=batch_size)
+        self.refresh_derived_data(touched)
+        return inserted
+
 
 class HabitCompletion(models.Model):
     """
@@ -184,17 +476,32 @@ class HabitCompletion(models.Model):
     
     This model tracks when a habit was completed and allows for optional notes
     about the completion. It ensures that only one completion per habit per
-    timestamp is recorded.
+    timestamp is recorded. With the ``HABITS_ONE_COMPLETION_PER_PERIOD`` setting
+    enabled, only one completion per habit and period is accepted.
+
+    The local day, week and month of the completion are stored as period keys,
+    so that period lookups are plain indexed comparisons instead of date
+    functions applied to ``completed_at``.
 
     Attributes:
         habit (ForeignKey): The habit that was completed
         completed_at (datetime): When the habit was completed
         notes (str): Optional notes about the completion
+        day (date): The local date of the completion
+        iso_week (date): The Monday of the ISO week of the completion
+        month (date): The first day of the month of the completion
     """
 
+    PERIOD_KEYS = {'daily': 'day', 'weekly': 'iso_week', 'monthly': 'month'}
+
     habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name='completions')
     completed_at = models.DateTimeField(default=timezone.now)
     notes = models.TextField(blank=True)
+    day = models.DateField(editable=False)
+    iso_week = models.DateField(editable=False)
+    month = models.DateField(editable=False)
+
+    objects = HabitCompletionQuerySet.as_manager()
 
     def __str__(self):
         """Return a string representation of the habit completion."""
@@ -203,19 +510,290 @@ class HabitCompletion(models.Model):
     class Meta:
         ordering = ['-completed_at']
         unique_together = ['habit', 'completed_at']
+        indexes = [
+            models.Index(fields=['habit', 'day'], name='completion_habit_day_idx'),
+            models.Index(fields=['habit', 'iso_week'], name='completion_habit_week_idx'),
+            models.Index(fields=['habit', 'month'], name='completion_habit_month_idx'),
+            models.Index(fields=['day'], name='completion_day_idx'),
+        ]
+
+    @classmethod
+    def period_key(cls, frequency):
+        """
+        Return the name of the period key field for a habit frequency.
+
+        Args:
+            frequency (str): The habit frequency ('daily', 'weekly' or 'monthly').
+
+        Returns:
+            str: One of ``'day'``, ``'iso_week'`` or ``'month'``.
+        """
+        return cls.PERIOD_KEYS[frequency]
+
+    def fill_period_keys(self):
+        """
+        Derive the period keys from ``completed_at``.
+
+        This is called by :meth:`save`. Code that writes completions with
+        ``bulk_create`` must call it for every instance.
+        """
+        if not self.completed_at.tzinfo:
+            self.completed_at = timezone.make_aware(self.completed_at)
+        self.day = timezone.localdate(self.completed_at)
+        self.iso_week = period_start(self.day, 'weekly')
+        self.month = period_start(self.day, 'monthly')
+
+    def clean(self):
+        """
+        Reject a second completion in the same period if that rule is enabled.
+
+        Raises:
+            ValidationError: If ``HABITS_ONE_COMPLETION_PER_PERIOD`` is enabled and
+                             the habit is already completed in this period.
+        """
+        super().clean()
+        if not getattr(settings, 'HABITS_ONE_COMPLETION_PER_PERIOD', False) or self.habit_id is None:
+            return
+        self.fill_period_keys()
+        key = self.period_key(self.habit.frequency)
+        duplicates = HabitCompletion.objects.filter(habit_id=self.habit_id, **{key: getattr(self, key)})
+        if duplicates.exclude(pk=self.pk).exists():
+            raise ValidationError(
+                f'This habit is already completed for the current {self.habit.get_frequency_display().lower()} period.'
+            )
 
     def save(self, *args, **kwargs):
         """
         Save the habit completion instance.
         
         This override ensures that the completed_at timestamp is timezone-aware
-        before saving the instance to the database.
+        and the period keys are filled before saving the instance to the
+        database. It also updates the streak counters stored on the habit.
 
         Args:
             *args: Variable length argument list.
             **kwargs: Arbitrary keyword arguments.
         """
-        # Ensure completed_at is in the user's timezone
-        if not self.completed_at.tzinfo:
-            self.completed_at = timezone.make_aware(self.completed_at)
-        super().save(*args, **kwargs)
+        # Ensure completed_at is in the user's timezone and derive the period keys
+        self.fill_period_keys()
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Keep the stored streak counters of the habit up to date
+            if adding:
+                self.habit.record_completion(self.day)
+            else:
+                # The completion may have moved to another period
+                enqueue('rebuild_habit', self.habit_id)
+
+
+class CompletionBatch(models.Model):
+    """
+    A model recording a processed bulk completion request.
+
+    Clients send an idempotency key with every batch. When a batch is retried
+    with the same key, the stored response is returned instead of recording
+    the completions again.
+
+    Attributes:
+        user (ForeignKey): The user who sent the batch
+        idempotency_key (str): The client-provided or generated key of the batch
+        response (dict): The response returned for the batch
+        created_at (datetime): When the batch was processed
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='completion_batches')
+    idempotency_key = models.CharField(max_length=64)
+    response = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        """Return a string representation of the completion batch."""
+        return f"Batch {self.idempotency_key} of {self.user}"
+
+    class Meta:
+        unique_together = ['user', 'idempotency_key']
+
+
+class HabitYearBitmap(models.Model):
+    """
+    A model storing the completed days of a habit in one year as a bitmap.
+
+    Bit ``n`` (little-endian) is set if the habit was completed on day ``n + 1``
+    of the year. The bitmaps are kept in sync when completions are written and
+    can be rebuilt with ``manage.py rebuild_habit_stats``. They make heatmaps,
+    single-day checks and daily streak scans cheap bit operations.
+
+    Attributes:
+        habit (ForeignKey): The habit the bitmap belongs to
+        year (int): The calendar year covered by the bitmap
+        bits (bytes): The 46-byte bitmap of completed days
+    """
+
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name='bitmaps')
+    year = models.PositiveSmallIntegerField()
+    bits = models.BinaryField()
+
+    def __str__(self):
+        """Return a string representation of the bitmap."""
+        return f"{self.habit_id} in {self.year}"
+
+    class Meta:
+        unique_together = ['habit', 'year']
+
+
+class HabitPeriodStats(models.Model):
+    """
+    A rollup of the completions of a habit in one of its periods.
+
+    Rows only exist for periods with at least one completion. They are kept in
+    sync when completions are written and can be rebuilt with
+    ``manage.py rebuild_daily_stats``.
+
+    Attributes:
+        habit (ForeignKey): The habit the period belongs to
+        period_start (date): The first day of the period
+        completions (int): The number of completions in the period
+    """
+
+    habit = models.ForeignKey(Habit, on_delete=models.CASCADE, related_name='period_stats')
+    period_start = models.DateField()
+    completions = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        """Return a string representation of the period."""
+        return f"{self.habit_id} from {self.period_start}: {self.completions}"
+
+    class Meta:
+        unique_together = ['habit', 'period_start']
+
+
+class UserDailyStats(models.Model):
+    """
+    A rollup of the success of all habits of a user on one day.
+
+    A habit counts as completed on a day if it was completed in the period of
+    its frequency containing that day. Every habit of the user is due on every
+    day. The rows are kept in sync when completions and habits are written and
+    can be backfilled or repaired with ``manage.py rebuild_daily_stats``.
+
+    Attributes:
+        user (ForeignKey): The user the statistics belong to
+        day (date): The day of the statistics
+        due_habits (int): The number of habits due on the day
+        completed_habits (int): The number of habits completed on the day
+        daily_completed (int): The number of completed daily habits
+        weekly_completed (int): The number of completed weekly habits
+        monthly_completed (int): The number of completed monthly habits
+        success_rate (float): The completed habits in percent of the due habits
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    due_habits = models.PositiveIntegerField(default=0)
+    completed_habits = models.PositiveIntegerField(default=0)
+    daily_completed = models.PositiveIntegerField(default=0)
+    weekly_completed = models.PositiveIntegerField(default=0)
+    monthly_completed = models.PositiveIntegerField(default=0)
+    success_rate = models.FloatField(default=0.0)
+
+    def __str__(self):
+        """Return a string representation of the statistics."""
+        return f"{self.user} on {self.day}: {self.completed_habits}/{self.due_habits}"
+
+    class Meta:
+        unique_together = ['user', 'day']
+        verbose_name_plural = 'user daily stats'
+
+
+class QueuedTask(models.Model):
+    """
+    A background task waiting to be run, see :mod:`habits.tasks`.
+
+    There is at most one row per task and key, so repeated requests for the
+    same recomputation are coalesced. Rows are deleted once the task succeeds;
+    rows left behind by failures or restarts are run by
+    ``manage.py drain_tasks``.
+
+    Attributes:
+        name (str): The name of the registered task
+        key (int): The key passed to the task, e.g. a habit id
+        created_at (datetime): When the task was first queued
+        claimed_at (datetime): When a worker started running the task
+        attempts (int): The number of failed runs
+        last_error (str): The error of the last failed run
+        rerun (bool): Whether the task was queued again while it was running
+    """
+
+    name = models.CharField(max_length=100)
+    key = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    rerun = models.BooleanField(default=False)
+
+    def __str__(self):
+        """Return a string representation of the queued task."""
+        return f"{self.name}({self.key})"
+
+    class Meta:
+        unique_together = ['name', 'key']
+
+
+def validate_timezone(value):
+    """
+    Validate the name of an IANA timezone.
+
+    Raises:
+        ValidationError: If the timezone is not known.
+    """
+    if value and value not in zoneinfo.available_timezones():
+        raise ValidationError(f'{value} is not a known timezone.')
+
+
+class ReminderPreference(models.Model):
+    """
+    How a user wants to be reminded of their pending habits.
+
+    Users without a preference get reminders with their periods computed in
+    ``settings.TIME_ZONE``.
+
+    Attributes:
+        user (OneToOneField): The user the preference belongs to
+        enabled (bool): Whether the user gets reminder digests
+        timezone (str): The IANA timezone in which the user's days, weeks and
+                        months begin, empty for ``settings.TIME_ZONE``
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='reminder_preference')
+    enabled = models.BooleanField(default=True)
+    timezone = models.CharField(max_length=64, blank=True, validators=[validate_timezone])
+
+    def __str__(self):
+        """Return a string representation of the preference."""
+        return f"Reminders of {self.user} in {self.timezone or settings.TIME_ZONE}"
+
+
+class UserDataVersion(models.Model):
+    """
+    The version of a user's habit data, see :mod:`habits.cache`.
+
+    The version is bumped on every change to the user's habits, completions
+    or derived data. It is stored in the database rather than a cache, so
+    changes made by other processes, e.g. management commands or background
+    workers, are seen by all web workers at once.
+
+    Attributes:
+        user (OneToOneField): The user the version belongs to
+        version (int): The number of changes to the user's data
+        modified (datetime): When the user's data last changed
+    """
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='data_version')
+    version = models.PositiveBigIntegerField(default=0)
+    modified = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        """Return a string representation of the data version."""
+        return f"{self.user} at version {self.version}"
@@ -0,0 +1,62 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(completion):
+    """
+    Encode the position of a completion as a keyset pagination cursor.
+
+    Args:
+        completion (HabitCompletion): The last completion of a page.
+
+    Returns:
+        str: The cursor pointing behind the completion.
+    """
+    return f'{completion.completed_at.isoformat()}_{completion.pk}'
+
+
+def decode_cursor(cursor):
+    """
+    Decode a keyset pagination cursor.
+
+    Args:
+        cursor (str): A cursor produced by :func:`encode_cursor`.
+
+    Returns:
+        tuple: The ``completed_at`` timestamp and id of the last completion of
+               the previous page, or None if the cursor is missing or invalid.
+    """
+    timestamp, _, pk = (cursor or '').rpartition('_')
+    completed_at = parse_datetime(timestamp.replace(' ', '+')) if timestamp else None
+    if completed_at is None or not pk.isdigit():
+        return None
+    return completed_at, int(pk)
+
+
+def keyset_page(completions, cursor=None, page_size=20):
+    """
+    Return one page of completions, newest first, using keyset pagination.
+
+    Pages are addressed by the ``(completed_at, id)`` of the last row of the
+    previous page instead of an offset, so fetching a page costs the same no
+    matter how far back in the history it is.
+
+    Args:
+        completions (QuerySet): The completions to paginate.
+        cursor (str): The cursor of the previous page, or None for the first page.
+        page_size (int): The number of completions per page.
+
+    Returns:
+        tuple: The list of completions on the page and the cursor of the next
+               page, or None if this is the last page.
+    """
+    completions = completions.order_by('-completed_at', '-id')
+    position = decode_cursor(cursor)
+    if position is not None:
+        completed_at, pk = position
+        completions = completions.filter(Q(completed_at__lt=completed_at) | Q(completed_at=completed_at, id__lt=pk))
+    page = list(completions[:page_size + 1])
+    if len(page) <= page_size:
+        return page, None
+    page = page[:page_size]
+    return page, encode_cursor(page[-1])
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+
+def period_start(day, frequency):
+    """
+    Return the first day of the period that contains the given day.
+
+    Daily periods start on the day itself, weekly periods on the Monday of the
+    week and monthly periods on the first day of the month.
+
+    Args:
+        day (date): The day to look up.
+        frequency (str): The habit frequency ('daily', 'weekly' or 'monthly').
+
+    Returns:
+        date: The first day of the period containing ``day``.
+    """
+    if frequency == 'weekly':
+        return day - timedelta(days=day.weekday())
+    if frequency == 'monthly':
+        return day.replace(day=1)
+    return day
+
+
+def previous_period(start, frequency):
+    """
+    Return the start of the period directly before the given period.
+
+    Args:
+        start (date): The first day of a period.
+        frequency (str): The habit frequency ('daily', 'weekly' or 'monthly').
+
+    Returns:
+        date: The first day of the previous period.
+    """
+    if frequency == 'weekly':
+        return start - timedelta(weeks=1)
+    if frequency == 'monthly':
+        return (start.replace(day=1) - timedelta(days=1)).replace(day=1)
+    return start - timedelta(days=1)
+
+
+def next_period(start, frequency):
+    """
+    Return the start of the period directly after the given period.
+
+    Args:
+        start (date): The first day of a period.
+        frequency (str): The habit frequency ('daily', 'weekly' or 'monthly').
+
+    Returns:
+        date: The first day of the next period.
+    """
+    if frequency == 'weekly':
+        return start + timedelta(weeks=1)
+    if frequency == 'monthly':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def period_end(start, frequency):
+    """
+    Return the last day of the period starting at ``start``.
+
+    Args:
+        start (date): The first day of a period.
+        frequency (str): The habit frequency ('daily', 'weekly' or 'monthly').
+
+    Returns:
+        date: The last day of the period.
+    """
+    return next_period(start, frequency) - timedelta(days=1)
+
+
+def period_bounds(day, frequency):
+    """
+    Return the timezone-aware boundaries of the period containing ``day``.
+
+    Args:
+        day (date): A day within the period.
+        frequency (str): The habit frequency ('daily', 'weekly' or 'monthly').
+
+    Returns:
+        tuple: The start of the period and the start of the next period, as
+               aware datetimes in the current timezone.
+    """
+    start = period_start(day, frequency)
+    return (
+        timezone.make_aware(datetime.combine(start, datetime.min.time())),
+        timezone.make_aware(datetime.combine(next_period(start, frequency), datetime.min.time())),
+    )
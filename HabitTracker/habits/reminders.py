@@ -0,0 +1,272 @@
+import heapq
+import json
+import sys
+from datetime import datetime, time
+from itertools import groupby
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db.models import Case, DateTimeField, Exists, OuterRef, Value, When
+from django.db.models.functions import Coalesce, NullIf
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .periods import next_period, period_start
+
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+
+
+def period_bounds_in(zone, now, frequency):
+    """
+    Return the current period of a frequency in a timezone as UTC datetimes.
+
+    Args:
+        zone (str): The name of the timezone.
+        now (datetime): The current time.
+        frequency (str): 'daily', 'weekly' or 'monthly'.
+
+    Returns:
+        tuple: The start (inclusive) and end (exclusive) of the period.
+    """
+    tzinfo = ZoneInfo(zone)
+    start = period_start(timezone.localdate(now, tzinfo), frequency)
+    return datetime.combine(start, time.min, tzinfo), datetime.combine(next_period(start, frequency), time.min, tzinfo)
+
+
+class Digest:
+    """
+    The pending habits of one user.
+
+    Attributes:
+        user_id (int): The id of the user
+        username (str): The name of the user
+        email (str): The email address of the user (may be empty)
+        timezone (str): The timezone the periods were computed in
+        habits (list): ``(id, title, frequency)`` of each pending habit
+    """
+
+    def __init__(self, user_id, username, email, timezone, habits):
+        self.user_id = user_id
+        self.username = username
+        self.email = email
+        self.timezone = timezone
+        self.habits = habits
+
+    def as_dict(self):
+        """Return the digest as a JSON serialisable dictionary."""
+        return {
+            'user_id': self.user_id,
+            'username': self.username,
+            'email': self.email,
+            'timezone': self.timezone,
+            'habits': [{'id': pk, 'title': title, 'frequency': frequency} for pk, title, frequency in self.habits],
+        }
+
+    def as_text(self):
+        """Return the digest as a plain text message."""
+        lines = [f'Hi {self.username}, these habits are still open in the current period:']
+        lines += [f'- {title} ({frequency})' for _, title, frequency in self.habits]
+        return '\n'.join(lines)
+
+
+def user_timezones(hour=None, now=None):
+    """
+    Return the timezones of the users that reminders are sent to.
+
+    Users without a reminder preference, or without a timezone in it, are in
+    ``settings.TIME_ZONE``.
+
+    Args:
+        hour (int): Only return timezones in which it is currently this hour (optional).
+        now (datetime): The current time. Defaults to now.
+
+    Returns:
+        list: The names of the timezones.
+    """
+    from .models import ReminderPreference
+
+    now = now or timezone.now()
+    zones = set(ReminderPreference.objects.exclude(timezone='').values_list('timezone', flat=True).distinct())
+    zones.add(settings.TIME_ZONE)
+    return sorted(zone for zone in zones if hour is None or now.astimezone(ZoneInfo(zone)).hour == hour)
+
+
+def pending_habits(frequency, zones, now=None, chunk_size=2000):
+    """
+    Stream the habits of a frequency that are not completed in their current period.
+
+    The current period of every habit is computed in its owner's timezone and
+    the habits with a completion in it are excluded with one anti-join
+    (``NOT EXISTS``) on the completion time, so this is a single query
+    however many habits and users there are. Users who disabled reminders are
+    skipped.
+
+    Args:
+        frequency (str): 'daily', 'weekly' or 'monthly'.
+        zones (iterable): The timezones of the users to include.
+        now (datetime): The current time. Defaults to now.
+        chunk_size (int): The number of rows fetched from the database at once.
+
+    Returns:
+        iterator: ``(user_id, habit_id, title, frequency, username, email,
+                  timezone)`` tuples ordered by user and habit.
+    """
+    from .models import Habit, HabitCompletion
+
+    now = now or timezone.now()
+    zones = list(zones)
+    if not zones:
+        return iter(())
+    bounds = {zone: period_bounds_in(zone, now, frequency) for zone in zones}
+
+    def period(index):
+        return Case(
+            *[When(zone=zone, then=Value(bound[index])) for zone, bound in bounds.items()],
+            output_field=DateTimeField(),
+        )
+
+    completed = HabitCompletion.objects.filter(
+        habit=OuterRef('pk'),
+        completed_at__gte=OuterRef('period_from'),
+        completed_at__lt=OuterRef('period_to'),
+    )
+    habits = (
+        Habit.objects
+        .filter(frequency=frequency)
+        .exclude(user__reminder_preference__enabled=False)
+        .annotate(zone=Coalesce(NullIf('user__reminder_preference__timezone', Value('')), Value(settings.TIME_ZONE)))
+        .filter(zone__in=zones)
+        .annotate(period_from=period(0), period_to=period(1))
+        .filter(~Exists(completed))
+        .order_by('user_id', 'pk')
+        .values_list('user_id', 'pk', 'title', 'frequency', 'user__username', 'user__email', 'zone')
+    )
+    return habits.iterator(chunk_size=chunk_size)
+
+
+def pending_digests(hour=None, now=None, chunk_size=2000):
+    """
+    Group the pending habits of all frequencies into one digest per user.
+
+    The per-frequency streams are merged by user, so the habits are never
+    held in memory for more than one user at a time.
+
+    Args:
+        hour (int): Only include users in whose timezone it is currently this hour (optional).
+        now (datetime): The current time. Defaults to now.
+        chunk_size (int): The number of rows fetched from the database at once.
+
+    Yields:
+        Digest: The pending habits of a user, in order of user id.
+    """
+    now = now or timezone.now()
+    zones = user_timezones(hour, now)
+    streams = [pending_habits(frequency, zones, now, chunk_size) for frequency in FREQUENCIES]
+    merged = heapq.merge(*streams, key=lambda row: row[:2])
+    for user_id, rows in groupby(merged, key=lambda row: row[0]):
+        rows = list(rows)
+        username, email, zone = rows[0][4:]
+        yield Digest(user_id, username, email, zone, [row[1:4] for row in rows])
+
+
+class BaseNotifier:
+    """
+    Deliver reminder digests. Subclasses implement :meth:`send`.
+    """
+
+    def send(self, digest):
+        """
+        Deliver the digest of one user.
+
+        Args:
+            digest (Digest): The pending habits of the user.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Release any resources after the last digest was sent."""
+
+
+class ConsoleNotifier(BaseNotifier):
+    """
+    Write the digests as plain text to a stream, standard output by default.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def send(self, digest):
+        self.stream.write(f'To: {digest.email or digest.username}\n{digest.as_text()}\n\n')
+
+
+class FileNotifier(BaseNotifier):
+    """
+    Append the digests to a file as one JSON object per line.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def send(self, digest):
+        self.file.write(json.dumps(digest.as_dict()) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class EmailNotifier(BaseNotifier):
+    """
+    Email the digests with Django's email backend. Users without an email
+    address are skipped.
+    """
+
+    def __init__(self, subject='Your open habits', from_email=None):
+        self.subject = subject
+        self.from_email = from_email
+
+    def send(self, digest):
+        if digest.email:
+            send_mail(self.subject, digest.as_text(), self.from_email, [digest.email])
+
+
+def get_notifier(backend=None, **options):
+    """
+    Create the notifier configured with ``HABITS_REMINDER_NOTIFIER``.
+
+    Args:
+        backend (str): The dotted path of a notifier class, overriding the setting.
+        **options: Keyword arguments for the notifier. For the configured
+                   notifier they are merged over ``HABITS_REMINDER_NOTIFIER_OPTIONS``.
+
+    Returns:
+        BaseNotifier: The notifier.
+    """
+    if backend is None:
+        backend = getattr(settings, 'HABITS_REMINDER_NOTIFIER', 'habits.reminders.ConsoleNotifier')
+        options = {**getattr(settings, 'HABITS_REMINDER_NOTIFIER_OPTIONS', {}), **options}
+    return import_string(backend)(**options)
+
+
+def send_reminders(notifier, hour=None, now=None, chunk_size=2000):
+    """
+    Send a digest of their pending habits to every user who has any.
+
+    Args:
+        notifier (BaseNotifier): Delivers the digests.
+        hour (int): Only remind users in whose timezone it is currently this hour (optional).
+        now (datetime): The current time. Defaults to now.
+        chunk_size (int): The number of rows fetched from the database at once.
+
+    Returns:
+        tuple: The number of digests sent and of pending habits in them.
+    """
+    digests = habits = 0
+    try:
+        for digest in pending_digests(hour, now, chunk_size):
+            notifier.send(digest)
+            digests += 1
+            habits += len(digest.habits)
+    finally:
+        notifier.close()
+    return digests, habits
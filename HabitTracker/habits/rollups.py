@@ -0,0 +1,270 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, Count, DateField, F, FloatField, Max, Min, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .periods import next_period, period_end, period_start
+
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+
+
+def _success_rate(completed, due):
+    """Build the expression of the success rate in percent."""
+    return Case(
+        When(due_habits=0, then=Value(0.0)),
+        default=Cast(completed, FloatField()) * 100 / Cast(due, FloatField()),
+        output_field=FloatField(),
+    )
+
+
+def _period_bucket():
+    """Build the expression of the period key matching each habit's frequency."""
+    from .models import HabitCompletion
+
+    return Case(
+        *(
+            When(habit__frequency=frequency, then=F(key))
+            for frequency, key in HabitCompletion.PERIOD_KEYS.items()
+        ),
+        output_field=DateField(),
+    )
+
+
+def _add_completed_period(user_id, frequency, start, delta):
+    """
+    Count a habit period as completed (or no longer completed) on each of its days.
+
+    Args:
+        user_id (int): The id of the habit's owner.
+        frequency (str): The frequency of the habit.
+        start (date): The first day of the period.
+        delta (int): 1 if the period became completed, -1 if it no longer is.
+    """
+    from .models import Habit, UserDailyStats
+
+    end = period_end(start, frequency)
+    if delta > 0:
+        due = Habit.objects.filter(user_id=user_id).count()
+        UserDailyStats.objects.bulk_create(
+            [
+                UserDailyStats(user_id=user_id, day=start + timedelta(days=offset), due_habits=due)
+                for offset in range((end - start).days + 1)
+            ],
+            ignore_conflicts=True,
+        )
+    completed = F('completed_habits') + delta
+    UserDailyStats.objects.filter(user_id=user_id, day__gte=start, day__lte=end).update(
+        completed_habits=completed,
+        success_rate=_success_rate(completed, F('due_habits')),
+        **{f'{frequency}_completed': F(f'{frequency}_completed') + delta},
+    )
+
+
+def record_completion(habit, day):
+    """
+    Update the rollups for a new completion.
+
+    Args:
+        habit (Habit): The completed habit.
+        day (date): The local date of the completion.
+    """
+    from .models import HabitPeriodStats
+
+    start = period_start(day, habit.frequency)
+    with transaction.atomic():
+        stats, _ = HabitPeriodStats.objects.select_for_update().get_or_create(
+            habit=habit, period_start=start, defaults={'completions': 0}
+        )
+        HabitPeriodStats.objects.filter(pk=stats.pk).update(completions=F('completions') + 1)
+        if stats.completions == 0:
+            _add_completed_period(habit.user_id, habit.frequency, start, 1)
+
+
+def remove_completion(habit, day):
+    """
+    Update the rollups for a deleted completion.
+
+    Args:
+        habit (Habit): The habit of the deleted completion.
+        day (date): The local date of the deleted completion.
+    """
+    from .models import HabitPeriodStats
+
+    start = period_start(day, habit.frequency)
+    with transaction.atomic():
+        stats = HabitPeriodStats.objects.select_for_update().filter(habit=habit, period_start=start).first()
+        if stats is None:
+            return
+        if stats.completions > 1:
+            HabitPeriodStats.objects.filter(pk=stats.pk).update(completions=F('completions') - 1)
+        else:
+            stats.delete()
+            _add_completed_period(habit.user_id, habit.frequency, start, -1)
+
+
+def refresh_due_habits(user_id):
+    """
+    Update the number of due habits in all rollup rows of a user.
+
+    Every habit is due in each of its periods, so this is the user's current
+    number of habits.
+
+    Args:
+        user_id (int): The id of the user whose habits changed.
+    """
+    from .models import Habit, UserDailyStats
+
+    due = Habit.objects.filter(user_id=user_id).count()
+    UserDailyStats.objects.filter(user_id=user_id).update(
+        due_habits=due,
+        success_rate=_success_rate(F('completed_habits'), Value(due)),
+    )
+
+
+def rebuild_period_stats(habit_ids, start=None, end=None):
+    """
+    Rebuild the per-period completion counts of habits from their completions.
+
+    With a range of days only the periods overlapping it are rebuilt.
+
+    Args:
+        habit_ids (iterable): The ids of the habits to rebuild.
+        start (date): The first day of the range (optional).
+        end (date): The last day of the range (optional).
+    """
+    from .models import HabitCompletion, HabitPeriodStats
+
+    habit_ids = list(habit_ids)
+    periods = {}
+    if start is not None:
+        # The week or month of the first day may begin before it
+        periods['__gte'] = min(period_start(start, frequency) for frequency in FREQUENCIES)
+    if end is not None:
+        periods['__lte'] = end
+    counts = (
+        HabitCompletion.objects
+        .filter(habit_id__in=habit_ids)
+        .annotate(bucket=_period_bucket())
+        .filter(**{f'bucket{lookup}': day for lookup, day in periods.items()})
+        .values_list('habit_id', 'bucket')
+        .annotate(completions=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        HabitPeriodStats.objects.filter(
+            habit_id__in=habit_ids,
+            **{f'period_start{lookup}': day for lookup, day in periods.items()},
+        ).delete()
+        HabitPeriodStats.objects.bulk_create(
+            [
+                HabitPeriodStats(habit_id=habit_id, period_start=start, completions=completions)
+                for habit_id, start, completions in counts.iterator()
+            ],
+            batch_size=1000,
+        )
+
+
+def rebuild_daily_stats(user_ids, start=None, end=None):
+    """
+    Backfill or repair the rollups of users over a range of days.
+
+    The per-period counts of the users' habits in the range are rebuilt
+    first, then one daily row is written for every day of the range. Without
+    a range, the range covers all completed periods of each user.
+
+    Args:
+        user_ids (iterable): The ids of the users to rebuild.
+        start (date): The first day to rebuild (optional).
+        end (date): The last day to rebuild (optional).
+
+    Returns:
+        int: The number of daily rows written.
+    """
+    from .models import Habit, HabitPeriodStats, UserDailyStats
+
+    written = 0
+    for user_id in user_ids:
+        frequencies = dict(Habit.objects.filter(user_id=user_id).values_list('pk', 'frequency'))
+        rebuild_period_stats(frequencies, start, end)
+        periods = HabitPeriodStats.objects.filter(habit_id__in=list(frequencies))
+
+        first, last = start, end
+        if first is None or last is None:
+            bounds = periods.aggregate(first=Min('period_start'), last=Max('period_start'))
+            if bounds['first'] is None:
+                UserDailyStats.objects.filter(user_id=user_id).delete()
+                continue
+            first = first or bounds['first']
+            # The last period may be a week reaching into the next month
+            last = last or period_end(period_start(bounds['last'] + timedelta(days=6), 'monthly'), 'monthly')
+        periods = periods.filter(period_start__lte=last, period_start__gt=first - timedelta(days=31))
+
+        completed = defaultdict(lambda: dict.fromkeys(FREQUENCIES, 0))
+        for habit_id, period in periods.values_list('habit_id', 'period_start').iterator():
+            frequency = frequencies[habit_id]
+            day, following = max(period, first), next_period(period, frequency)
+            while day < following and day <= last:
+                completed[day][frequency] += 1
+                day += timedelta(days=1)
+
+        due = len(frequencies)
+        rows = []
+        day = first
+        while day <= last:
+            counts = completed.get(day, dict.fromkeys(FREQUENCIES, 0))
+            total = sum(counts.values())
+            rows.append(UserDailyStats(
+                user_id=user_id,
+                day=day,
+                due_habits=due,
+                completed_habits=total,
+                success_rate=total * 100 / due if due else 0.0,
+                **{f'{frequency}_completed': count for frequency, count in counts.items()},
+            ))
+            day += timedelta(days=1)
+        with transaction.atomic():
+            UserDailyStats.objects.filter(user_id=user_id, day__gte=first, day__lte=last).delete()
+            UserDailyStats.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+    return written
+
+
+def success_rate_series(user_id, days, today=None):
+    """
+    Read the daily success rate of a user's habits from the rollup.
+
+    A habit counts as successful on a day if it was completed in the period of
+    its frequency containing that day: on the day itself for daily habits, in
+    the same week for weekly habits and in the same month for monthly habits.
+    One small row is read per day instead of aggregating the completions.
+    Days without a row had no completed habits.
+
+    Args:
+        user_id (int): The id of the user.
+        days (int): The number of days in the window, ending today.
+        today (date): The last day of the window. Defaults to the current local date.
+
+    Returns:
+        tuple: A list of ISO formatted dates and a list of success rates in
+               percent, one entry per day of the window.
+    """
+    from .models import UserDailyStats
+
+    if today is None:
+        today = timezone.localdate()
+    first_day = today - timedelta(days=days - 1)
+    rows = {
+        day: (completed, due)
+        for day, completed, due in UserDailyStats.objects
+        .filter(user_id=user_id, day__gte=first_day, day__lte=today)
+        .values_list('day', 'completed_habits', 'due_habits')
+    }
+    dates = [first_day + timedelta(days=offset) for offset in range(days)]
+    success_rates = []
+    for day in dates:
+        completed, due = rows.get(day, (0, 0))
+        success_rates.append(round(completed / due * 100, 1) if due else 0.0)
+    return [day.strftime('%Y-%m-%d') for day in dates], success_rates
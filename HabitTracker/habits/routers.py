@@ -0,0 +1,155 @@
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_COOKIE = 'habits_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_replica_reads = ContextVar('habits_replica_reads', default=False)
+_primary_pinned = ContextVar('habits_primary_pinned', default=False)
+
+
+def replica_alias():
+    """
+    Return the database alias of the read replica.
+
+    The alias is configured with ``HABITS_REPLICA_DATABASE``. Returns None if
+    it is not set or not in ``DATABASES``.
+    """
+    alias = getattr(settings, 'HABITS_REPLICA_DATABASE', None)
+    return alias if alias in connections.settings else None
+
+
+class PrimaryReplicaRouter:
+    """
+    Route the reads of analytics views to the read replica.
+
+    Reads only go to the replica inside views decorated with
+    :func:`read_from_replica`, and only if the user has not written within
+    the sticky window (see :class:`StickyPrimaryMiddleware`) and no
+    transaction is open on the primary. Everything else, including all
+    writes, uses the primary. Migrations only run on the primary; the replica
+    is a copy of it.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = replica_alias()
+        if alias and _replica_reads.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def reads_from_replica():
+    """Return whether reads are currently routed to the read replica."""
+    return _replica_reads.get()
+
+
+@contextmanager
+def routed_reads(replica):
+    """
+    Route the reads within the block as captured with :func:`reads_from_replica`.
+
+    Used for work that runs after a view decorated with
+    :func:`read_from_replica` returned, e.g. in a streamed response.
+
+    Args:
+        replica (bool): Whether the reads go to the read replica.
+    """
+    token = _replica_reads.set(replica)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def read_from_replica(view_func):
+    """
+    Send the reads of a view to the read replica.
+
+    The replica may lag behind the primary, so only use this for views that
+    tolerate slightly stale data. Querysets that are evaluated after the view
+    returns, e.g. in a streamed response, must be bound with
+    ``queryset.using(queryset.db)`` inside the view, or the queries must run
+    within :func:`routed_reads`.
+    """
+    if iscoroutinefunction(view_func):
+        @functools.wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            token = _replica_reads.set(not _primary_pinned.get())
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+    else:
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            token = _replica_reads.set(not _primary_pinned.get())
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+    return wrapper
+
+
+class StickyPrimaryMiddleware:
+    """
+    Keep the reads of a user on the primary for a while after they write.
+
+    Every request with an unsafe method sets a cookie for
+    ``HABITS_REPLICA_STICKY_SECONDS``. While it is valid, views decorated with
+    :func:`read_from_replica` read from the primary, so users see their own
+    writes (e.g. on the page they are redirected to after completing a habit)
+    even if the replica lags behind.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _primary_pinned.set(self.is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _primary_pinned.reset(token)
+        return self.stick(request, response)
+
+    async def __acall__(self, request):
+        token = _primary_pinned.set(self.is_pinned(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _primary_pinned.reset(token)
+        return self.stick(request, response)
+
+    def is_pinned(self, request):
+        try:
+            return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def stick(self, request, response):
+        window = getattr(settings, 'HABITS_REPLICA_STICKY_SECONDS', 10)
+        if request.method not in SAFE_METHODS and window:
+            response.set_cookie(STICKY_COOKIE, f'{time.time() + window:.3f}', max_age=window, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,144 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .bitmaps import clear_day, set_day
+from .cache import bump_data_version
+from . import rollups
+from .models import Habit, HabitCompletion, deleting_in_batch
+from .tasks import enqueue
+
+
+def _deleted_directly(origin, model=HabitCompletion):
+    """
+    Return whether a delete originated from the model itself, not a cascade.
+
+    Batch deletes (see ``delete_in_batch()``) rebuild the derived data once
+    afterwards, so they count as cascades.
+    """
+    if deleting_in_batch():
+        return False
+    return isinstance(origin, model) or getattr(origin, 'model', None) is model
+
+
+@receiver(post_delete, sender=HabitCompletion)
+def update_streaks_on_completion_delete(sender, instance, origin=None, **kwargs):
+    """
+    Keep the stored streak counters in sync when a completion is deleted.
+
+    This runs for single deletes and queryset deletes from the admin. When the
+    completions are removed by a cascade from their habit or its user, the
+    counters are irrelevant and the update is skipped.
+
+    If other completions remain in the same period only the completion total
+    changes. Otherwise the period drops out of the streaks and the counters are
+    rebuilt from the remaining completions in the background.
+    """
+    if not _deleted_directly(origin):
+        return
+
+    habit = Habit.objects.filter(pk=instance.habit_id).first()
+    if habit is None:
+        return
+
+    key = HabitCompletion.period_key(habit.frequency)
+    period_still_completed = habit.completions.filter(**{key: getattr(instance, key)}).exists()
+    if period_still_completed and habit.total_completions > 0:
+        habit.total_completions -= 1
+        Habit.objects.filter(pk=habit.pk).update(total_completions=habit.total_completions)
+    else:
+        enqueue('rebuild_habit', habit.pk)
+
+
+@receiver(post_save, sender=HabitCompletion)
+def update_bitmap_on_completion_save(sender, instance, created, **kwargs):
+    """
+    Mark the day of a new completion in the habit's bitmap.
+
+    Edited completions are covered by the rebuild the completion queues itself.
+    """
+    if created:
+        set_day(instance.habit_id, instance.day)
+
+
+@receiver(post_delete, sender=HabitCompletion)
+def update_bitmap_on_completion_delete(sender, instance, origin=None, **kwargs):
+    """
+    Clear the day of a deleted completion unless another completion remains.
+
+    Cascading deletes remove the bitmaps together with the habit.
+    """
+    if not _deleted_directly(origin):
+        return
+    if not HabitCompletion.objects.filter(habit_id=instance.habit_id, day=instance.day).exists():
+        clear_day(instance.habit_id, instance.day)
+
+
+@receiver(post_save, sender=HabitCompletion)
+def update_rollups_on_completion_save(sender, instance, created, **kwargs):
+    """Count a new completion in the rollups of its habit and owner."""
+    if created:
+        rollups.record_completion(instance.habit, instance.day)
+    else:
+        # The completion may have moved to another period
+        enqueue('rebuild_rollups', instance.habit.user_id)
+
+
+@receiver(post_delete, sender=HabitCompletion)
+def update_rollups_on_completion_delete(sender, instance, origin=None, **kwargs):
+    """
+    Remove a deleted completion from the rollups.
+
+    Cascading deletes are covered by the delete signal of the habit itself.
+    """
+    if not _deleted_directly(origin):
+        return
+    habit = Habit.objects.filter(pk=instance.habit_id).first()
+    if habit is not None:
+        rollups.remove_completion(habit, instance.day)
+
+
+@receiver(post_save, sender=Habit)
+def update_rollups_on_habit_save(sender, instance, created, **kwargs):
+    """Count a new habit as due in the rollups of its owner."""
+    if created:
+        rollups.refresh_due_habits(instance.user_id)
+
+
+@receiver(post_delete, sender=Habit)
+def update_rollups_on_habit_delete(sender, instance, origin=None, **kwargs):
+    """
+    Rebuild the rollups of the owner of a deleted habit in the background.
+
+    When the habit is deleted together with its user the rollups go as well.
+    """
+    if _deleted_directly(origin, Habit):
+        enqueue('rebuild_rollups', instance.user_id)
+
+
+@receiver(post_save, sender=Habit)
+@receiver(post_delete, sender=Habit)
+def invalidate_analytics_on_habit_write(sender, instance, origin=None, **kwargs):
+    """
+    Invalidate the cached analytics of the habit's owner.
+
+    When the habit is deleted together with its user the data version goes as
+    well.
+    """
+    if kwargs.get('signal') is post_delete and not _deleted_directly(origin, Habit):
+        return
+    bump_data_version(instance.user_id)
+
+
+@receiver(post_save, sender=HabitCompletion)
+@receiver(post_delete, sender=HabitCompletion)
+def invalidate_analytics_on_completion_write(sender, instance, origin=None, **kwargs):
+    """
+    Invalidate the cached analytics of the owner of the completed habit.
+
+    Cascading deletes are covered by the delete signal of the habit itself.
+    """
+    if kwargs.get('signal') is post_delete and not _deleted_directly(origin):
+        return
+    user_id = Habit.objects.filter(pk=instance.habit_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        bump_data_version(user_id)
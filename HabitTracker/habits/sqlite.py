@@ -0,0 +1,65 @@
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+# Counts of the retried and failed writes, read by the contention benchmark
+write_stats = {'retries': 0, 'failures': 0}
+_stats_lock = threading.Lock()
+
+
+def is_lock_error(exc):
+    """Return whether a database error means SQLite could not get its lock in time."""
+    message = str(exc).lower()
+    return isinstance(exc, OperationalError) and ('database is locked' in message or 'database is busy' in message)
+
+
+def _count(outcome):
+    with _stats_lock:
+        write_stats[outcome] += 1
+
+
+def write_with_retries(func, *args, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Run a write transaction, retrying it while the database is locked.
+
+    SQLite allows one writer at a time. Writers wait for the lock for
+    ``busy_timeout`` milliseconds and fail with "database is locked" after
+    that. Such failures are retried up to ``HABITS_WRITE_RETRIES`` times with a
+    jittered, exponentially growing delay starting at
+    ``HABITS_WRITE_RETRY_DELAY`` seconds. ``func`` must run its writes in its
+    own transaction, so a failed attempt leaves nothing behind. Inside an
+    outer transaction the error is raised right away, since only the outer
+    transaction can be retried.
+
+    Args:
+        func (callable): Performs the write.
+        *args: Positional arguments for ``func``.
+        using (str): The database alias the write goes to.
+        **kwargs: Keyword arguments for ``func``.
+
+    Returns:
+        The return value of ``func``.
+
+    Raises:
+        OperationalError: If the database is still locked after the last retry.
+    """
+    retries = getattr(settings, 'HABITS_WRITE_RETRIES', 5)
+    delay = getattr(settings, 'HABITS_WRITE_RETRY_DELAY', 0.05)
+    for attempt in range(retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except OperationalError as exc:
+            if not is_lock_error(exc) or connections[using].in_atomic_block or attempt == retries:
+                if is_lock_error(exc):
+                    _count('failures')
+                raise
+            _count('retries')
+            wait = delay * 2 ** attempt * random.uniform(0.5, 1.5)
+            logger.info('Database locked, retrying write in %.3fs (attempt %d of %d)', wait, attempt + 1, retries)
+            time.sleep(wait)
@@ -0,0 +1,330 @@
+from datetime import date
+
+from django.db import connections, router
+from django.db.models import Count
+from django.utils import timezone
+
+from .periods import next_period, period_start, previous_period
+
+
+def completion_periods(habits):
+    """
+    Fetch the distinct completion periods for a group of habits in one query.
+
+    The completion days of all given habits are loaded with a single query and
+    folded into the periods of each habit's frequency, so that streaks can be
+    computed in memory afterwards.
+
+    Args:
+        habits (iterable): The habits to load completion periods for.
+
+    Returns:
+        dict: Maps each habit id to the set of period start dates in which the
+              habit was completed at least once.
+    """
+    from .models import HabitCompletion
+
+    frequencies = {habit.pk: habit.frequency for habit in habits}
+    periods = {habit_id: set() for habit_id in frequencies}
+    if not frequencies:
+        return periods
+
+    days = (
+        HabitCompletion.objects
+        .filter(habit_id__in=list(frequencies))
+        .values_list('habit_id', 'day')
+        .order_by()
+        .distinct()
+    )
+    for habit_id, day in days:
+        periods[habit_id].add(period_start(day, frequencies[habit_id]))
+    return periods
+
+
+def current_streak(periods, frequency, today=None):
+    """
+    Count the consecutive completed periods ending with the current period.
+
+    Args:
+        periods (set): Period start dates in which the habit was completed.
+        frequency (str): The habit frequency ('daily', 'weekly' or 'monthly').
+        today (date): The reference day. Defaults to the current local date.
+
+    Returns:
+        int: The length of the streak, or 0 if the current period is missing.
+    """
+    if today is None:
+        today = timezone.localdate()
+    streak = 0
+    current = period_start(today, frequency)
+    while current in periods:
+        streak += 1
+        current = previous_period(current, frequency)
+    return streak
+
+
+def current_streaks(habits, today=None):
+    """
+    Calculate the current streak of every given habit.
+
+    Only one query is issued for the completions regardless of how many habits
+    are passed in or how long their streaks are, see :func:`streak_summaries`.
+
+    Args:
+        habits (iterable): The habits to calculate streaks for.
+        today (date): The reference day. Defaults to the current local date.
+
+    Returns:
+        dict: Maps each habit id to its current streak.
+    """
+    summaries = streak_summaries(habits, today)
+    return {habit_id: summary['current_streak'] for habit_id, summary in summaries.items()}
+
+
+def longest_streak(periods, frequency):
+    """
+    Find the longest run of consecutive completed periods.
+
+    Args:
+        periods (set): Period start dates in which the habit was completed.
+        frequency (str): The habit frequency ('daily', 'weekly' or 'monthly').
+
+    Returns:
+        int: The length of the longest run, or 0 if there are no periods.
+    """
+    return streak_stats(periods, frequency)['longest_streak']
+
+
+def streak_stats(periods, frequency):
+    """
+    Calculate the stored streak counters for a set of completion periods.
+
+    Unlike :func:`current_streak`, the current streak returned here is the run
+    ending at the last completed period, independent of the present day. It is
+    the value kept in ``Habit.current_streak``.
+
+    Args:
+        periods (set): Period start dates in which the habit was completed.
+        frequency (str): The habit frequency ('daily', 'weekly' or 'monthly').
+
+    Returns:
+        dict: The ``current_streak``, ``longest_streak`` and
+              ``last_completed_period`` values for the habit.
+    """
+    longest = run = 0
+    previous = None
+    for start in sorted(periods):
+        if previous is not None and start == next_period(previous, frequency):
+            run += 1
+        else:
+            run = 1
+        longest = max(longest, run)
+        previous = start
+    return {
+        'current_streak': run,
+        'longest_streak': longest,
+        'last_completed_period': previous,
+    }
+
+
+def rebuild_streak_stats(habits):
+    """
+    Recalculate the stored streak counters of the given habits from scratch.
+
+    The completions of all habits are summarised with a single query and the
+    counters are written back with a single bulk update.
+
+    Args:
+        habits (iterable): The habits to rebuild. The instances are updated in
+                           place.
+
+    Returns:
+        int: The number of habits that were rebuilt.
+    """
+    from .models import Habit
+
+    habits = list(habits)
+    if not habits:
+        return 0
+
+    summaries = streak_summaries(habits)
+    for habit in habits:
+        summary = summaries[habit.pk]
+        habit.current_streak = summary['last_streak']
+        habit.longest_streak = summary['longest_streak']
+        habit.last_completed_period = summary['last_period']
+        habit.total_completions = summary['total_completions']
+
+    Habit.objects.bulk_update(habits, Habit.STREAK_FIELDS)
+    return len(habits)
+
+
+# Converts a period key into a sequential number per frequency, so that
+# consecutive periods differ by exactly one.
+PERIOD_ORDINAL_SQL = {
+    'sqlite': {
+        'daily': "CAST(julianday({period}) AS INTEGER)",
+        'weekly': "CAST(julianday({period}) AS INTEGER) / 7",
+        'monthly': "CAST(strftime('%%Y', {period}) AS INTEGER) * 12 + CAST(strftime('%%m', {period}) AS INTEGER)",
+    },
+    'postgresql': {
+        'daily': "({period} - DATE '1970-01-01')",
+        'weekly': "({period} - DATE '1970-01-01') / 7",
+        'monthly': "CAST(EXTRACT(YEAR FROM {period}) AS INTEGER) * 12 + CAST(EXTRACT(MONTH FROM {period}) AS INTEGER)",
+    },
+}
+
+STREAK_SUMMARY_SQL = """
+WITH periods AS (
+    SELECT c.habit_id AS habit_id, h.frequency AS frequency,
+           CASE h.frequency WHEN 'weekly' THEN c.iso_week WHEN 'monthly' THEN c.month ELSE c.day END AS period,
+           COUNT(*) AS completions
+    FROM {completion_table} c
+    INNER JOIN {habit_table} h ON h.id = c.habit_id
+    WHERE {condition}
+    GROUP BY c.habit_id, h.frequency, CASE h.frequency WHEN 'weekly' THEN c.iso_week WHEN 'monthly' THEN c.month ELSE c.day END
+),
+islands AS (
+    SELECT habit_id, frequency, period, completions,
+           CASE frequency WHEN 'weekly' THEN {weekly} WHEN 'monthly' THEN {monthly} ELSE {daily} END
+           - ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY period) AS island
+    FROM periods
+),
+runs AS (
+    SELECT habit_id, frequency, MIN(period) AS start_period, MAX(period) AS end_period,
+           COUNT(*) AS length, SUM(completions) AS completions
+    FROM islands
+    GROUP BY habit_id, frequency, island
+),
+ranked AS (
+    SELECT habit_id, frequency, start_period, end_period, length,
+           ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY length DESC, end_period DESC) AS longest_rank,
+           ROW_NUMBER() OVER (PARTITION BY habit_id ORDER BY end_period DESC) AS recent_rank,
+           SUM(completions) OVER (PARTITION BY habit_id) AS total_completions
+    FROM runs
+)
+SELECT habit_id, frequency, start_period, end_period, length, longest_rank, recent_rank, total_completions
+FROM ranked
+WHERE longest_rank = 1 OR recent_rank = 1
+"""
+
+
+def streak_summaries(habits, today=None):
+    """
+    Summarise the streaks of a group of habits in a single database query.
+
+    The streaks are found inside the database with the gaps-and-islands
+    technique: the distinct completion periods of each habit are numbered with
+    ``ROW_NUMBER`` and consecutive periods share the difference between their
+    period ordinal and row number. Only the longest and the most recent run
+    of each habit are returned, so no completion rows are loaded into Python.
+
+    SQLite and PostgreSQL are supported. On other databases the periods are
+    loaded with :func:`completion_periods` and the runs are found in memory.
+
+    Args:
+        habits (iterable): The habits to summarise.
+        today (date): The reference day for the current streak. Defaults to the
+                      current local date.
+
+    Returns:
+        dict: Maps each habit id to a dictionary with the ``longest_streak``,
+              its ``longest_start`` and ``longest_end`` periods, the
+              ``current_streak`` up to the present period, the ``last_streak``
+              ending at the ``last_period`` and the ``total_completions``.
+    """
+    from .models import Habit, HabitCompletion
+
+    if today is None:
+        today = timezone.localdate()
+    habits = list(habits)
+    summaries = {
+        habit.pk: {
+            'longest_streak': 0,
+            'longest_start': None,
+            'longest_end': None,
+            'current_streak': 0,
+            'last_streak': 0,
+            'last_period': None,
+            'total_completions': 0,
+        }
+        for habit in habits
+    }
+    if not habits:
+        return summaries
+
+    connection = connections[router.db_for_read(HabitCompletion)]
+    if connection.vendor not in PERIOD_ORDINAL_SQL:
+        return _summaries_in_memory(habits, summaries, today)
+
+    ordinals = {
+        frequency: expression.format(period='period')
+        for frequency, expression in PERIOD_ORDINAL_SQL[connection.vendor].items()
+    }
+    sql = STREAK_SUMMARY_SQL.format(
+        completion_table=connection.ops.quote_name(HabitCompletion._meta.db_table),
+        habit_table=connection.ops.quote_name(Habit._meta.db_table),
+        condition='c.habit_id IN ({})'.format(', '.join(['%s'] * len(habits))),
+        **ordinals,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [habit.pk for habit in habits])
+        rows = cursor.fetchall()
+
+    for habit_id, frequency, start, end, length, longest_rank, recent_rank, total in rows:
+        summary = summaries[habit_id]
+        start, end = _to_date(start), _to_date(end)
+        summary['total_completions'] = int(total)
+        if longest_rank == 1:
+            summary['longest_streak'] = length
+            summary['longest_start'] = start
+            summary['longest_end'] = end
+        if recent_rank == 1:
+            summary['last_streak'] = length
+            summary['last_period'] = end
+            if end == period_start(today, frequency):
+                summary['current_streak'] = length
+    return summaries
+
+
+def _summaries_in_memory(habits, summaries, today):
+    from .models import HabitCompletion
+
+    periods = completion_periods(habits)
+    totals = dict(
+        HabitCompletion.objects
+        .filter(habit_id__in=list(periods))
+        .values_list('habit_id')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    for habit in habits:
+        stats = streak_stats(periods[habit.pk], habit.frequency)
+        summary = summaries[habit.pk]
+        summary['current_streak'] = current_streak(periods[habit.pk], habit.frequency, today)
+        summary['last_streak'] = stats['current_streak']
+        summary['last_period'] = stats['last_completed_period']
+        summary['longest_streak'] = stats['longest_streak']
+        summary['total_completions'] = totals.get(habit.pk, 0)
+        summary['longest_start'], summary['longest_end'] = _longest_run_bounds(periods[habit.pk], habit.frequency)
+    return summaries
+
+
+def _longest_run_bounds(periods, frequency):
+    best = (0, None, None)
+    run_start = previous = None
+    run = 0
+    for start in sorted(periods):
+        if previous is not None and start == next_period(previous, frequency):
+            run += 1
+        else:
+            run, run_start = 1, start
+        if run >= best[0]:
+            best = (run, run_start, start)
+        previous = start
+    return best[1], best[2]
+
+
+def _to_date(value):
+    # SQLite returns dates from raw queries as ISO formatted strings
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
@@ -0,0 +1,217 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+_executor = None
+_scheduled = set()
+_lock = threading.Lock()
+
+
+def task(func):
+    """
+    Register a function as a task that can be queued with :func:`enqueue`.
+
+    Tasks are called with a single integer key, e.g. the id of a habit, and
+    must be idempotent: repeated requests for the same key are coalesced into
+    one run and failed runs are retried by ``manage.py drain_tasks``.
+    """
+    TASKS[func.__name__] = func
+    return func
+
+
+@task
+def rebuild_habit(habit_id):
+    """Rebuild the streak counters and bitmaps of a habit from its completions."""
+    from .bitmaps import rebuild_bitmaps
+    from .cache import bump_data_version
+    from .models import Habit
+    from .streaks import rebuild_streak_stats
+
+    habit = Habit.objects.filter(pk=habit_id).first()
+    if habit is None:
+        return
+    rebuild_streak_stats([habit])
+    rebuild_bitmaps([habit.pk])
+    bump_data_version(habit.user_id)
+
+
+@task
+def rebuild_rollups(user_id):
+    """Rebuild the period and daily rollups of a user."""
+    from .cache import bump_data_version
+    from .rollups import rebuild_daily_stats
+
+    rebuild_daily_stats([user_id])
+    bump_data_version(user_id)
+
+
+def enqueue(name, key):
+    """
+    Queue a task to run outside the request/response cycle.
+
+    The task is recorded in the ``QueuedTask`` table within the current
+    transaction, so it survives restarts, and a pending row for the same task
+    and key absorbs the request. How the task is run is configured with
+    ``HABITS_TASKS_MODE``:
+
+    - ``thread``: on a pool of ``HABITS_TASK_WORKERS`` threads once the
+      current transaction commits.
+    - ``immediate``: right away in the calling thread, e.g. in tests.
+    - ``queue``: only by ``manage.py drain_tasks``.
+
+    Args:
+        name (str): The name of a registered task.
+        key (int): The key passed to the task.
+
+    Raises:
+        ValueError: If no task with that name is registered.
+    """
+    from .models import QueuedTask
+
+    if name not in TASKS:
+        raise ValueError(f'Unknown task {name!r}.')
+    # A task that failed gets a fresh set of attempts. A task that is running
+    # keeps its claim, so no other worker starts it, and runs once more when
+    # the current run finishes.
+    pending = QueuedTask.objects.filter(name=name, key=key)
+    if not (
+        pending.filter(claimed_at__isnull=True).update(attempts=0, last_error='')
+        or pending.filter(claimed_at__isnull=False).update(rerun=True)
+    ):
+        QueuedTask.objects.bulk_create([QueuedTask(name=name, key=key)], ignore_conflicts=True)
+
+    mode = getattr(settings, 'HABITS_TASKS_MODE', 'thread')
+    if mode == 'immediate':
+        run_task(name, key)
+    elif mode == 'thread':
+        transaction.on_commit(lambda: _dispatch(name, key))
+
+
+def run_task(name, key):
+    """
+    Claim and run a queued task.
+
+    The row is claimed so no other worker runs the task at the same time;
+    claims older than ``HABITS_TASK_CLAIM_TIMEOUT`` seconds are considered
+    abandoned, e.g. by a crashed process. The row is deleted when the task
+    succeeds, unless the task was queued again while it ran; then the row is
+    released to run once more. If the task fails, the error is recorded and
+    the row stays queued for the next drain.
+
+    Args:
+        name (str): The name of the task.
+        key (int): The key passed to the task.
+
+    Returns:
+        bool: Whether the task was claimed and succeeded.
+    """
+    from .models import QueuedTask
+
+    now = timezone.now()
+    abandoned = now - timedelta(seconds=getattr(settings, 'HABITS_TASK_CLAIM_TIMEOUT', 600))
+    pending = QueuedTask.objects.filter(name=name, key=key)
+    if not pending.filter(Q(claimed_at__isnull=True) | Q(claimed_at__lt=abandoned)).update(claimed_at=now):
+        return False
+    claimed = pending.filter(claimed_at=now)
+
+    try:
+        TASKS[name](key)
+    except Exception as exc:
+        logger.exception('Task %s(%s) failed', name, key)
+        claimed.update(claimed_at=None, attempts=F('attempts') + 1, last_error=repr(exc), rerun=False)
+        return False
+    with transaction.atomic():
+        if not claimed.filter(rerun=False).delete()[0]:
+            claimed.update(claimed_at=None, rerun=False)
+    return True
+
+
+def _dispatch(name, key):
+    """Submit a task to the worker pool unless it is already waiting there."""
+    global _executor
+
+    with _lock:
+        if (name, key) in _scheduled:
+            return
+        _scheduled.add((name, key))
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'HABITS_TASK_WORKERS', 2),
+                thread_name_prefix='habits-tasks',
+            )
+    _executor.submit(_work, name, key)
+
+
+def _work(name, key):
+    """Run a task on a worker thread until no new request for it is pending."""
+    from .models import QueuedTask
+
+    try:
+        while run_task(name, key):
+            pass
+    finally:
+        with _lock:
+            _scheduled.discard((name, key))
+        requeued = QueuedTask.objects.filter(name=name, key=key, claimed_at__isnull=True, attempts=0).exists()
+        connections.close_all()
+    if requeued:
+        _dispatch(name, key)
+
+
+def wait_for_tasks():
+    """
+    Wait until the worker pool has finished all submitted tasks.
+
+    The pool is shut down and recreated on the next dispatch. Used by the
+    tests and before the process exits.
+    """
+    global _executor
+
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def drain(limit=None, names=None):
+    """
+    Run the queued tasks in the order they were queued.
+
+    Tasks that failed ``HABITS_TASK_MAX_ATTEMPTS`` times are skipped.
+
+    Args:
+        limit (int): The maximum number of tasks to run (optional).
+        names (iterable): Only run tasks with these names (optional).
+
+    Returns:
+        tuple: The number of tasks that succeeded and that failed.
+    """
+    from .models import QueuedTask
+
+    queued = QueuedTask.objects.filter(attempts__lt=getattr(settings, 'HABITS_TASK_MAX_ATTEMPTS', 5))
+    if names:
+        queued = queued.filter(name__in=names)
+    queued = queued.order_by('created_at', 'pk').values_list('name', 'key')
+    if limit is not None:
+        queued = queued[:limit]
+
+    succeeded = failed = 0
+    for name, key in list(queued):
+        if name not in TASKS:
+            logger.warning('Skipping unknown task %s(%s)', name, key)
+            continue
+        if run_task(name, key):
+            succeeded += 1
+        elif QueuedTask.objects.filter(name=name, key=key, attempts__gt=0, claimed_at__isnull=True).exists():
+            failed += 1
+    return succeeded, failed
@@ -1,9 +1,40 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.utils import timezone
-from datetime import timedelta
-from .models import Habit, HabitCompletion
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from asgiref.sync import sync_to_async
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from io import StringIO
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+import csv
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+from .models import (
+    CompletionBatch, Habit, HabitCompletion, HabitPeriodStats, HabitYearBitmap, QueuedTask, ReminderPreference, UserDailyStats,
+    UserDataVersion,
+)
+from .dashboard import DASHBOARD_PANELS
+from .streaks import _summaries_in_memory, streak_summaries
+from .analytics import CompletionArrays, completion_patterns, rolling_mean
+from .bitmaps import daily_streak, heatmap, is_completed_on, load_bitmaps, rebuild_bitmaps
+from .benchmarks import compare, generate_dataset, measure, run_benchmarks
+from .instrumentation import QueryBudgetExceeded, QueryBudgetTestMixin
+from .routers import routed_reads
+from . import rollups
+from . import cache, tasks, views
+from .reminders import pending_digests
+from .sqlite import write_with_retries
 
 class HabitManagementTests(TestCase):
     def setUp(self):
@@ -51,6 +82,7 @@ class HabitManagementTests(TestCase):
 class AnalyticsTests(TestCase):
     def setUp(self):
         """Set up test data for analytics."""
+        cache.get_cache().clear()
         self.client = Client()
         self.user = User.objects.create_user(username='testuser', password='testpass123')
         self.client.login(username='testuser', password='testpass123')
@@ -118,6 +150,42 @@ class AnalyticsTests(TestCase):
         # Check the longest streak
         self.assertEqual(self.daily_habit.get_longest_streak(), 6)
 
+    def test_current_streak_spans_many_periods(self):
+        """Test that long streaks are counted across period boundaries."""
+        today = timezone.now()
+        for i in range(1, 40):
+            HabitCompletion.objects.create(
+                habit=self.daily_habit,
+                completed_at=today - timedelta(days=i)
+            )
+        for i in range(1, 5):
+            HabitCompletion.objects.create(
+                habit=self.monthly_habit,
+                completed_at=today.replace(day=1) - timedelta(days=1 + 31 * (i - 1))
+            )
+
+        self.assertEqual(self.daily_habit.get_current_streak(), 40)
+        self.assertEqual(self.monthly_habit.get_current_streak(), 5)
+
+    def test_analysis_dashboard_query_count_is_constant(self):
+        """Test that the dashboard query count does not grow with streak length."""
+        self.client.get(reverse('habits:analysis'))
+        cache.get_cache().clear()
+        with CaptureQueriesContext(connection) as short_history:
+            self.client.get(reverse('habits:analysis'))
+
+        today = timezone.now()
+        for i in range(1, 30):
+            HabitCompletion.objects.create(
+                habit=self.daily_habit,
+                completed_at=today - timedelta(days=i)
+            )
+        cache.get_cache().clear()
+        with CaptureQueriesContext(connection) as long_history:
+            self.client.get(reverse('habits:analysis'))
+
+        self.assertEqual(len(short_history), len(long_history))
+
     def test_is_completed_in_current_period(self):
         """Test checking if a habit is completed in its current period."""
         # Test daily habit
@@ -129,6 +197,23 @@ class AnalyticsTests(TestCase):
         # Test monthly habit
         self.assertTrue(self.monthly_habit.is_completed_in_current_period())
 
+    def test_habit_list_completion_status(self):
+        """Test the annotated completion status on the habit list."""
+        pending = Habit.objects.create(user=self.user, title='Pending Habit', frequency='weekly')
+        HabitCompletion.objects.create(habit=pending, completed_at=timezone.now() - timedelta(weeks=1))
+
+        habits = Habit.objects.filter(user=self.user).with_completion_status()
+        for habit in habits:
+            self.assertEqual(habit.completed_this_period, habit.is_completed_in_current_period())
+        self.assertFalse(habits.get(pk=pending.pk).completed_this_period)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('habits:habit_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Pending')
+        habit_queries = [q for q in queries if 'habits_habit' in q['sql']]
+        self.assertEqual(len(habit_queries), 1)
+
     def test_analysis_dashboard_view(self):
         """Test the analysis dashboard view."""
         response = self.client.get(reverse('habits:analysis'))
@@ -158,3 +243,1252 @@ class AnalyticsTests(TestCase):
         success_rates = response.context['success_rates']
         self.assertIsNotNone(success_rates)
         self.assertTrue(len(success_rates) > 0)
+
+    def test_success_rate_window(self):
+        """Test the success rate series for a selectable window."""
+        response = self.client.get(reverse('habits:analysis'), {'days': 30})
+        self.assertEqual(response.context['window'], 30)
+        success_rates = json.loads(response.context['success_rates'])
+        self.assertEqual(len(success_rates), 30)
+        self.assertEqual(len(json.loads(response.context['dates'])), 30)
+        # All habits were completed in their current period today
+        self.assertEqual(success_rates[-1], 100.0)
+
+        response = self.client.get(reverse('habits:analysis'), {'days': 12})
+        self.assertEqual(response.context['window'], 7)
+
+    def test_success_rate_follows_frequency_rules(self):
+        """Test that weekly and monthly completions count for their whole period."""
+        today = timezone.localdate()
+        dates, success_rates = rollups.success_rate_series(self.user.pk, days=7, today=today)
+        for day, rate in zip(dates, success_rates):
+            day = date.fromisoformat(day)
+            expected = 0
+            if day == today:
+                expected += 1
+            if day - timedelta(days=day.weekday()) == today - timedelta(days=today.weekday()):
+                expected += 1
+            if (day.year, day.month) == (today.year, today.month):
+                expected += 1
+            self.assertEqual(rate, round(expected / 3 * 100, 1))
+
+
+@override_settings(HABITS_TASKS_MODE='immediate')
+class StreakCounterTests(TestCase):
+    def setUp(self):
+        """Set up a daily habit with a three day streak."""
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.habit = Habit.objects.create(user=self.user, title='Read', frequency='daily')
+        self.now = timezone.now()
+        for i in range(2, -1, -1):
+            HabitCompletion.objects.create(habit=self.habit, completed_at=self.now - timedelta(days=i))
+
+    def test_counters_follow_new_completions(self):
+        """Test that saving completions updates the stored counters."""
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.current_streak, 3)
+        self.assertEqual(self.habit.longest_streak, 3)
+        self.assertEqual(self.habit.total_completions, 3)
+        self.assertEqual(self.habit.last_completed_period, timezone.localdate(self.now))
+        self.assertEqual(self.habit.active_streak, self.habit.get_current_streak())
+
+    def test_backfilled_completion_joins_streaks(self):
+        """Test that a completion in an older period rebuilds the counters."""
+        HabitCompletion.objects.create(habit=self.habit, completed_at=self.now - timedelta(days=4))
+        HabitCompletion.objects.create(habit=self.habit, completed_at=self.now - timedelta(days=3))
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.current_streak, 5)
+        self.assertEqual(self.habit.longest_streak, 5)
+        self.assertEqual(self.habit.total_completions, 5)
+
+    def test_delete_updates_counters(self):
+        """Test that deleting a completion breaks the stored streak."""
+        self.habit.completions.filter(completed_at__date=timezone.localdate(self.now - timedelta(days=1))).delete()
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.current_streak, 1)
+        self.assertEqual(self.habit.longest_streak, 1)
+        self.assertEqual(self.habit.total_completions, 2)
+
+    def test_frequency_change_rebuilds_counters(self):
+        """Test that editing the frequency recalculates the streaks."""
+        self.client.post(reverse('habits:habit_edit', args=[self.habit.pk]), {
+            'title': 'Read',
+            'description': '',
+            'frequency': 'monthly'
+        })
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.total_completions, 3)
+        self.assertEqual(self.habit.longest_streak, self.habit.get_longest_streak())
+        self.assertIn(self.habit.current_streak, (1, 2))
+
+    def test_rebuild_command(self):
+        """Test that the rebuild command restores corrupted counters."""
+        Habit.objects.filter(pk=self.habit.pk).update(current_streak=0, longest_streak=0, total_completions=0)
+        version = cache.get_data_version(self.user.pk)
+        call_command('rebuild_habit_stats', stdout=StringIO())
+        self.assertGreater(cache.get_data_version(self.user.pk), version)
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.current_streak, 3)
+        self.assertEqual(self.habit.longest_streak, 3)
+        self.assertEqual(self.habit.total_completions, 3)
+
+
+@override_settings(HABITS_TASKS_MODE='immediate')
+class AnalyticsCacheTests(TestCase):
+    def setUp(self):
+        """Set up a user with one completed habit."""
+        cache.get_cache().clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.habit = Habit.objects.create(user=self.user, title='Run', frequency='daily')
+        HabitCompletion.objects.create(habit=self.habit)
+
+    def test_dashboard_is_served_from_cache(self):
+        """Test that repeated dashboard requests hit the cache."""
+        response = self.client.get(reverse('habits:analysis'))
+        self.assertEqual(response['X-Analytics-Cache'], 'miss')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('habits:analysis'))
+        self.assertEqual(response['X-Analytics-Cache'], 'hit')
+        self.assertFalse([q for q in queries if 'habits_habitcompletion' in q['sql']])
+        self.assertEqual(cache.cache_stats(), {'hits': 6, 'misses': 6})
+
+    def test_writes_invalidate_cache(self):
+        """Test that habit and completion writes invalidate the cached sections."""
+        self.client.get(reverse('habits:analysis'))
+        HabitCompletion.objects.create(habit=self.habit, completed_at=timezone.now() - timedelta(days=1))
+        response = self.client.get(reverse('habits:analysis'))
+        self.assertEqual(response['X-Analytics-Cache'], 'miss')
+        self.assertEqual(response.context['habit_timespans'][0]['timespan'], 2)
+
+        self.habit.completions.all().delete()
+        response = self.client.get(reverse('habits:analysis'))
+        self.assertEqual(response['X-Analytics-Cache'], 'miss')
+        self.assertEqual(response.context['habit_timespans'][0]['timespan'], 0)
+
+        self.habit.delete()
+        response = self.client.get(reverse('habits:analysis'))
+        self.assertEqual(response.context['habit_timespans'], [])
+
+    def test_data_version_is_shared(self):
+        """Test that the data version lives in the database, not in the cache of one process."""
+        version = cache.get_data_version(self.user.pk)
+        cache.get_cache().clear()
+        self.assertEqual(cache.get_data_version(self.user.pk), version)
+        # A bump by another process is a plain database update
+        UserDataVersion.objects.filter(user=self.user).update(version=F('version') + 1)
+        self.assertEqual(cache.get_data_version(self.user.pk), version + 1)
+
+        self.user.delete()
+        self.assertFalse(UserDataVersion.objects.exists())
+
+
+class PeriodKeyTests(TestCase):
+    def setUp(self):
+        """Set up a weekly habit."""
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.habit = Habit.objects.create(user=self.user, title='Clean', frequency='weekly')
+
+    def test_period_keys_are_filled_on_save(self):
+        """Test that the period keys are derived from completed_at."""
+        completion = HabitCompletion.objects.create(
+            habit=self.habit,
+            completed_at=timezone.make_aware(datetime(2024, 3, 7, 10, 30))
+        )
+        completion.refresh_from_db()
+        self.assertEqual(completion.day, date(2024, 3, 7))
+        self.assertEqual(completion.iso_week, date(2024, 3, 4))
+        self.assertEqual(completion.month, date(2024, 3, 1))
+
+    def test_multiple_completions_per_period_allowed_by_default(self):
+        """Test that a second completion in a period is accepted by default."""
+        HabitCompletion.objects.create(habit=self.habit)
+        response = self.client.post(reverse('habits:habit_complete', args=[self.habit.pk]), {'notes': ''})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.habit.completions.count(), 2)
+
+    @override_settings(HABITS_ONE_COMPLETION_PER_PERIOD=True)
+    def test_one_completion_per_period(self):
+        """Test that a second completion in a period is rejected when configured."""
+        HabitCompletion.objects.create(habit=self.habit)
+        response = self.client.post(reverse('habits:habit_complete', args=[self.habit.pk]), {'notes': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'already completed for the current weekly period')
+        self.assertEqual(self.habit.completions.count(), 1)
+
+
+class StreakSummaryTests(TestCase):
+    def setUp(self):
+        """Set up habits with streaks separated by gaps."""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.today = timezone.localdate()
+        self.daily = Habit.objects.create(user=self.user, title='Daily', frequency='daily')
+        self.monthly = Habit.objects.create(user=self.user, title='Monthly', frequency='monthly')
+        # Daily: a run of 4 ending 10 days ago and a current run of 2
+        for minute, offset in enumerate([13, 12, 11, 10, 1, 0, 0]):
+            self.complete(self.daily, self.today - timedelta(days=offset), minute)
+        # Monthly: January to April 2023, across months of different lengths
+        for month in range(1, 5):
+            self.complete(self.monthly, date(2023, month, 28 if month == 2 else 31 if month in (1, 3) else 30))
+
+    def complete(self, habit, day, minute=0):
+        HabitCompletion.objects.create(
+            habit=habit,
+            completed_at=timezone.make_aware(datetime.combine(day, datetime.min.time())) + timedelta(minutes=minute)
+        )
+
+    def test_longest_and_current_streak(self):
+        """Test the streak summary computed in the database."""
+        summary = streak_summaries([self.daily], today=self.today)[self.daily.pk]
+        self.assertEqual(summary['longest_streak'], 4)
+        self.assertEqual(summary['longest_start'], self.today - timedelta(days=13))
+        self.assertEqual(summary['longest_end'], self.today - timedelta(days=10))
+        self.assertEqual(summary['current_streak'], 2)
+        self.assertEqual(summary['last_period'], self.today)
+        self.assertEqual(summary['total_completions'], 7)
+        self.assertEqual(self.daily.get_longest_streak(), 4)
+
+    def test_monthly_streak_across_month_lengths(self):
+        """Test that monthly streaks follow calendar months."""
+        summary = streak_summaries([self.monthly], today=self.today)[self.monthly.pk]
+        self.assertEqual(summary['longest_streak'], 4)
+        self.assertEqual(summary['longest_start'], date(2023, 1, 1))
+        self.assertEqual(summary['longest_end'], date(2023, 4, 1))
+        self.assertEqual(summary['current_streak'], 0)
+
+    def test_matches_in_memory_calculation(self):
+        """Test that the SQL and in-memory implementations agree."""
+        habits = list(Habit.objects.filter(user=self.user))
+        empty = {habit.pk: {} for habit in habits}
+        self.assertEqual(
+            streak_summaries(habits, today=self.today),
+            _summaries_in_memory(habits, empty, self.today)
+        )
+
+
+@override_settings(HABITS_TASKS_MODE='immediate')
+class BulkCompletionTests(TestCase):
+    def setUp(self):
+        """Set up a user with two habits and a habit of another user."""
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.daily = Habit.objects.create(user=self.user, title='Daily', frequency='daily')
+        self.weekly = Habit.objects.create(user=self.user, title='Weekly', frequency='weekly')
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.foreign = Habit.objects.create(user=other, title='Foreign', frequency='daily')
+        self.now = timezone.now().replace(microsecond=0)
+
+    def post(self, payload):
+        return self.client.post(
+            reverse('habits:habit_complete_bulk'), json.dumps(payload), content_type='application/json'
+        )
+
+    def test_bulk_records_completions(self):
+        """Test that a batch records completions and reports per-item results."""
+        HabitCompletion.objects.create(habit=self.daily, completed_at=self.now)
+        response = self.post({'completions': [
+            {'habit_id': self.daily.pk, 'completed_at': (self.now - timedelta(days=1)).isoformat(), 'notes': 'offline'},
+            {'habit_id': self.daily.pk, 'completed_at': self.now.isoformat()},
+            {'habit_id': self.weekly.pk, 'completed_at': self.now.isoformat()},
+            {'habit_id': self.foreign.pk, 'completed_at': self.now.isoformat()},
+            {'habit_id': 'x'},
+            {'habit_id': self.daily.pk, 'completed_at': '2024-02-30T10:00:00'},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(
+            [result['status'] for result in body['results']],
+            ['created', 'duplicate', 'created', 'error', 'error', 'error']
+        )
+        self.assertEqual(body['created'], 2)
+        self.assertTrue(body['idempotency_key'])
+        self.assertEqual(self.foreign.completions.count(), 0)
+        self.daily.refresh_from_db()
+        self.assertEqual(self.daily.total_completions, 2)
+        self.assertEqual(self.daily.current_streak, 2)
+        self.assertEqual(HabitCompletion.objects.get(notes='offline').day, timezone.localdate(self.now - timedelta(days=1)))
+
+    def test_retry_with_idempotency_key(self):
+        """Test that a retried batch does not record completions twice."""
+        payload = {'idempotency_key': 'batch-1', 'completions': [
+            {'habit_id': self.daily.pk, 'completed_at': self.now.isoformat()},
+        ]}
+        first = self.post(payload)
+        HabitCompletion.objects.all().delete()
+        retry = self.post(payload)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(HabitCompletion.objects.count(), 0)
+        self.assertEqual(CompletionBatch.objects.count(), 1)
+
+    def test_malformed_request(self):
+        """Test that malformed requests are rejected."""
+        response = self.client.post(reverse('habits:habit_complete_bulk'), 'nope', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        """Set up a weekly habit with two streaks."""
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.habit = Habit.objects.create(user=self.user, title='Weekly', frequency='weekly')
+        for day in [date(2024, 1, 1), date(2024, 1, 3), date(2024, 1, 8), date(2024, 1, 22)]:
+            HabitCompletion.objects.create(
+                habit=self.habit,
+                completed_at=timezone.make_aware(datetime.combine(day, datetime.min.time()))
+            )
+        other = User.objects.create_user(username='other', password='testpass123')
+        HabitCompletion.objects.create(habit=Habit.objects.create(user=other, title='Other'))
+
+    def test_csv_export(self):
+        """Test the streamed CSV export of all completions of the user."""
+        response = self.client.get(reverse('habits:export'))
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual([row['streak'] for row in rows], ['1', '1', '2', '1'])
+        self.assertEqual(rows[2]['period'], '2024-01-08')
+        self.assertEqual(rows[2]['streak_start'], '2024-01-01')
+        self.assertEqual(rows[3]['month'], '2024-01-01')
+
+    def test_ndjson_export_of_habit(self):
+        """Test the streamed NDJSON export of a single habit."""
+        response = self.client.get(reverse('habits:habit_export', args=[self.habit.pk]), {'format': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0]['iso_week'], '2024-01-01')
+        self.assertEqual(rows[-1]['streak'], 1)
+
+
+class ImportCompletionsTests(TestCase):
+    def setUp(self):
+        """Set up a daily habit with one existing completion."""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.habit = Habit.objects.create(user=self.user, title='Daily', frequency='daily')
+        HabitCompletion.objects.create(habit=self.habit, completed_at=timezone.make_aware(datetime(2024, 1, 1, 8)))
+
+    def write_file(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w') as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_csv(self):
+        """Test importing completions from a CSV file."""
+        rows = ['habit_id,completed_at,notes']
+        rows += [f'{self.habit.pk},2024-01-{day:02d}T08:00:00,day {day}' for day in range(1, 11)]
+        rows += ['999,2024-01-01T08:00:00,', f'{self.habit.pk},not a date,']
+        out = StringIO()
+        call_command('import_completions', self.write_file('.csv', '\n'.join(rows)), batch_size=3, chunk_size=4, stdout=out)
+
+        self.assertIn('Imported 9 completions from 12 rows', out.getvalue())
+        self.assertIn('1 duplicates skipped, 2 invalid rows', out.getvalue())
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.total_completions, 10)
+        self.assertEqual(self.habit.longest_streak, 10)
+        self.assertEqual(HabitCompletion.objects.get(notes='day 5').day, date(2024, 1, 5))
+
+    def test_import_ndjson_for_user(self):
+        """Test that habits of other users are rejected when importing for a user."""
+        other = Habit.objects.create(user=User.objects.create_user(username='other'), title='Other')
+        lines = [
+            json.dumps({'habit_id': self.habit.pk, 'completed_at': '2024-02-01T08:00:00+00:00'}),
+            json.dumps({'habit_id': other.pk, 'completed_at': '2024-02-01T08:00:00+00:00'}),
+            '{"habit_id": 1, "completed_at"',
+            json.dumps({'habit_id': self.habit.pk, 'completed_at': '2024-02-02T08:00:00+00:00'}),
+        ]
+        out = StringIO()
+        call_command('import_completions', self.write_file('.ndjson', '\n'.join(lines)), user=self.user.pk, stdout=out)
+        self.assertIn('Imported 2 completions from 4 rows', out.getvalue())
+        self.assertIn('0 duplicates skipped, 2 invalid rows', out.getvalue())
+        self.assertEqual(other.completions.count(), 0)
+
+    def test_refresh_in_batches(self):
+        """Test that the derived data of many habits is refreshed batch by batch."""
+        habits = [self.habit] + [Habit.objects.create(user=self.user, title=f'Habit {n}') for n in range(4)]
+        rows = [(habit.pk, timezone.make_aware(datetime(2024, 3, 1, 8)), '') for habit in habits]
+        touched, inserted = HabitCompletion.objects.bulk_insert_rows(rows)
+        self.assertEqual(inserted, 5)
+        with CaptureQueriesContext(connection) as queries:
+            HabitCompletion.objects.refresh_derived_data(touched, batch_size=2)
+        self.assertEqual(sum('FROM "habits_habit" WHERE "habits_habit"."id" IN' in query['sql'] for query in queries), 3)
+        self.assertEqual([habit.total_completions for habit in Habit.objects.filter(pk__in=touched).order_by('pk')], [2, 1, 1, 1, 1])
+
+
+class CompletionHistoryTests(TestCase):
+    def setUp(self):
+        """Set up a daily habit with 25 completions."""
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.habit = Habit.objects.create(user=self.user, title='Daily', frequency='daily')
+        now = timezone.now()
+        for i in range(25):
+            HabitCompletion.objects.create(habit=self.habit, completed_at=now - timedelta(days=i), notes=f'entry {i}')
+
+    def test_history_is_paginated(self):
+        """Test that the detail page renders only the first page of the history."""
+        response = self.client.get(reverse('habits:habit_detail', args=[self.habit.pk]))
+        self.assertEqual(len(response.context['completions']), 20)
+        self.assertTrue(response.context['completed_this_period'])
+        self.assertContains(response, 'Load more')
+
+    def test_load_more_fragment(self):
+        """Test that following the cursor returns the remaining rows as a fragment."""
+        url = reverse('habits:habit_detail', args=[self.habit.pk])
+        first = self.client.get(url, {'page_size': 10})
+        second = self.client.get(url, {'page_size': 10, 'before': first.context['next_cursor']})
+        last = self.client.get(url, {'page_size': 10, 'before': second.context['next_cursor'], 'fragment': 1})
+
+        notes = [c.notes for page in (first, second, last) for c in page.context['completions']]
+        self.assertEqual(notes, [f'entry {i}' for i in range(25)])
+        self.assertIsNone(last.context['next_cursor'])
+        self.assertTemplateUsed(last, 'habits/_completion_rows.html')
+        self.assertTemplateNotUsed(last, 'habits/habit_detail.html')
+
+
+class VectorizedAnalyticsTests(TestCase):
+    def setUp(self):
+        """Set up habits of every frequency with irregular completions."""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.today = timezone.localdate()
+        self.habits = [
+            Habit.objects.create(user=self.user, title=frequency, frequency=frequency)
+            for frequency in ('daily', 'weekly', 'monthly')
+        ]
+        for habit in self.habits:
+            for offset in [0, 1, 2, 5, 6, 9, 16, 23, 30, 40, 70, 100]:
+                HabitCompletion.objects.create(
+                    habit=habit,
+                    completed_at=timezone.make_aware(datetime.combine(self.today - timedelta(days=offset), datetime.min.time()))
+                    + timedelta(hours=offset % 24)
+                )
+
+    def test_streaks_match_database_summary(self):
+        """Test that the vectorised streaks agree with the SQL implementation."""
+        arrays = CompletionArrays(self.habits)
+        summaries = streak_summaries(self.habits, today=self.today)
+        for habit in self.habits:
+            current, longest = arrays.streaks(habit.pk, self.today)
+            self.assertEqual(current, summaries[habit.pk]['current_streak'])
+            self.assertEqual(longest, summaries[habit.pk]['longest_streak'])
+
+    def test_success_rates_match_rollup(self):
+        """Test that the vectorised success rates agree with the daily rollup."""
+        arrays = CompletionArrays(self.habits)
+        _, expected = rollups.success_rate_series(self.user.pk, days=90, today=self.today)
+        self.assertEqual(arrays.success_rates(90, self.today).tolist(), expected)
+
+    def test_distributions(self):
+        """Test the weekday and hour distributions."""
+        arrays = CompletionArrays(self.habits)
+        self.assertEqual(arrays.weekday_distribution().sum(), 36)
+        self.assertEqual(arrays.hour_distribution()[0], 3)
+        self.assertEqual(arrays.hour_distribution(self.habits[0].pk)[16], 2)
+        weekday = self.today.weekday()
+        self.assertEqual(arrays.weekday_distribution(self.habits[0].pk)[weekday], 2)
+
+    def test_model_statistics(self):
+        """Test that habits can delegate their statistics to the analytics module."""
+        statistics = self.habits[0].get_statistics(self.today)
+        self.assertEqual(statistics['current_streak'], 3)
+        self.assertEqual(statistics['longest_streak'], 3)
+        self.assertEqual(statistics['completion_rate'], round(12 / 101 * 100, 1))
+
+    def test_rolling_mean_and_patterns(self):
+        """Test the rolling mean and the dashboard patterns."""
+        self.assertEqual(rolling_mean([0, 100, 50, 50], window=2).tolist(), [0.0, 50.0, 75.0, 50.0])
+        patterns = completion_patterns(self.user.pk, self.habits, days=30, today=self.today)
+        self.assertEqual(len(patterns['rolling_success_rates']), 30)
+        self.assertEqual(patterns['dates'][-1], self.today.strftime('%Y-%m-%d'))
+        arrays = CompletionArrays(self.habits)
+        self.assertEqual(patterns['weekday_distribution'], arrays.weekday_distribution().tolist())
+        self.assertEqual(patterns['hour_distribution'], arrays.hour_distribution().tolist())
+        self.assertEqual(patterns['rolling_success_rates'], rolling_mean(arrays.success_rates(30, self.today)).tolist())
+
+class CompletionBitmapTests(TestCase):
+    def setUp(self):
+        """Set up a daily habit with completions spanning the turn of a year."""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.habit = Habit.objects.create(user=self.user, title='Daily', frequency='daily')
+        self.days = [date(2023, 12, 30), date(2023, 12, 31), date(2024, 1, 1), date(2024, 1, 2), date(2024, 12, 31)]
+        self.completions = [
+            HabitCompletion.objects.create(
+                habit=self.habit,
+                completed_at=timezone.make_aware(datetime.combine(day, datetime.min.time())) + timedelta(hours=12)
+            )
+            for day in self.days
+        ]
+
+    def load(self):
+        """Load the bitmaps of the habit for the years in use."""
+        return load_bitmaps([self.habit.pk], [2023, 2024])
+
+    def test_completions_set_bits(self):
+        """Test that saving completions marks their days, including leap days."""
+        bitmaps = self.load()
+        for day in self.days:
+            self.assertTrue(is_completed_on(bitmaps, self.habit.pk, day))
+        self.assertFalse(is_completed_on(bitmaps, self.habit.pk, date(2024, 1, 3)))
+        self.assertEqual(HabitYearBitmap.objects.filter(habit=self.habit).count(), 2)
+
+    def test_delete_clears_bit(self):
+        """Test that a deleted completion clears its day unless another remains."""
+        HabitCompletion.objects.create(
+            habit=self.habit,
+            completed_at=timezone.make_aware(datetime(2024, 1, 2, 18))
+        )
+        self.completions[3].delete()
+        self.assertTrue(is_completed_on(self.load(), self.habit.pk, date(2024, 1, 2)))
+        HabitCompletion.objects.filter(habit=self.habit, day=date(2024, 1, 2)).delete()
+        self.assertFalse(is_completed_on(self.load(), self.habit.pk, date(2024, 1, 2)))
+
+    def test_daily_streak_crosses_years(self):
+        """Test that the bit scan follows a streak into the previous year."""
+        bitmaps = self.load()
+        self.assertEqual(daily_streak(bitmaps, self.habit.pk, date(2024, 1, 2)), 4)
+        self.assertEqual(daily_streak(bitmaps, self.habit.pk, date(2024, 1, 3)), 0)
+        self.assertEqual(daily_streak(bitmaps, self.habit.pk, date(2024, 12, 31)), 1)
+
+    def test_rebuild_matches_incremental(self):
+        """Test that rebuilding from completions gives the same bitmaps."""
+        before = self.load()
+        HabitYearBitmap.objects.all().delete()
+        self.assertEqual(rebuild_bitmaps([self.habit.pk]), 2)
+        self.assertEqual(self.load(), before)
+
+    def test_heatmap(self):
+        """Test the heatmap grid and its rendering on the detail page."""
+        weeks = heatmap([self.habit.pk], date(2024, 1, 7), days=14)
+        self.assertEqual(len(weeks), 2)
+        self.assertTrue(all(len(week) == 7 for week in weeks))
+        days = {day['date']: day for week in weeks for day in week if day}
+        self.assertEqual(len(days), 14)
+        self.assertEqual(days[date(2024, 1, 1)]['level'], 4)
+        self.assertEqual(days[date(2024, 1, 3)]['level'], 0)
+
+        client = Client()
+        client.login(username='testuser', password='testpass123')
+        response = client.get(reverse('habits:habit_detail', args=[self.habit.pk]))
+        self.assertContains(response, 'heatmap-day')
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        """Start with an empty analytics cache."""
+        cache.get_cache().clear()
+
+    def test_dataset_is_deterministic(self):
+        """Test that the same options generate the same completions."""
+        options = {'habits': 4, 'years': 1, 'density': 0.5, 'seed': 3, 'end': date(2024, 6, 30)}
+        generate_dataset(**options)
+        first = sorted(HabitCompletion.objects.values_list('habit__title', 'completed_at'))
+        User.objects.all().delete()
+        generate_dataset(**options)
+        self.assertEqual(sorted(HabitCompletion.objects.values_list('habit__title', 'completed_at')), first)
+        self.assertTrue(first)
+
+    def test_view_queries_do_not_grow_with_data(self):
+        """Test that the benchmarked views run a constant number of queries."""
+        small = run_benchmarks(generate_dataset(habits=2, years=1, seed=1)[0], repeat=1)
+        large = run_benchmarks(generate_dataset(habits=8, years=2, seed=2)[0], repeat=1)
+        for name in ('habit_list', 'habit_detail', 'analysis_dashboard', 'analysis_dashboard_cached'):
+            self.assertEqual(small[name]['queries'], large[name]['queries'], name)
+        self.assertEqual(large['get_current_streak']['queries'], 8)
+        self.assertEqual(compare(small, small), [])
+
+    def test_command_writes_json(self):
+        """Test that the command writes comparable JSON and deletes its data and only its cache entries."""
+        cache.get_cache().set('unrelated', 1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.json')
+            call_command('bench_habits', habits=2, years=1, repeat=1, only=['habit_list', 'analysis_dashboard'], output=path, stderr=StringIO())
+            with open(path, encoding='utf-8') as stream:
+                report = json.load(stream)
+            call_command('bench_habits', habits=2, years=1, repeat=1, only=['habit_list'], compare=path,
+                         threshold=100, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(list(report['benchmarks']), ['habit_list', 'analysis_dashboard'])
+        self.assertEqual(report['dataset']['habits'], 2)
+        self.assertFalse(Habit.objects.exists())
+        self.assertFalse(User.objects.exists())
+        self.assertEqual(cache.get_cache().get('unrelated'), 1)
+
+class InstrumentationTests(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        """Set up a user with habits of every frequency and some history."""
+        cache.get_cache().clear()
+        self.user = generate_dataset(habits=6, years=1, seed=4)[0]
+        self.client.force_login(self.user)
+        self.habit = Habit.objects.filter(user=self.user).first()
+
+    def test_views_stay_within_query_budgets(self):
+        """Test the declared query budgets of the read views."""
+        self.assertWithinQueryBudget(reverse('habits:habit_list'))
+        self.assertWithinQueryBudget(reverse('habits:habit_detail', args=[self.habit.pk]))
+        self.assertWithinQueryBudget(reverse('habits:analysis'))
+        self.assertWithinQueryBudget(reverse('habits:analysis') + '?days=365')
+
+    def test_server_timing_header(self):
+        """Test that the metrics are exposed in the Server-Timing header."""
+        response = self.client.get(reverse('habits:habit_list'))
+        metrics = response.request_metrics
+        self.assertIn(f'desc="{metrics.query_count} queries"', response['Server-Timing'])
+        for name in ('sql', 'view', 'template', 'total'):
+            self.assertIn(f'{name};dur=', response['Server-Timing'])
+        self.assertGreater(metrics.template_time, 0)
+        self.assertLessEqual(metrics.template_time, metrics.view_time)
+
+    @override_settings(HABITS_SLOW_REQUEST_MS=0)
+    def test_slow_requests_and_budgets(self):
+        """Test that slow requests are logged and budgets enforced in the tests."""
+        with self.assertLogs('habits.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('habits:habit_list'))
+        self.assertIn('Slow request GET /', logs.output[0])
+
+        with self.settings(HABITS_SLOW_REQUEST_MS=10 ** 6):
+            with patch.object(views.habit_list, 'query_budget', 1):
+                with self.assertRaises(QueryBudgetExceeded):
+                    self.client.get(reverse('habits:habit_list'))
+                with self.settings(HABITS_ENFORCE_QUERY_BUDGETS=False), self.assertLogs('habits.instrumentation', 'WARNING') as logs:
+                    self.assertEqual(self.client.get(reverse('habits:habit_list')).status_code, 200)
+                self.assertIn('over its budget of 1', logs.output[0])
+
+class StreamingDashboardTests(TransactionTestCase):
+    def setUp(self):
+        """Set up a user with habits and completions."""
+        cache.get_cache().clear()
+        self.user = generate_dataset(habits=4, years=1, seed=5)[0]
+
+    async def get_page(self):
+        """Request the streamed dashboard and return its chunks."""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('habits:analysis_stream') + '?days=30')
+        self.assertEqual(response.status_code, 200)
+        return [chunk.decode() async for chunk in response.streaming_content]
+
+    async def test_panels_are_streamed(self):
+        """Test that the shell comes first and every panel follows it."""
+        chunks = await self.get_page()
+        self.assertIn('id="dashboard-success_rates"', chunks[0])
+        self.assertIn('Currently Tracked Habits', chunks[0])
+        self.assertNotIn('successRateChart', chunks[0])
+        panels = [chunk for chunk in chunks if chunk.startswith('<template')]
+        self.assertEqual(len(panels), len(DASHBOARD_PANELS))
+        page = ''.join(chunks)
+        for name in DASHBOARD_PANELS:
+            self.assertIn(f'showDashboardPanel("{name}")', page)
+        self.assertIn('30-Day Success Rate', page)
+        self.assertTrue(page.rstrip().endswith('</html>'))
+
+    async def test_matches_sync_dashboard(self):
+        """Test that the streamed panels show the same data as the sync dashboard."""
+        page = ''.join(await self.get_page())
+        await sync_to_async(self.client.force_login)(self.user)
+        response = await sync_to_async(self.client.get)(reverse('habits:analysis') + '?days=30')
+        for name in ('dates', 'success_rates', 'weekday_distribution', 'hour_distribution'):
+            self.assertIn(response.context[name], page)
+        self.assertIn(f"You have been tracking habits for {response.context['longest_overall_span']} days", page)
+
+    def test_sections_run_on_request_connection_in_transaction(self):
+        """Test that the dashboard falls back to sequential sections inside a transaction."""
+        self.client.force_login(self.user)
+        with transaction.atomic():
+            Habit.objects.create(user=self.user, title='Uncommitted', frequency='daily')
+            response = self.client.get(reverse('habits:analysis_stream'))
+            with self.assertWarns(Warning):
+                page = b''.join(response).decode()
+        self.assertEqual(page.count('Uncommitted'), 3)
+
+@override_settings(HABITS_TASKS_MODE='immediate')
+class DailyRollupTests(TestCase):
+    def setUp(self):
+        """Set up a user with habits of every frequency and irregular completions."""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.today = timezone.localdate()
+        self.habits = [
+            Habit.objects.create(user=self.user, title=frequency, frequency=frequency)
+            for frequency in ('daily', 'weekly', 'monthly')
+        ]
+        for habit in self.habits:
+            for offset in [0, 1, 3, 8, 15, 16, 40, 41, 75]:
+                self.complete(habit, offset)
+
+    def complete(self, habit, offset, hour=12):
+        """Complete a habit a number of days ago."""
+        return HabitCompletion.objects.create(
+            habit=habit,
+            completed_at=timezone.make_aware(datetime.combine(self.today - timedelta(days=offset), datetime.min.time()))
+            + timedelta(hours=hour)
+        )
+
+    def assertMatchesCompletions(self, days=90):
+        """Assert that the rollup gives the same success rates as the completions."""
+        _, success_rates = rollups.success_rate_series(self.user.pk, days, self.today)
+        arrays = CompletionArrays(Habit.objects.filter(user=self.user))
+        self.assertEqual(success_rates, arrays.success_rates(days, self.today).tolist())
+
+    def test_incremental_updates(self):
+        """Test that writes keep the rollup in sync with the completions."""
+        self.assertMatchesCompletions()
+        self.complete(self.habits[1], 3, hour=18)
+        self.complete(self.habits[0], 5)
+        self.assertMatchesCompletions()
+
+        HabitCompletion.objects.filter(habit=self.habits[1], day=self.today - timedelta(days=3)).first().delete()
+        self.assertMatchesCompletions()
+        self.habits[2].completions.filter(day=self.today - timedelta(days=75)).delete()
+        self.assertMatchesCompletions()
+
+        Habit.objects.create(user=self.user, title='New', frequency='daily')
+        self.assertMatchesCompletions()
+        self.habits[0].delete()
+        self.assertMatchesCompletions()
+
+    def test_period_counts(self):
+        """Test the per-period completion counts."""
+        self.complete(self.habits[0], 0, hour=20)
+        stats = HabitPeriodStats.objects.get(habit=self.habits[0], period_start=self.today)
+        self.assertEqual(stats.completions, 2)
+        row = UserDailyStats.objects.get(user=self.user, day=self.today)
+        self.assertEqual((row.due_habits, row.completed_habits, row.daily_completed), (3, 3, 1))
+        self.assertEqual(row.success_rate, 100.0)
+
+    def test_rebuild_command(self):
+        """Test that the command repairs a damaged range and backfills everything."""
+        expected = rollups.success_rate_series(self.user.pk, 90, self.today)
+        UserDailyStats.objects.filter(day__gte=self.today - timedelta(days=10)).update(completed_habits=0)
+        start = (self.today - timedelta(days=10)).isoformat()
+        version = cache.get_data_version(self.user.pk)
+        call_command('rebuild_daily_stats', start=start, end=self.today.isoformat(), stdout=StringIO())
+        self.assertEqual(rollups.success_rate_series(self.user.pk, 90, self.today), expected)
+        self.assertGreater(cache.get_data_version(self.user.pk), version)
+
+        UserDailyStats.objects.all().delete()
+        HabitPeriodStats.objects.all().delete()
+        call_command('rebuild_daily_stats', user=self.user.pk, stdout=StringIO())
+        self.assertEqual(rollups.success_rate_series(self.user.pk, 90, self.today), expected)
+        self.assertMatchesCompletions()
+
+    def test_range_rebuild_keeps_other_periods(self):
+        """Test that rebuilding a range of days only rebuilds the periods overlapping it."""
+        daily = self.habits[0]
+        HabitPeriodStats.objects.filter(habit=daily).update(completions=5)
+        start = self.today - timedelta(days=10)
+        rollups.rebuild_daily_stats([self.user.pk], start, self.today)
+        stats = dict(HabitPeriodStats.objects.filter(habit=daily).values_list('period_start', 'completions'))
+        self.assertEqual(stats[self.today], 1)
+        self.assertEqual(stats[self.today - timedelta(days=75)], 5)
+        self.assertEqual(stats[self.today - timedelta(days=8)], 1)
+
+    def test_dashboard_reads_rollup(self):
+        """Test that the dashboard chart reads the rollup instead of the completions."""
+        cache.get_cache().clear()
+        UserDailyStats.objects.filter(user=self.user, day=self.today).update(completed_habits=1)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('habits:analysis'))
+        self.assertEqual(json.loads(response.context['success_rates'])[-1], 33.3)
+
+class AdminTests(TestCase):
+    def setUp(self):
+        """Set up a superuser and a user with habits and completions."""
+        self.admin = User.objects.create_superuser(username='admin', password='adminpass123')
+        self.client.force_login(self.admin)
+        self.user = generate_dataset(habits=5, years=1, seed=6, end=date(2024, 6, 30))[0]
+        self.habits = list(Habit.objects.filter(user=self.user).order_by('pk'))
+
+    def test_completion_changelist(self):
+        """Test that the changelist does not query per row or load all habits."""
+        url = reverse('admin:habits_habitcompletion_changelist')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'habit__user__id': self.user.pk, 'day__year': 2024, 'day__month': 6})
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(len(queries), 10)
+        self.assertNotContains(response, f'<option value="{self.habits[1].pk}">')
+        self.assertContains(response, 'admin-autocomplete')
+
+        response = self.client.get(url, {'habit__id': self.habits[0].pk})
+        self.assertEqual(response.context['cl'].result_count, self.habits[0].completions.count())
+
+    def test_estimated_count(self):
+        """Test that large unfiltered tables are estimated and filtered counts capped."""
+        from .admin import EstimatedCountPaginator
+
+        completions = HabitCompletion.objects.all()
+        self.assertEqual(EstimatedCountPaginator(completions, 100).count, completions.count())
+        with patch.object(EstimatedCountPaginator, 'exact_count_limit', 10):
+            self.assertGreaterEqual(EstimatedCountPaginator(completions, 100).count, completions.count())
+            self.assertEqual(EstimatedCountPaginator(completions.filter(habit=self.habits[0]), 100).count, 10)
+
+    def test_complete_for_date_range_action(self):
+        """Test that the action back-fills the missing periods in one batch."""
+        url = reverse('admin:habits_habit_changelist')
+        data = {'action': 'complete_for_date_range', '_selected_action': [habit.pk for habit in self.habits]}
+        response = self.client.post(url, data)
+        self.assertContains(response, 'Complete habits for a date range')
+
+        start, end = date(2024, 7, 1), date(2024, 7, 31)
+        expected = sum({'daily': 31, 'weekly': 5, 'monthly': 1}[habit.frequency] for habit in self.habits)
+        data.update({'apply': 'Complete', 'start': start.isoformat(), 'end': end.isoformat(), 'time': '07:30', 'notes': 'Back-filled'})
+        response = self.client.post(url, data, follow=True)
+        self.assertContains(response, f'Created {expected} completions.')
+        response = self.client.post(url, data, follow=True)
+        self.assertContains(response, 'Created 0 completions.')
+
+        daily = next(habit for habit in self.habits if habit.frequency == 'daily')
+        daily.refresh_from_db()
+        self.assertGreaterEqual(daily.current_streak, 31)
+        self.assertEqual(HabitCompletion.objects.filter(notes='Back-filled', day__gte=start).count(), expected)
+
+    @override_settings(HABITS_TASKS_MODE='immediate')
+    def test_bulk_delete_rebuilds_once(self):
+        """Test that deleting selected completions rebuilds each habit once instead of per row."""
+        habit = self.habits[0]
+        selected = list(habit.completions.order_by('-completed_at').values_list('pk', flat=True)[:20])
+        url = reverse('admin:habits_habitcompletion_changelist')
+        data = {'action': 'delete_selected', '_selected_action': selected, 'post': 'yes'}
+        with patch.object(tasks, 'run_task', wraps=tasks.run_task) as run_task:
+            self.client.post(url, data, follow=True)
+        self.assertFalse(HabitCompletion.objects.filter(pk__in=selected).exists())
+        self.assertEqual(sorted(call.args for call in run_task.call_args_list), [('rebuild_habit', habit.pk), ('rebuild_rollups', self.user.pk)])
+        habit.refresh_from_db()
+        self.assertEqual(habit.total_completions, habit.completions.count())
+        self.assertEqual(habit.longest_streak, habit.get_longest_streak())
+
+class ReplicaRoutingTests(TransactionTestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Configure a SQLite file as the read replica."""
+        from django.db import connections
+
+        super().setUpClass()
+        cls.replica_file = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        cls.replica_file.close()
+        replica = {**connections['default'].settings_dict, 'NAME': cls.replica_file.name}
+        cls.replica_settings = patch.dict(connections.settings, {'replica': replica})
+        cls.replica_settings.start()
+        cls.databases = {'default', 'replica'}
+
+    @classmethod
+    def tearDownClass(cls):
+        """Close the replica connection and remove its file."""
+        from django.db import connections
+
+        connections['replica'].close()
+        del connections['replica']
+        cls.replica_settings.stop()
+        cls.databases = {'default'}
+        os.remove(cls.replica_file.name)
+        super().tearDownClass()
+
+    def setUp(self):
+        """Set up a user with a habit and copy the database to the replica."""
+        cache.get_cache().clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.habit = Habit.objects.create(user=self.user, title='Synced Habit', frequency='daily')
+        call_command('sync_sqlite_replica', stdout=StringIO())
+        # Only on the primary until the next sync
+        Habit.objects.create(user=self.user, title='Unsynced Habit', frequency='daily')
+        self.client.force_login(self.user)
+
+    def test_analytics_read_from_replica(self):
+        """Test that the dashboard and the export read from the replica only."""
+        from django.db import connections
+
+        with CaptureQueriesContext(connection) as primary, CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(reverse('habits:analysis'))
+            export = b''.join(self.client.get(reverse('habits:export'))).decode()
+        self.assertContains(response, 'Synced Habit')
+        self.assertNotContains(response, 'Unsynced Habit')
+        self.assertTrue(export.startswith('habit_id'))
+        self.assertTrue(any('habits_habit' in query['sql'] for query in replica.captured_queries))
+        # Only the data version of the validators is read from the primary
+        primary_reads = [query['sql'] for query in primary.captured_queries if 'habits_' in query['sql']]
+        self.assertTrue(primary_reads)
+        self.assertTrue(all(sql.startswith('SELECT "habits_userdataversion"') for sql in primary_reads), primary_reads)
+
+        response = self.client.get(reverse('habits:habit_list'))
+        self.assertContains(response, 'Unsynced Habit')
+
+    def test_streamed_dashboard_reads_from_replica(self):
+        """Test that the streamed dashboard computes its panels on the replica."""
+        from django.db import connections
+
+        # Only on the primary, so the panels would show it if they read from there
+        HabitCompletion.objects.bulk_record([HabitCompletion(habit=self.habit, completed_at=timezone.now() - timedelta(days=5))], rebuild=False)
+        with self.assertWarns(Warning):
+            page = b''.join(self.client.get(reverse('habits:analysis_stream'))).decode()
+        self.assertEqual(page.count('Synced Habit'), 3)
+        self.assertNotIn('Unsynced Habit', page)
+        self.assertIn("[0, 0, 0, 0, 0, 0, 0], 'Completions by Weekday'", page)
+        connections.close_all()
+
+    def test_dashboard_validators_use_primary_version(self):
+        """Test that a write not yet on the replica invalidates the dashboard's ETag."""
+        url = reverse('habits:analysis')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        cache.bump_data_version(self.user.pk)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_benchmarks_count_replica_queries(self):
+        """Test that the benchmarks count the queries routed to the replica."""
+        with routed_reads(True):
+            result = measure(lambda: list(Habit.objects.all()), repeat=1)
+        self.assertEqual(result['queries'], 1)
+
+    def test_reads_stick_to_primary_after_write(self):
+        """Test that a user reads their own writes after posting a form."""
+        response = self.client.post(reverse('habits:habit_complete', args=[self.habit.pk]), {'notes': 'Done'})
+        self.assertIn('habits_primary_until', response.cookies)
+        response = self.client.get(reverse('habits:analysis'))
+        self.assertContains(response, 'Unsynced Habit')
+
+        self.client.cookies['habits_primary_until'] = '0'
+        cache.get_cache().clear()
+        response = self.client.get(reverse('habits:analysis'))
+        self.assertNotContains(response, 'Unsynced Habit')
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        """Set up a user with a habit."""
+        cache.get_cache().clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.habit = Habit.objects.create(user=self.user, title='Test Habit', frequency='daily')
+        self.client.force_login(self.user)
+        self.urls = [
+            reverse('habits:habit_list'),
+            reverse('habits:habit_detail', args=[self.habit.pk]),
+            reverse('habits:analysis'),
+        ]
+
+    def test_unchanged_pages_are_not_modified(self):
+        """Test that revalidating an unchanged page returns 304 without reading any completion."""
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('private', response['Cache-Control'])
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertFalse(any('habits_habitcompletion' in query['sql'] for query in queries.captured_queries))
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(response.status_code, 304)
+
+    def test_replayed_validators_of_missing_habit(self):
+        """Test that the validators of a deleted or foreign habit's page get a 404, not a 304."""
+        url = self.urls[1]
+        response = self.client.get(url)
+        other = User.objects.create_user(username='otheruser', password='testpass123')
+        Habit.objects.filter(pk=self.habit.pk).update(user=other)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'], HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 404)
+
+        etag = self.client.get(self.urls[0])['ETag']
+        response = self.client.get(reverse('habits:habit_detail', args=[self.habit.pk + 1]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_validators_change_with_data_and_day(self):
+        """Test that new completions and midnight invalidate the pages."""
+        url = self.urls[0]
+        etag = self.client.get(url)['ETag']
+        HabitCompletion.objects.create(habit=self.habit)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        with patch.object(views.timezone, 'localdate', return_value=tomorrow):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_pending_messages_are_rendered(self):
+        """Test that a page with flash messages gets no validators."""
+        response = self.client.post(reverse('habits:habit_complete', args=[self.habit.pk]), {'notes': ''})
+        response = self.client.get(response.url)
+        self.assertContains(response, 'Habit marked as completed!')
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertTrue(self.client.get(response.wsgi_request.path).has_header('ETag'))
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        """Set up a user with a few habits."""
+        from django.core.cache import caches
+
+        caches['template_fragments'].clear()
+        cache.get_cache().clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.habits = [
+            Habit.objects.create(user=self.user, title=f'Habit {n}', description='Old description', frequency='daily')
+            for n in range(3)
+        ]
+        self.client.force_login(self.user)
+
+    def get(self, name):
+        """Request a page and return its content."""
+        return self.client.get(reverse(name)).content.decode()
+
+    def test_only_changed_cards_are_rendered(self):
+        """Test that cards are served from the cache until their habit changes."""
+        self.get('habits:habit_list')
+        # Bypasses updated_at, so the cached cards stay valid
+        Habit.objects.filter(user=self.user).update(description='New description')
+        self.assertEqual(self.get('habits:habit_list').count('Old description'), 3)
+
+        self.habits[0].refresh_from_db()
+        self.habits[0].save()
+        HabitCompletion.objects.create(habit=self.habits[1])
+        page = self.get('habits:habit_list')
+        self.assertEqual(page.count('Old description'), 1)
+        self.assertEqual(page.count('bg-success">Completed'), 1)
+
+    def test_cards_roll_over_with_the_period(self):
+        """Test that a completed card is re-rendered when a new period begins."""
+        HabitCompletion.objects.create(habit=self.habits[0])
+        self.assertEqual(self.get('habits:habit_list').count('bg-success">Completed'), 1)
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        with patch('django.utils.timezone.localdate', return_value=tomorrow):
+            self.assertNotIn('bg-success">Completed', self.get('habits:habit_list'))
+
+    @override_settings(HABITS_TASKS_MODE='queue')
+    def test_uncompleted_card_before_rebuild(self):
+        """Test that deleting a completion re-renders the card before the counters are rebuilt."""
+        completion = HabitCompletion.objects.create(habit=self.habits[0])
+        self.assertEqual(self.get('habits:habit_list').count('bg-success">Completed'), 1)
+        completion.delete()
+        self.assertTrue(QueuedTask.objects.filter(name='rebuild_habit').exists())
+        self.assertNotIn('bg-success">Completed', self.get('habits:habit_list'))
+
+    def test_streak_rows(self):
+        """Test that the dashboard streak rows follow new completions."""
+        self.assertIn('Current Streak: 0 Daily', self.get('habits:analysis'))
+        HabitCompletion.objects.create(habit=self.habits[0])
+        self.assertIn('Current Streak: 1 Daily', self.get('habits:analysis'))
+
+
+class TaskQueueTests(TransactionTestCase):
+    def setUp(self):
+        """Set up a daily habit with a two-day streak."""
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.habit = Habit.objects.create(user=self.user, title='Test Habit', frequency='daily')
+        now = timezone.now()
+        self.completions = [HabitCompletion.objects.create(habit=self.habit, completed_at=now - timedelta(days=days)) for days in (0, 1)]
+
+    def tearDown(self):
+        tasks.wait_for_tasks()
+
+    def test_recomputation_runs_after_the_request(self):
+        """Test that a delete is answered before the pool rebuilds the counters."""
+        self.client.force_login(self.user)
+        with patch.dict(tasks.TASKS, rebuild_habit=lambda key: time.sleep(0.2) or tasks.rebuild_habit(key)):
+            started = time.monotonic()
+            self.completions[1].delete()
+            self.assertLess(time.monotonic() - started, 0.2)
+            tasks.wait_for_tasks()
+        self.habit.refresh_from_db()
+        self.assertEqual((self.habit.current_streak, self.habit.longest_streak), (1, 1))
+        self.assertFalse(QueuedTask.objects.exists())
+
+    @override_settings(HABITS_TASKS_MODE='queue')
+    def test_requests_are_coalesced_and_drained(self):
+        """Test that queued recomputations survive as one row per habit until drained."""
+        for completion in self.completions:
+            completion.completed_at -= timedelta(days=5)
+            completion.save()
+        self.assertEqual(list(QueuedTask.objects.order_by('name').values_list('name', 'key')), [('rebuild_habit', self.habit.pk), ('rebuild_rollups', self.user.pk)])
+
+        out = StringIO()
+        call_command('drain_tasks', stdout=out)
+        self.assertIn('Ran 2 tasks.', out.getvalue())
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.longest_streak, 2)
+        self.assertEqual(self.habit.active_streak, 0)
+        self.assertFalse(QueuedTask.objects.exists())
+
+    @override_settings(HABITS_TASKS_MODE='queue')
+    def test_task_queued_while_running_keeps_its_claim(self):
+        """Test that a running task queued again is not claimed twice and runs once more afterwards."""
+        tasks.wait_for_tasks()
+        runs = []
+
+        def rebuild(key):
+            tasks.enqueue('rebuild_habit', key)
+            self.assertIsNotNone(QueuedTask.objects.get(name='rebuild_habit').claimed_at)
+            self.assertFalse(tasks.run_task('rebuild_habit', key))
+            runs.append(key)
+
+        tasks.enqueue('rebuild_habit', self.habit.pk)
+        with patch.dict(tasks.TASKS, rebuild_habit=rebuild):
+            self.assertTrue(tasks.run_task('rebuild_habit', self.habit.pk))
+        self.assertEqual(runs, [self.habit.pk])
+        task = QueuedTask.objects.get(name='rebuild_habit')
+        self.assertEqual((task.claimed_at, task.rerun), (None, False))
+
+        call_command('drain_tasks', task=['rebuild_habit'], stdout=StringIO())
+        self.assertFalse(QueuedTask.objects.filter(name='rebuild_habit').exists())
+
+    @override_settings(HABITS_TASKS_MODE='queue')
+    def test_failed_tasks_stay_queued(self):
+        """Test that a failing task is kept with its error for the next drain."""
+        tasks.enqueue('rebuild_rollups', self.user.pk)
+        with patch.dict(tasks.TASKS, rebuild_rollups=lambda key: 1 / 0), self.assertLogs('habits.tasks', 'ERROR'):
+            with self.assertRaisesMessage(CommandError, '1 tasks failed'):
+                call_command('drain_tasks', stdout=StringIO())
+        task = QueuedTask.objects.get()
+        self.assertEqual(task.attempts, 1)
+        self.assertIn('ZeroDivisionError', task.last_error)
+
+        call_command('drain_tasks', stdout=StringIO())
+        self.assertFalse(QueuedTask.objects.exists())
+
+class RecomputeStatsTests(TestCase):
+    def setUp(self):
+        """Set up three users whose stored counters are out of date."""
+        self.users = generate_dataset(users=3, habits=2, years=1, seed=11)
+        self.expected = dict(Habit.objects.values_list('pk', 'longest_streak'))
+        Habit.objects.update(longest_streak=999)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.state = os.path.join(directory.name, 'state.json')
+
+    def recompute(self, *args):
+        """Run the command in this process and return its output."""
+        out = StringIO()
+        call_command('recompute_stats', '--workers', '1', '--shard-size', '1', '--state', self.state, *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_recomputes_all_shards(self):
+        """Test that every habit is recomputed and progress is reported."""
+        output = self.recompute()
+        self.assertIn('[3/3]', output)
+        self.assertIn('habits/s', output)
+        self.assertEqual(dict(Habit.objects.values_list('pk', 'longest_streak')), self.expected)
+        self.assertFalse(os.path.exists(self.state))
+
+    def test_invalidates_cached_analytics(self):
+        """Test that the command moves every user to a new data version."""
+        versions = {user.pk: cache.get_data_version(user.pk) for user in self.users}
+        self.recompute()
+        for user in self.users:
+            self.assertGreater(cache.get_data_version(user.pk), versions[user.pk])
+
+    def test_resumes_after_failure(self):
+        """Test that a rerun with --resume only recomputes the unfinished shards."""
+        from .management.commands import recompute_stats
+
+        original = recompute_stats.recompute_shard
+        def flaky(first_id, last_id, batch_size):
+            if first_id == self.users[1].pk:
+                raise RuntimeError('connection lost')
+            return original(first_id, last_id, batch_size)
+
+        with patch.object(recompute_stats, 'recompute_shard', flaky):
+            with self.assertRaisesMessage(CommandError, '1 shards failed'):
+                self.recompute()
+        self.assertEqual(Habit.objects.filter(user=self.users[1], longest_streak=999).count(), 2)
+
+        Habit.objects.filter(user=self.users[0]).update(longest_streak=999)
+        with patch.object(recompute_stats, 'recompute_shard', wraps=original) as shard:
+            output = self.recompute('--resume')
+        self.assertIn('1 of 3 shards', output)
+        shard.assert_called_once_with(self.users[1].pk, self.users[1].pk, 500)
+        self.assertEqual(Habit.objects.filter(longest_streak=999).count(), 2)
+
+
+class ReminderTests(TestCase):
+    def setUp(self):
+        """Set up users in different timezones, shortly after midnight UTC."""
+        self.now = datetime(2024, 3, 10, 3, 0, tzinfo=dt_timezone.utc)
+        evening = datetime(2024, 3, 9, 20, 0, tzinfo=dt_timezone.utc)
+        self.utc_user = User.objects.create_user(username='utc', email='utc@example.com', password='testpass123')
+        self.la_user = User.objects.create_user(username='la', password='testpass123')
+        ReminderPreference.objects.create(user=self.la_user, timezone='America/Los_Angeles')
+        muted = User.objects.create_user(username='muted', password='testpass123')
+        ReminderPreference.objects.create(user=muted, enabled=False)
+
+        for user in (self.utc_user, self.la_user, muted):
+            for frequency in ('daily', 'weekly', 'monthly'):
+                habit = Habit.objects.create(user=user, title=f'{user.username} {frequency}', frequency=frequency)
+                # Yesterday evening in UTC, but still today in Los Angeles
+                HabitCompletion.objects.create(habit=habit, completed_at=evening)
+            Habit.objects.create(user=user, title=f'{user.username} new', frequency='daily')
+
+    def digests(self, hour=None):
+        """Return the pending habit titles per username."""
+        return {digest.username: [title for _, title, _ in digest.habits] for digest in pending_digests(hour, self.now)}
+
+    def test_pending_habits_per_user_timezone(self):
+        """Test that periods are computed in each user's timezone with one query per frequency."""
+        with self.assertNumQueries(4):
+            digests = self.digests()
+        self.assertEqual(digests, {'utc': ['utc daily', 'utc new'], 'la': ['la new']})
+
+    def test_hour_selects_timezones(self):
+        """Test that --hour only reminds users in whose timezone it is that hour."""
+        self.assertEqual(list(self.digests(hour=19)), ['la'])
+        self.assertEqual(list(self.digests(hour=3)), ['utc'])
+        self.assertEqual(self.digests(hour=12), {})
+
+    def test_command_writes_file(self):
+        """Test that the file notifier appends one JSON line per digest."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'digests.ndjson')
+        out = StringIO()
+        with patch('django.utils.timezone.now', return_value=self.now):
+            call_command('send_reminders', '--file', path, stdout=out)
+        self.assertIn('Sent 2 digests for 3 pending habits', out.getvalue())
+        with open(path) as file:
+            digests = [json.loads(line) for line in file]
+        self.assertEqual(digests[0]['email'], 'utc@example.com')
+        self.assertEqual(digests[1]['timezone'], 'America/Los_Angeles')
+        self.assertEqual([habit['frequency'] for habit in digests[0]['habits']], ['daily', 'daily'])
+
+
+class SqliteProductionTests(TestCase):
+    @override_settings(HABITS_WRITE_RETRY_DELAY=0)
+    def test_locked_writes_are_retried(self):
+        """Test that lock errors are retried outside of transactions only."""
+        attempts = []
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OperationalError('database is locked')
+            return 'written'
+
+        # The test case itself runs in a transaction
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            write_with_retries(flaky)
+        self.assertEqual(len(attempts), 1)
+        with patch.object(connection, 'in_atomic_block', False):
+            self.assertEqual(write_with_retries(flaky), 'written')
+        self.assertEqual(len(attempts), 3)
+
+    def test_concurrent_writers(self):
+        """Test that parallel completion writers hit no lock errors in production mode."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'db.sqlite3')
+        env = {**os.environ, 'HABITS_SQLITE_PATH': path, 'HABITS_SQLITE_PRODUCTION': '1'}
+        manage = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py')]
+        subprocess.run([*manage, 'migrate', '-v0'], env=env, check=True)
+        output = subprocess.run(
+            [*manage, 'bench_sqlite_writes', '--writers', '8', '--completions', '10', '--fail-on-errors'],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output)
+        self.assertEqual(result['journal_mode'], 'wal')
+        self.assertEqual(result['completions'], 80)
+        self.assertEqual(result['lock_errors'], 0)
+        self.assertGreater(result['throughput'], 0)
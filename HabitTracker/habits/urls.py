@@ -15,6 +15,10 @@ urlpatterns = [
     path('<int:pk>/complete/', views.habit_complete, name='habit_complete'),
     path('<int:pk>/delete/', views.habit_delete, name='habit_delete'),
     path('<int:pk>/edit/', views.habit_edit, name='habit_edit'),
+    path('<int:pk>/export/', views.export_completions, name='habit_export'),
+    path('export/', views.export_completions, name='export'),
     path('analysis/', views.analysis_dashboard, name='analysis'),
+    path('analysis/stream/', views.analysis_dashboard_stream, name='analysis_stream'),
+    path('api/completions/bulk/', views.habit_complete_bulk, name='habit_complete_bulk'),
     path('logout/', LogoutView.as_view(next_page='habits:habit_list'), name='logout'),
 ] 
\ No newline at end of file
@@ -1,20 +1,110 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Habit, HabitCompletion
+from .models import CompletionBatch, Habit, HabitCompletion
 from .forms import HabitForm, HabitCompletionForm
+from .bitmaps import heatmap
+from .export import csv_stream, export_rows, ndjson_stream
+from .pagination import keyset_page
+from .cache import cache_stats, cached_analytics, get_data_state, get_data_version
+from .instrumentation import query_budget
+from .routers import read_from_replica, reads_from_replica, routed_reads
+from .sqlite import write_with_retries
+from .tasks import enqueue
+from .dashboard import (
+    DASHBOARD_PANELS, DEFAULT_SUCCESS_RATE_WINDOW, SUCCESS_RATE_WINDOWS, dashboard_context, dashboard_sections,
+)
+from django.conf import settings
+from django.db import IntegrityError, connection, connections, transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from asgiref.sync import sync_to_async
 from django.utils import timezone
-from datetime import timedelta
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+from datetime import datetime, timedelta
 from django.db.models import Count, Max, Min
+import asyncio
+import hashlib
 import json
+import uuid
+
+def page_state(request, pk=None):
+    """
+    Return the data version of the current user and when their data last changed.
+
+    The state is looked up once per request, see :func:`habits.cache.get_data_state`.
+    For the page of a habit it is ``None`` unless the habit exists and belongs
+    to the user, so requests for deleted or foreign habits always reach the
+    view and its 404.
+
+    Args:
+        request: The HTTP request object.
+        pk (int): The primary key of the habit the page shows (optional).
+
+    Returns:
+        tuple: The data version and the time of the last change, or ``None``.
+    """
+    if not hasattr(request, '_habits_page_state'):
+        state = get_data_state(request.user.pk)
+        if pk is not None and not Habit.objects.filter(pk=pk, user=request.user).exists():
+            state = None
+        request._habits_page_state = state
+    return request._habits_page_state
+
+def page_etag(request, pk=None, **kwargs):
+    """
+    Return the ETag of a habit page of the current user.
+
+    The tag is built from the user's data version, which changes whenever one
+    of their habits or completions does, the habit the page shows, and today's
+    date, which determines the current day, week and month, so "completed this
+    period" and the streaks roll over at midnight. The CSRF secret is included
+    so a page with an outdated form token is never reused. Pages with pending
+    flash messages get no tag, so the messages are always rendered.
+    """
+    state = page_state(request, pk)
+    if state is None or len(messages.get_messages(request)):
+        return None
+    parts = (request.user.pk, pk, state[0], timezone.localdate().isoformat(), request.META.get('CSRF_COOKIE', ''))
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+def page_last_modified(request, pk=None, **kwargs):
+    """
+    Return when a habit page of the current user last changed.
+
+    This is the last change of the user's data, but at least the start of
+    today, when the current periods began, and the user's last login.
+    """
+    state = page_state(request, pk)
+    if state is None or len(messages.get_messages(request)):
+        return None
+    today = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time()))
+    return max(filter(None, (today, state[1], request.user.last_login)))
+
+def conditional_page(view_func):
+    """
+    Answer conditional requests for a habit page with 304 Not Modified.
+
+    The validators only need the user's data version (see :func:`page_etag`
+    and :func:`page_last_modified`), so unchanged pages are answered with a
+    single query before the view runs. The responses may only be cached by the
+    user's browser and must be revalidated on every use.
+    """
+    view = condition(etag_func=page_etag, last_modified_func=page_last_modified)(view_func)
+    return cache_control(private=True, no_cache=True)(view)
 
 @login_required
+@conditional_page
+@query_budget(4)
 def habit_list(request):
     """
     Display a list of all habits for the current user.
     
     This view shows all habits that the logged-in user has created,
-    ordered by creation date (newest first).
+    ordered by creation date (newest first). Each habit is annotated with
+    whether it has been completed in its current period.
 
     Args:
         request: The HTTP request object.
@@ -22,7 +112,7 @@ def habit_list(request):
     Returns:
         HttpResponse: Rendered template with the list of habits.
     """
-    habits = Habit.objects.filter(user=request.user)
+    habits = Habit.objects.filter(user=request.user).with_completion_status()
     return render(request, 'habits/habit_list.html', {'habits': habits})
 
 @login_required
@@ -54,13 +144,21 @@ def habit_create(request):
     return render(request, 'habits/habit_form.html', {'form': form, 'title': 'Create New Habit'})
 
 @login_required
+@conditional_page
+@query_budget(8)
 def habit_detail(request, pk):
     """
     Display detailed information about a specific habit.
     
-    This view shows the habit's details and its completion history.
+    This view shows the habit's details, a heatmap of the last year built
+    from the completion bitmaps and its completion history.
     Only allows access to habits owned by the current user.
 
+    The history is paginated by keyset: the ``before`` query parameter holds
+    the cursor of the previous page and ``page_size`` the number of entries
+    per page (up to ``HABITS_HISTORY_MAX_PAGE_SIZE``). With ``fragment=1`` only
+    the next rows and the "load more" link are rendered.
+
     Args:
         request: The HTTP request object.
         pk (int): The primary key of the habit to display.
@@ -69,11 +167,28 @@ def habit_detail(request, pk):
         HttpResponse: Rendered template with the habit details and completion history.
     """
     habit = get_object_or_404(Habit, pk=pk, user=request.user)
-    completions = habit.completions.all()
-    return render(request, 'habits/habit_detail.html', {
+    page_size = request.GET.get('page_size', '')
+    page_size = min(
+        int(page_size) if page_size.isdigit() and int(page_size) > 0 else getattr(settings, 'HABITS_HISTORY_PAGE_SIZE', 20),
+        getattr(settings, 'HABITS_HISTORY_MAX_PAGE_SIZE', 100),
+    )
+    completions, next_cursor = keyset_page(habit.completions.all(), request.GET.get('before'), page_size)
+    if request.GET.get('fragment'):
+        return render(request, 'habits/_completion_rows.html', {
+            'habit': habit,
+            'completions': completions,
+            'next_cursor': next_cursor,
+            'page_size': page_size,
+        })
+    context = {
         'habit': habit,
-        'completions': completions
-    })
+        'completions': completions,
+        'next_cursor': next_cursor,
+        'page_size': page_size,
+        'completed_this_period': habit.is_completed_in_current_period(),
+        'heatmap': heatmap([habit.pk], timezone.localdate()),
+    }
+    return render(request, 'habits/habit_detail.html', context)
 
 @login_required
 def habit_complete(request, pk):
@@ -94,11 +209,9 @@ def habit_complete(request, pk):
     """
     habit = get_object_or_404(Habit, pk=pk, user=request.user)
     if request.method == 'POST':
-        form = HabitCompletionForm(request.POST)
+        form = HabitCompletionForm(request.POST, instance=HabitCompletion(habit=habit))
         if form.is_valid():
-            completion = form.save(commit=False)
-            completion.habit = habit
-            completion.save()
+            write_with_retries(HabitCompletion.objects.create, habit=habit, notes=form.cleaned_data['notes'])
             messages.success(request, 'Habit marked as completed!')
             return redirect('habits:habit_detail', pk=pk)
     else:
@@ -108,6 +221,120 @@ def habit_complete(request, pk):
         'habit': habit
     })
 
+@login_required
+@require_POST
+def habit_complete_bulk(request):
+    """
+    Record many habit completions from a single JSON request.
+
+    The request body is a JSON object with a list of ``completions``, each with
+    a ``habit_id`` and optional ``completed_at`` (ISO 8601) and ``notes``, and
+    an optional ``idempotency_key``. Ownership of all habits is checked with
+    one query and the completions are inserted with ``bulk_create`` in one
+    transaction. Completions that already exist are reported as duplicates.
+    The streak counters and rollups of the habits are rebuilt in the
+    background.
+
+    The response lists a result per item and the idempotency key of the batch.
+    Retrying a batch with the same key returns the stored response without
+    recording anything again.
+
+    Args:
+        request: The HTTP request object.
+
+    Returns:
+        JsonResponse: The per-item results, or an error for malformed requests.
+    """
+    try:
+        payload = json.loads(request.body)
+        items = payload['completions']
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({'error': 'Expected a JSON object with a list of completions.'}, status=400)
+    if not isinstance(items, list):
+        return JsonResponse({'error': 'Expected a JSON object with a list of completions.'}, status=400)
+    limit = getattr(settings, 'HABITS_BULK_COMPLETION_LIMIT', 1000)
+    if len(items) > limit:
+        return JsonResponse({'error': f'A batch may contain at most {limit} completions.'}, status=400)
+
+    key = str(payload.get('idempotency_key') or uuid.uuid4())[:64]
+    batch = CompletionBatch.objects.filter(user=request.user, idempotency_key=key).first()
+    if batch is not None:
+        response = JsonResponse(batch.response)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    results = [{'index': index} for index in range(len(items))]
+    candidates = []
+    habit_ids = set()
+    for result, item in zip(results, items):
+        item = item if isinstance(item, dict) else {}
+        try:
+            completed_at = parse_datetime(str(item.get('completed_at', ''))) if item.get('completed_at') else timezone.now()
+        except ValueError:
+            # Well formed but impossible, e.g. February 30th
+            completed_at = None
+        if not isinstance(item.get('habit_id'), int) or completed_at is None:
+            result.update(status='error', error='Each completion needs an integer habit_id and a valid completed_at.')
+            continue
+        if timezone.is_naive(completed_at):
+            completed_at = timezone.make_aware(completed_at)
+        completion = HabitCompletion(habit_id=item['habit_id'], completed_at=completed_at, notes=str(item.get('notes', '')))
+        completion.fill_period_keys()
+        candidates.append((result, completion))
+        habit_ids.add(completion.habit_id)
+
+    frequencies = dict(Habit.objects.filter(user=request.user, pk__in=habit_ids).values_list('pk', 'frequency'))
+    owned = [(result, completion) for result, completion in candidates if completion.habit_id in frequencies]
+    for result, completion in candidates:
+        if completion.habit_id not in frequencies:
+            result.update(status='error', error='Habit not found.')
+
+    # Existing rows are looked up once to report duplicates per item
+    seen = set()
+    seen_periods = set()
+    one_per_period = getattr(settings, 'HABITS_ONE_COMPLETION_PER_PERIOD', False)
+    if owned:
+        existing = HabitCompletion.objects.filter(
+            habit_id__in={completion.habit_id for _, completion in owned},
+            month__gte=min(completion.month for _, completion in owned),
+            day__lte=max(completion.day for _, completion in owned),
+        ).values_list('habit_id', 'completed_at', 'day', 'iso_week', 'month')
+        for habit_id, completed_at, day, iso_week, month in existing:
+            seen.add((habit_id, completed_at))
+            seen_periods.add((habit_id, {'daily': day, 'weekly': iso_week, 'monthly': month}[frequencies[habit_id]]))
+
+    new_completions = []
+    for result, completion in owned:
+        period = (completion.habit_id, getattr(completion, HabitCompletion.period_key(frequencies[completion.habit_id])))
+        if (completion.habit_id, completion.completed_at) in seen or (one_per_period and period in seen_periods):
+            result['status'] = 'duplicate'
+            continue
+        seen.add((completion.habit_id, completion.completed_at))
+        seen_periods.add(period)
+        result['status'] = 'created'
+        new_completions.append(completion)
+
+    body = {
+        'idempotency_key': key,
+        'created': len(new_completions),
+        'results': results,
+    }
+    def record():
+        with transaction.atomic():
+            HabitCompletion.objects.bulk_record(new_completions, rebuild=False)
+            CompletionBatch.objects.create(user=request.user, idempotency_key=key, response=body)
+
+    try:
+        write_with_retries(record)
+    except IntegrityError:
+        # A concurrent retry with the same key was processed first
+        batch = CompletionBatch.objects.get(user=request.user, idempotency_key=key)
+        response = JsonResponse(batch.response)
+        response['Idempotent-Replayed'] = 'true'
+        return response
+    HabitCompletion.objects.enqueue_derived_data({completion.habit_id for completion in new_completions})
+    return JsonResponse(body)
+
 @login_required
 def habit_delete(request, pk):
     """
@@ -155,6 +382,10 @@ def habit_edit(request, pk):
         form = HabitForm(request.POST, instance=habit)
         if form.is_valid():
             form.save()
+            if 'frequency' in form.changed_data:
+                # Streaks and rollups are counted in periods of the habit's frequency
+                enqueue('rebuild_habit', habit.pk)
+                enqueue('rebuild_rollups', habit.user_id)
             messages.success(request, 'Habit updated successfully!')
             return redirect('habits:habit_list')
     else:
@@ -165,7 +396,15 @@ def habit_edit(request, pk):
         'habit': habit
     })
 
+def dashboard_window(request):
+    """Return the success rate window selected with the ``days`` query parameter."""
+    window = request.GET.get('days', '')
+    return int(window) if window.isdigit() and int(window) in SUCCESS_RATE_WINDOWS else DEFAULT_SUCCESS_RATE_WINDOW
+
 @login_required
+@conditional_page
+@read_from_replica
+@query_budget(8)
 def analysis_dashboard(request):
     """
     Display an analysis dashboard for the user's habits.
@@ -175,7 +414,17 @@ def analysis_dashboard(request):
     - Habits grouped by periodicity (daily, weekly, monthly)
     - Longest overall tracking period
     - Individual habit tracking periods and streaks
-    - Success rate chart for the last 7 days
+    - Success rate chart for the last 7, 30, 90 or 365 days, selected with
+      the ``days`` query parameter, with a 7-day rolling average
+    - Completions per weekday and hour of the day
+    - A heatmap of the completed habits per day over the last year
+
+    The computed sections are cached per user and invalidated whenever one of
+    the user's habits or completions changes. The ``X-Analytics-Cache`` headers
+    report whether the sections were served from the cache and the overall
+    hit and miss counts. The sections are read from the replica, but the data
+    version is read from the primary first, so a lagging replica never turns
+    a changed page into a 304 Not Modified.
 
     Args:
         request: The HTTP request object.
@@ -184,87 +433,129 @@ def analysis_dashboard(request):
         HttpResponse: Rendered template with the analysis dashboard.
     """
     # Get currently tracked habits
-    current_habits = Habit.objects.filter(user=request.user)
-    
-    # Calculate success rates for the last 7 days
-    success_rates = []
-    dates = []
-    today = timezone.now().date()
-    
-    for i in range(6, -1, -1):  # Last 7 days
-        date = today - timedelta(days=i)
-        dates.append(date.strftime('%Y-%m-%d'))
-        
-        total_habits = current_habits.count()
-        if total_habits == 0:
-            success_rates.append(0)
-            continue
+    current_habits = list(Habit.objects.filter(user=request.user))
+    today = timezone.localdate()
+    window = dashboard_window(request)
 
-        successful_habits = 0
-        for habit in current_habits:
-            # Check if habit was completed on this date based on its frequency
-            if habit.frequency == 'daily':
-                if habit.completions.filter(completed_at__date=date).exists():
-                    successful_habits += 1
-            elif habit.frequency == 'weekly':
-                # Check if completed in the week containing this date
-                week_start = date - timedelta(days=date.weekday())
-                week_end = week_start + timedelta(days=6)
-                if habit.completions.filter(completed_at__date__range=[week_start, week_end]).exists():
-                    successful_habits += 1
-            elif habit.frequency == 'monthly':
-                # Check if completed in the month containing this date
-                month_start = date.replace(day=1)
-                if date.month == 12:
-                    next_month = date.replace(year=date.year + 1, month=1, day=1)
-                else:
-                    next_month = date.replace(month=date.month + 1, day=1)
-                month_end = next_month - timedelta(days=1)
-                if habit.completions.filter(completed_at__date__range=[month_start, month_end]).exists():
-                    successful_habits += 1
-
-        success_rate = (successful_habits / total_habits) * 100
-        success_rates.append(round(success_rate, 1))
-
-    # Group habits by periodicity
-    habits_by_periodicity = {}
-    for frequency in Habit.FREQUENCY_CHOICES:
-        habits = current_habits.filter(frequency=frequency[0])
-        if habits.exists():
-            habits_by_periodicity[frequency[1]] = habits
-    
-    # Calculate overall longest streak across all habits
-    longest_overall_span = 0
-    for habit in current_habits:
-        current_streak = habit.get_current_streak()
-        # Convert streak to days based on frequency
-        if habit.frequency == 'daily':
-            streak_in_days = current_streak
-        elif habit.frequency == 'weekly':
-            streak_in_days = current_streak * 7
-        elif habit.frequency == 'monthly':
-            streak_in_days = current_streak * 30  # Approximate month as 30 days
-        
-        longest_overall_span = max(longest_overall_span, streak_in_days)
-
-    # Calculate current streaks for each habit
-    habit_timespans = []
-    for habit in current_habits:
-        current_streak = habit.get_current_streak()
-        habit_timespans.append({
-            'habit': habit,
-            'timespan': current_streak,
-            'first_completion': None,
-            'last_completion': None    
-        })
+    # Each section is cached per user and data version, see habits.cache
+    version = page_state(request)[0]
+    results = {}
+    hits = []
+    for name, (compute, *parts) in dashboard_sections(request.user.pk, current_habits, window, today).items():
+        results[name], hit = cached_analytics(request.user.pk, name, compute, today, *parts, version=version)
+        hits.append(hit)
 
-    context = {
-        'current_habits': current_habits,
-        'habits_by_periodicity': habits_by_periodicity,
-        'longest_overall_span': longest_overall_span,
-        'habit_timespans': sorted(habit_timespans, key=lambda x: x['timespan'], reverse=True),
-        'success_rates': json.dumps(success_rates),
-        'dates': json.dumps(dates)
-    }
-    
-    return render(request, 'habits/analysis.html', context)
+    context = dashboard_context(results, window)
+    context['current_habits'] = current_habits
+    response = render(request, 'habits/analysis.html', context)
+    stats = cache_stats()
+    response['X-Analytics-Cache'] = 'hit' if all(hits) else 'miss'
+    response['X-Analytics-Cache-Stats'] = f"hits={stats['hits']}; misses={stats['misses']}"
+    return response
+
+@login_required
+@read_from_replica
+async def analysis_dashboard_stream(request):
+    """
+    Stream the analysis dashboard, sending each panel as soon as it is ready.
+
+    This is the async version of :func:`analysis_dashboard`, meant to be served
+    under ASGI. The page shell with placeholders and the currently tracked
+    habits is sent first. The dashboard sections are computed concurrently in
+    worker threads, each with its own database connection, and every panel is
+    streamed as a ``<template>`` that a small script moves into its
+    placeholder. The event loop is free while the sections are computed.
+
+    Inside a transaction (e.g. with ``ATOMIC_REQUESTS`` or in tests) other
+    connections cannot see the uncommitted data, so the sections then run one
+    after another on the request's connection.
+
+    Args:
+        request: The HTTP request object.
+
+    Returns:
+        StreamingHttpResponse: The progressively rendered dashboard.
+    """
+    user = await request.auser()
+    today = timezone.localdate()
+    window = dashboard_window(request)
+    current_habits = [habit async for habit in Habit.objects.filter(user=user)]
+    sections = dashboard_sections(user.pk, current_habits, window, today)
+    concurrent = not await sync_to_async(lambda: connection.in_atomic_block)()
+    version = await sync_to_async(get_data_version)(user.pk)
+    # The sections are computed after the view returns, outside read_from_replica
+    replica = reads_from_replica()
+
+    def compute(name):
+        compute, *parts = sections[name]
+        try:
+            with routed_reads(replica):
+                return cached_analytics(user.pk, name, compute, today, *parts, version=version)[0]
+        finally:
+            if concurrent:
+                connections.close_all()
+
+    async def panel(name, tasks):
+        results = {section: await tasks[section] for section in DASHBOARD_PANELS[name]}
+        html = await sync_to_async(render_to_string)(f'habits/dashboard/{name}.html', dashboard_context(results, window))
+        return name, html
+
+    async def stream():
+        tasks = {
+            name: asyncio.ensure_future(sync_to_async(compute, thread_sensitive=not concurrent)(name))
+            for name in sections
+        }
+        try:
+            marker = '<!-- dashboard panels -->'
+            shell = await sync_to_async(render_to_string)('habits/analysis_stream.html', {
+                'current_habits': current_habits,
+                'panels': DASHBOARD_PANELS,
+                'panels_marker': marker,
+            }, request)
+            head, tail = shell.split(marker)
+            yield head
+            for ready in asyncio.as_completed([panel(name, tasks) for name in DASHBOARD_PANELS]):
+                name, html = await ready
+                yield f'<template id="dashboard-{name}-content">{html}</template><script>showDashboardPanel("{name}");</script>\n'
+            yield tail
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    return StreamingHttpResponse(stream(), content_type='text/html; charset=utf-8')
+
+@login_required
+@read_from_replica
+def export_completions(request, pk=None):
+    """
+    Export the completion history as a streamed CSV or NDJSON download.
+
+    Without ``pk`` all completions of the current user are exported, otherwise
+    only those of the given habit. The ``format`` query parameter selects
+    ``csv`` (default) or ``ndjson``. Rows are streamed while they are read, so
+    the response starts immediately and memory use stays flat.
+
+    Args:
+        request: The HTTP request object.
+        pk (int): The primary key of the habit to export (optional).
+
+    Returns:
+        StreamingHttpResponse: The exported completions.
+    """
+    completions = HabitCompletion.objects.filter(habit__user=request.user)
+    filename = 'habit-completions'
+    if pk is not None:
+        habit = get_object_or_404(Habit, pk=pk, user=request.user)
+        completions = completions.filter(habit=habit)
+        filename = f'habit-{habit.pk}-completions'
+    # The rows are read while streaming, after the view has returned
+    completions = completions.using(completions.db)
+
+    if request.GET.get('format') == 'ndjson':
+        response = StreamingHttpResponse(ndjson_stream(export_rows(completions)), content_type='application/x-ndjson')
+        filename += '.ndjson'
+    else:
+        response = StreamingHttpResponse(csv_stream(export_rows(completions)), content_type='text/csv')
+        filename += '.csv'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response